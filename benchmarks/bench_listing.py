@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+Compare the old per-entry isfile/stat/getsize listing pattern with the
+scandir and readdir64 based walkers in taco.walker over synthetic share
+trees, and with Scan_Directory, whichever of them the share index uses here.
+
+usage: python benchmarks/bench_listing.py [--sizes 10000,100000,1000000] [--keep DIR]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0,os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")))
+import taco.walker
+
+FILES_PER_DIR = 1000
+DIRS_PER_DIR = 10
+
+def Build_Tree(root,entry_count):
+  #directories of FILES_PER_DIR empty files, fanned out DIRS_PER_DIR wide
+  created = 0
+  pending = [root]
+  while created < entry_count:
+    current = pending.pop(0)
+    for i in range(DIRS_PER_DIR):
+      dirname = os.path.join(current,u"dir%04d" % i)
+      os.mkdir(dirname)
+      pending.append(dirname)
+      created += 1
+    for i in range(min(FILES_PER_DIR,entry_count - created)):
+      os.close(os.open(os.path.join(current,u"file%06d.dat" % i),os.O_CREAT | os.O_WRONLY,0644))
+      created += 1
+  return created
+
+def Old_Worker_Listing(directory):
+  #the listing loop TacoFilesystemWorker used before the share index
+  dirs = []
+  files = []
+  for fileobject in os.listdir(directory):
+    joined = os.path.normpath(directory + u"/" + fileobject)
+    if os.path.isfile(joined):
+      filemod = os.stat(joined).st_mtime
+      filesize = os.path.getsize(joined)
+      files.append((fileobject,filesize,filemod))
+    elif os.path.isdir(joined):
+      dirs.append(fileobject)
+  dirs.sort()
+  files.sort()
+  return (dirs,files)
+
+def Time_Walk(root,scan_function):
+  start = time.time()
+  entries = 0
+  pending = [root]
+  while len(pending) > 0:
+    current = pending.pop()
+    (dirs,files) = scan_function(current)
+    entries += len(dirs) + len(files)
+    for dirname in dirs: pending.append(os.path.join(current,dirname))
+  return (time.time() - start,entries)
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark share directory listing')
+  parser.add_argument('--sizes', default="10000,100000,1000000",help='comma separated entry counts')
+  parser.add_argument('--keep', default="",help='build trees under this directory and keep them')
+  parser.add_argument('--rounds', default=3,type=int,help='timed rounds per walker')
+  args = parser.parse_args()
+
+  walkers = [("old worker",Old_Worker_Listing),("listdir+stat",taco.walker.Scan_Directory_Listdir)]
+  if taco.walker.scandir is not None: walkers.append(("scandir",taco.walker.Scan_Directory_Scandir))
+  else: print "scandir is not available, install the scandir package to compare it"
+  if taco.walker.libc is not None: walkers.append(("readdir64",taco.walker.Scan_Directory_Readdir))
+  walkers.append(("Scan_Directory",taco.walker.Scan_Directory))
+
+  basedir = args.keep or tempfile.mkdtemp(prefix="taco-bench-")
+  try:
+    for size in [int(x) for x in args.sizes.split(",")]:
+      root = os.path.join(unicode(basedir),u"tree%d" % size)
+      if not os.path.isdir(root):
+        os.makedirs(root)
+        start = time.time()
+        Build_Tree(root,size)
+        print "built %d entries in %.2fs" % (size,time.time() - start)
+      for (name,scan_function) in walkers:
+        results = [Time_Walk(root,scan_function) for i in range(args.rounds)]
+        best = min([elapsed for (elapsed,entries) in results])
+        print "%10d entries  %-14s best of %d: %8.3fs  %10.0f entries/s" % (size,name,args.rounds,best,results[0][1] / max(best,1e-9))
+  finally:
+    if not args.keep: shutil.rmtree(basedir)
+
+if __name__ == "__main__":
+  main()
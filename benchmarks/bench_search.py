@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+Measure build time, memory use and query latency of taco.searchindex over
+synthetic file names.
+
+usage: python benchmarks/bench_search.py [--sizes 100000,1000000] [--rounds 50]
+"""
+
+import os
+import sys
+import time
+import random
+import resource
+import argparse
+
+sys.path.insert(0,os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")))
+import taco.searchindex
+
+FILES_PER_DIR = 200
+WORDS = [u"alpha",u"bravo",u"charlie",u"delta",u"echo",u"foxtrot",u"golf",u"hotel",u"india",u"juliet",u"kilo",u"lima",u"mike",
+         u"november",u"oscar",u"papa",u"quebec",u"romeo",u"sierra",u"tango",u"uniform",u"victor",u"whiskey",u"xray",u"yankee",u"zulu",
+         u"live",u"remix",u"season",u"episode",u"final",u"draft",u"backup",u"holiday",u"concert",u"taco"]
+EXTENSIONS = [u"mp3",u"flac",u"mkv",u"avi",u"txt",u"pdf",u"jpg",u"iso",u"zip",u"doc"]
+QUERIES = [("common substring",u"ech"),("rare substring",u"zulu yankee 0042"),("prefix",u"nov*"),("short prefix",u"ta"),
+           ("multi term",u"concert live flac"),("miss",u"qqqzzz")]
+
+def Max_RSS():
+  #kilobytes on linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def Build_Names(count,rng):
+  names = []
+  for i in range(count):
+    words = rng.sample(WORDS,rng.randint(2,4))
+    names.append(u"%s.%04d.%s" % (u" ".join(words).title(),rng.randint(0,9999),rng.choice(EXTENSIONS)))
+  return names
+
+def Build_Index(names):
+  index = taco.searchindex.SearchIndex()
+  for offset in range(0,len(names),FILES_PER_DIR):
+    files = [(name,1024,0.0) for name in names[offset:offset + FILES_PER_DIR]]
+    index.set_directory(u"bench",u"/dir%06d" % (offset / FILES_PER_DIR),files)
+  return index
+
+def Percentile(values,fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1,int(len(values) * fraction))]
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the filename search index')
+  parser.add_argument('--sizes', default="100000,1000000",help='comma separated file counts')
+  parser.add_argument('--rounds', default=50,type=int,help='timed rounds per query')
+  parser.add_argument('--limit', default=500,type=int,help='result limit per query')
+  args = parser.parse_args()
+
+  rng = random.Random(1)
+  for size in [int(x) for x in args.sizes.split(",")]:
+    names = Build_Names(size,rng)
+    rss_before = Max_RSS()
+    start = time.time()
+    index = Build_Index(names)
+    elapsed = time.time() - start
+    rss_used = Max_RSS() - rss_before
+    print "%10d files  build: %7.2fs  %9.0f files/s  memory: ~%d MB (%d bytes/file, includes the name strings)" % (size,elapsed,size / max(elapsed,1e-9),rss_used / 1024,rss_used * 1024 / size)
+    print "           %d trigrams, %d tokens" % (len(index.trigrams),len(index.tokens))
+    for (label,query) in QUERIES:
+      timings = []
+      for i in range(args.rounds):
+        start = time.time()
+        results = index.search(query,args.limit)
+        timings.append((time.time() - start) * 1000)
+      print "           %-18s %-22s %4d results  p50: %8.3fms  p99: %8.3fms" % (label,'"' + query + '"',len(results),Percentile(timings,0.5),Percentile(timings,0.99))
+    del index
+    del names
+
+if __name__ == "__main__":
+  main()
@@ -1,23 +1,93 @@
 var $stage=1;
 var $failcount = 0;
-function Get_Share_Listing_Results(peer_uuid,sharedir)
+var $page = {"offset":0,"limit":500,"sort":"name","filter":""};
+var $browsing = {"uuid":"","sharedir":"/"};
+
+function Browse_Share_Dir(peer_uuid,sharedir)
+{
+  $browsing = {"uuid":peer_uuid,"sharedir":sharedir};
+  var $api_action = {"action":"browse","data":$.extend({"uuid":peer_uuid,"sharedir":sharedir},$page)};
+  $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
+    {
+      setTimeout(function() { Get_Share_Listing_Results(peer_uuid,data["sharedir"]) },100);
+    }
+  });
+}
+
+function Check_Share_Tree(buttonthis,tree_uuid,polls)
+{
+  var $api_action = {"action":"sharetreeresult","data":{"uuid":tree_uuid}};
+  $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
+  {
+    if ("done" in data && data["done"])
+    {
+      buttonthis.attr("title",commify(data["count"]) + " files queued" + (data["truncated"] ? " (folder was too big, some were left out)" : ""));
+      buttonthis.find("span").toggleClass("spinner glyphicon-refresh glyphicon-ok");
+      buttonthis.unbind("click");
+      buttonthis.toggleClass(data["truncated"] ? "btn-warning" : "btn-success");
+    }
+    else if (polls > 240)
+    {
+      buttonthis.find("span").toggleClass("spinner glyphicon-refresh glyphicon-remove"); buttonthis.unbind("click"); buttonthis.toggleClass("btn-danger");
+    }
+    else
+    {
+      setTimeout(function() { Check_Share_Tree(buttonthis,tree_uuid,polls + 1) },500);
+    }
+  }});
+}
+
+function Queue_Share_Dir(buttonthis,peer_uuid,sharedir)
+{
+  var $api_action = {"action":"downloaddir","data":{"uuid":peer_uuid,"sharedir":sharedir}};
+  $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
+  {
+    if ("result" in data) { Check_Share_Tree(buttonthis,data["result"],0); }
+    else { buttonthis.find("span").toggleClass("spinner glyphicon-refresh glyphicon-remove"); buttonthis.unbind("click"); buttonthis.toggleClass("btn-danger"); }
+  }});
+}
+
+function Update_Listing_Controls(total)
+{
+  first = Math.min($page["offset"] + 1,total);
+  last = Math.min($page["offset"] + $page["limit"],total);
+  $("#pageinfo").text(commify(first) + " - " + commify(last) + " of " + commify(total));
+  $("#pageprev").prop("disabled",$page["offset"] == 0);
+  $("#pagenext").prop("disabled",last >= total);
+  $("#listingcontrols").removeClass("hide");
+}
+
+function Get_Share_Listing_Results(peer_uuid,sharedir,revalidating)
 {
   console.log("Get_Share_Listing_Results: " + sharedir);
-  $("#sharelisting").html("");
-  $("#loaderthing").removeClass("hide");
-  if ($failcount > 200) 
+  if (revalidating)
+  {
+    //a stale copy is already on screen, only swap it out if the fresh one differs
+    if ($browsing["uuid"] != peer_uuid || $browsing["sharedir"] != sharedir) { return; }
+  }
+  else
+  {
+    $("#sharelisting").html("");
+    $("#loaderthing").removeClass("hide");
+  }
+  if ($failcount > 40) 
   {
      $("#loaderthing").addClass("hide");
      $("#timedout").fadeIn();
   }
   else
   {
-    var $api_action = {"action":"browseresult","data":{"uuid":peer_uuid,"sharedir":sharedir}};
+    var $api_action = {"action":"browseresult","data":$.extend({"uuid":peer_uuid,"sharedir":sharedir},$page)};
     $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
       {
         if ("result" in data) 
         { 
           $("#loaderthing").addClass("hide");
+          if (data["stale"] && (revalidating || 0) < 6)
+          {
+            setTimeout(function() { Get_Share_Listing_Results(peer_uuid,sharedir,(revalidating || 0) + 1) },500);
+          }
+          if ("total" in data && data["total"] >= 0) { Update_Listing_Controls(data["total"]); }
           sharelisting = [];
           if (sharedir.length > 1) 
           {
@@ -76,14 +146,10 @@ function Get_Share_Listing_Results(peer_uuid,sharedir)
                 $failcount = 0;
                 $(".shareclick").unbind("click").click(function() 
                 { 
-                  l_uuid = $(this).data("uuid");
-                  l_sharedir = atob($(this).data("sharedir"));
-                  var $api_action = {"action":"browse","data":{"uuid":$(this).data("uuid"),"sharedir":atob($(this).data("sharedir"))}};
-                  $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
-                    {
-                      Get_Share_Listing_Results(l_uuid,l_sharedir);
-                    }
-                  });
+                  $page["offset"] = 0;
+                  $page["filter"] = "";
+                  $("#listingfilter").val("");
+                  Browse_Share_Dir($(this).data("uuid"),atob($(this).data("sharedir")));
                 });
                 $(".fileaddtoq").unbind("click").click(function(event) 
                 {
@@ -104,6 +170,14 @@ function Get_Share_Listing_Results(peer_uuid,sharedir)
                   }});
   
                 });
+                $(".diraddtoq").unbind("click").click(function(event)
+                {
+                  event.stopPropagation();
+                  path=$(this).closest(".shareclick").data("sharedir");
+                  peer_uuid=$(this).closest(".shareclick").data("uuid");
+                  $(this).find("span").toggleClass("glyphicon-refresh glyphicon-plus spinner");
+                  Queue_Share_Dir($(this),peer_uuid,atob(path));
+                });
                 $(this).fadeIn();
               });
             }
@@ -117,7 +191,7 @@ function Get_Share_Listing_Results(peer_uuid,sharedir)
         else 
         { 
           $failcount++; 
-          setTimeout(function() { Get_Share_Listing_Results(peer_uuid,sharedir) },100);
+          setTimeout(function() { Get_Share_Listing_Results(peer_uuid,sharedir) },Math.min(100 * Math.pow(1.5,$failcount),1000));
         }
       }
     });
@@ -146,12 +220,10 @@ function Show_Peer_Shares(nickname,localnick,peer_uuid)
     Show_Peer_Shares(nickname,localnick,peer_uuid);
     });
   });
-  var $api_action = {"action":"browse","data":{"uuid":peer_uuid,"sharedir":"/"}};
-  $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
-    {
-      setTimeout(function() { Get_Share_Listing_Results(peer_uuid,data["sharedir"]) },100);
-    }
-  });
+  $page["offset"] = 0;
+  $page["filter"] = "";
+  $("#listingfilter").val("");
+  Browse_Share_Dir(peer_uuid,"/");
 }
 function Set_Up_Root_Peer_Names()
 {
@@ -224,5 +296,28 @@ function Set_Up_Root_Peer_Names()
 $( document ).ready(function() {
   Set_Up_Root_Peer_Names();
   Check_For_API_Errors();
-  
+  $("#pageprev").click(function()
+  {
+    $page["offset"] = Math.max(0,$page["offset"] - $page["limit"]);
+    Browse_Share_Dir($browsing["uuid"],$browsing["sharedir"]);
+  });
+  $("#pagenext").click(function()
+  {
+    $page["offset"] += $page["limit"];
+    Browse_Share_Dir($browsing["uuid"],$browsing["sharedir"]);
+  });
+  $("#listingsort").change(function()
+  {
+    $page["sort"] = $(this).val();
+    $page["offset"] = 0;
+    Browse_Share_Dir($browsing["uuid"],$browsing["sharedir"]);
+  });
+  $("#listingfilterform").submit(function(event)
+  {
+    event.preventDefault();
+    $page["filter"] = $.trim($("#listingfilter").val());
+    $page["offset"] = 0;
+    Browse_Share_Dir($browsing["uuid"],$browsing["sharedir"]);
+  });
+
 });
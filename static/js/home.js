@@ -26,6 +26,9 @@ function Update_Peer_Status()
           outdiff = data[$uuid][3];
           nick = data[$uuid][4];
           localnick = data[$uuid][5];
+          connstate = data[$uuid][6];
+          connstatediff = data[$uuid][7];
+          if (connstatediff < 10000000) { $statemsg = connstate + " for " + connstatediff.toFixed(0) + " second(s)" } else { $statemsg = connstate }
           if (indiff  < 10000000) { $inmsg = indiff.toFixed(2) + " second(s) ago" } else { $inmsg = "Never" }
           if (outdiff < 10000000) { $outmsg = outdiff.toFixed(2) + " second(s) ago" } else { $outmsg = "Never" }
           if (localnick != "") { $localnickmsg = "<br>(" + localnick + ")" } else { $localnickmsg = "" }
@@ -36,6 +39,7 @@ function Update_Peer_Status()
             if ($tr.find(".localnick").html() != $localnickmsg) { $tr.find(".localnick").html($localnickmsg); }
             if ($tr.find(".lastincoming").html() != $inmsg) { $tr.find(".lastincoming").html($inmsg); }
             if ($tr.find(".lastoutgoing").html() != $outmsg) { $tr.find(".lastoutgoing").html($outmsg); }
+            if ($tr.find(".connectionstate").html() != $statemsg) { $tr.find(".connectionstate").html($statemsg); }
           } else {
             $tr = $("#peerstatusrowhelper");
             $tr.clone().removeClass("hide").addClass("peerstatusrow").removeAttr("id").attr("id",$uuid).appendTo("#peerstatustbody");
@@ -44,6 +48,7 @@ function Update_Peer_Status()
             if ($tr.find(".localnick").html() != $localnickmsg) { $tr.find(".localnick").html($localnickmsg); }
             if ($tr.find(".lastincoming").html() != $inmsg) { $tr.find(".lastincoming").html($inmsg); }
             if ($tr.find(".lastoutgoing").html() != $outmsg) { $tr.find(".lastoutgoing").html($outmsg); }
+            if ($tr.find(".connectionstate").html() != $statemsg) { $tr.find(".connectionstate").html($statemsg); }
 
           }
           if (indiff >= 6.0) 
@@ -92,6 +97,16 @@ function Update_Thread_Status()
             if ("status" in data["threads"]["server"]) { $("#serverstatus").html(data["threads"]["server"]["status"]); }
             if ("lastupdate" in data["threads"]["server"]) { $("#serverlast").html(data["threads"]["server"]["lastupdate"].toFixed(2) + " second(s) ago"); }
           }
+          if ("writer" in data["threads"])
+          {
+            if ("alive" in data["threads"]["writer"]) { if (data["threads"]["writer"]["alive"]) { $("#writeralive").html("Running"); } else {$("#writeralive").html("Stopped");}   }
+            if ("status" in data["threads"]["writer"]) { $("#writerstatus").html(data["threads"]["writer"]["status"]); }
+            if ("lastupdate" in data["threads"]["writer"]) { $("#writerlast").html(data["threads"]["writer"]["lastupdate"].toFixed(2) + " second(s) ago"); }
+            if ("depth" in data["threads"]["writer"]) { $("#writerdepth").html(data["threads"]["writer"]["depth"]); }
+            if ("bytes" in data["threads"]["writer"]) { $("#writerbytes").html(commify(data["threads"]["writer"]["bytes"])); }
+            if ("latency" in data["threads"]["writer"]) { $("#writerlatency").html((data["threads"]["writer"]["latency"]*1000).toFixed(1) + "ms"); }
+            if ("latencymax" in data["threads"]["writer"]) { $("#writerlatencymax").html((data["threads"]["writer"]["latencymax"]*1000).toFixed(1) + "ms"); }
+          }
 
      
         }
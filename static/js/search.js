@@ -0,0 +1,119 @@
+var $search_uuid = "";
+var $search_polls = 0;
+var $search_rendered = {};
+
+function Escape_HTML(text)
+{
+  return $("<div>").text(text).html();
+}
+
+function Add_Search_Result_Handlers()
+{
+  $(".fileaddtoq").unbind("click").click(function(event)
+  {
+    event.stopPropagation();
+    filename=$(this).closest(".fileclick").data("filename");
+    path=$(this).closest(".fileclick").data("sharedir");
+    peer_uuid=$(this).closest(".fileclick").data("uuid");
+    modtime=$(this).closest(".fileclick").data("mod");
+    size=$(this).closest(".fileclick").data("size");
+    $(this).find("span").toggleClass("glyphicon-refresh glyphicon-plus spinner");
+    buttonthis = $(this);
+    var $api_action = {"action":"downloadqadd","data":{"uuid":peer_uuid,"sharedir":atob(path),"filename":atob(filename),"filesize":size,"filemodtime":modtime}};
+    $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
+    {
+      if (data == 1) { buttonthis.find("span").toggleClass("spinner glyphicon-refresh glyphicon-ok"); buttonthis.unbind("click"); buttonthis.toggleClass("btn-success"); }
+      else if (data == 2) { buttonthis.find("span").toggleClass("spinner glyphicon-refresh glyphicon-ok"); buttonthis.unbind("click"); buttonthis.toggleClass("btn-info"); }
+      else { buttonthis.find("span").toggleClass("spinner glyphicon-refresh glyphicon-remove"); buttonthis.unbind("click"); buttonthis.toggleClass("btn-danger"); }
+    }});
+  });
+  $(".searchpeerclick").unbind("click").click(function(event)
+  {
+    event.preventDefault();
+    $("#searchresults-" + $(this).data("uuid")).slideToggle(150);
+  });
+}
+
+function Get_Search_Results(search_uuid)
+{
+  if (search_uuid != $search_uuid) { return; }
+  $search_polls++;
+  var $api_action = {"action":"searchresult","data":{"uuid":search_uuid}};
+  $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
+    {
+      if (search_uuid != $search_uuid || !("peers" in data)) { return; }
+      peerlisting = [];
+      alldone = true;
+      for (var peer_uuid in data["peers"])
+      {
+        nick = data["peers"][peer_uuid][0];
+        localnick = data["peers"][peer_uuid][1];
+        done = data["peers"][peer_uuid][2];
+        results = data["peers"][peer_uuid][3];
+        if (!done) { alldone = false; }
+        thestring = '<a href="#" data-uuid="'+peer_uuid+'" class="searchpeerclick list-group-item">';
+        if (done) { thestring += '<span class="badge">'+results.length+' Results</span>'; }
+        else { thestring += '<span class="badge">Searching... '+results.length+'</span>'; }
+        thestring += '<span class="glyphicon glyphicon-user"></span> <strong>'+Escape_HTML(nick)+'</strong>';
+        if (localnick != "") { thestring += ' ('+Escape_HTML(localnick)+')'; }
+        thestring += '</a>';
+        peerlisting.push(thestring);
+
+        if ($search_rendered[peer_uuid] == results.length) { continue; }
+        $search_rendered[peer_uuid] = results.length;
+        filelisting = [];
+        for (var i = 0; i < results.length; i++)
+        {
+          thestring  = '<li data-uuid="'+peer_uuid+'" data-sharedir="'+btoa(results[i][0])+'" data-filename="'+btoa(results[i][1])+'" data-size="'+results[i][2]+'" data-mod="'+results[i][3]+'" class="fileclick list-group-item">';
+          thestring += '<span class="sharelistingbuttonblock"><div class="btn-group btn-group-xs">';
+          thestring += '<button type="button" class="btn btn-default fileaddtoq"><span class="glyphicon glyphicon-plus"></span></button>';
+          thestring += '</div></span>';
+          thestring += '<span class="glyphicon glyphicon-file"></span> <small>'+Escape_HTML(results[i][0])+'/</small><strong>'+Escape_HTML(results[i][1])+'</strong> <span style="float:right">'+commify(results[i][2])+' bytes</span>';
+          thestring += '</li>';
+          filelisting.push(thestring);
+        }
+        if ($("#searchresults-" + peer_uuid).length == 0)
+        {
+          $("#searchresults").append('<ul id="searchresults-'+peer_uuid+'" class="list-group" style="display:none"></ul>');
+        }
+        $("#searchresults-" + peer_uuid).html(filelisting.join(""));
+      }
+      $("#searchpeers").html(peerlisting.join(""));
+      Add_Search_Result_Handlers();
+      if (!alldone && $search_polls < 240) { setTimeout(function() { Get_Search_Results(search_uuid) },500); }
+    }
+  });
+}
+
+function Start_Search(query)
+{
+  var $api_action = {"action":"search","data":query};
+  $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
+    {
+      if (!("result" in data)) { return; }
+      $search_uuid = data["result"];
+      $search_polls = 0;
+      $search_rendered = {};
+      $("#nosearch").hide();
+      $("#searchpeers").html("");
+      $("#searchresults").html("");
+      $("#searchingforquery").text(data["query"]);
+      if (data["skipped"] > 0) { $("#searchskipped").text(data["skipped"] + " peers have nothing that could match"); }
+      else { $("#searchskipped").text(""); }
+      $("#searchingfor").fadeIn();
+      if (data["peers"] == 0) { if (data["skipped"] == 0) { $("#nopeers").fadeIn(); } return; }
+      $("#nopeers").hide();
+      setTimeout(function() { Get_Search_Results(data["result"]) },250);
+    }
+  });
+}
+
+$( document ).ready(function() {
+  Check_For_API_Errors();
+  $("#searchform").submit(function(event)
+  {
+    event.preventDefault();
+    query = $.trim($("#searchquery").val());
+    if (query.length > 0) { Start_Search(query); }
+  });
+});
@@ -2,6 +2,9 @@ var nick_pattern = new RegExp("^[a-zA-Z0-9\. ]{3,48}$");
 var ip_pattern = new RegExp("^(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?).(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?).(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?).(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$");
 var port_pattern = new RegExp("^0*(?:6553[0-5]|655[0-2][0-9]|65[0-4][0-9]{2}|6[0-4][0-9]{3}|[1-5][0-9]{4}|[1-9][0-9]{1,3}|[0-9])$");
 var limit_pattern = new RegExp("^[1-9][0-9]+$");
+var count_pattern = new RegExp("^[1-9][0-9]?$");
+var slots_pattern = new RegExp("^[1-9][0-9]{0,2}$");
+var syncmb_pattern = new RegExp("^[1-9][0-9]{0,3}$");
 var z85_pattern = /^[\.:\+=\^!/\*\?&<>\(\)\[\]\{\}@%\$#a-zA-Z0-9-]{40}$/;
 var uuid_pattern = /^([0-9a-f]{8}-[0-9a-f]{4}-[1-5][0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}|[a-fA-F0-9]{32})$/i;
 
@@ -225,6 +228,11 @@ function Save_Settings()
   $webport = $("input[id='setting-webport']").val();
   $down = $("input[id='setting-downlimit']").val();
   $up = $("input[id='setting-uplimit']").val();
+  $perpeer = $("input[id='setting-perpeer']").val();
+  $slots = $("input[id='setting-slots']").val();
+  $policy = $("select[id='setting-policy']").val();
+  $durability = $("select[id='setting-durability']").val();
+  $syncmb = $("input[id='setting-syncmb']").val();
   $cert = $("input[id='setting-certlocation']").val();
 
   if (!nick_pattern.test($nickname)) { $("input[id='setting-nickname']").addClass("input-error"); $("div[id='setting-nickname-alert']").removeClass("hide");  }
@@ -236,6 +244,9 @@ function Save_Settings()
   
   if (!limit_pattern.test($down)) {  $("input[id='setting-downlimit']").addClass("input-error"); $("div[id='setting-down-alert']").removeClass("hide");  }
   if (!limit_pattern.test($up)) {  $("input[id='setting-uplimit']").addClass("input-error"); $("div[id='setting-up-alert']").removeClass("hide");  }
+  if (!count_pattern.test($perpeer) || parseInt($perpeer) > 32) {  $("input[id='setting-perpeer']").addClass("input-error"); $("div[id='setting-perpeer-alert']").removeClass("hide");  }
+  if (!slots_pattern.test($slots) || parseInt($slots) > 128) {  $("input[id='setting-slots']").addClass("input-error"); $("div[id='setting-slots-alert']").removeClass("hide");  }
+  if (!syncmb_pattern.test($syncmb) || parseInt($syncmb) > 4096) {  $("input[id='setting-syncmb']").addClass("input-error"); $("div[id='setting-syncmb-alert']").removeClass("hide");  }
   
   if ($("input[id^='setting-'][class~='input-error']").length ==0)
   {
@@ -249,6 +260,11 @@ function Save_Settings()
     $api_action["data"].push(["Nickname",$nickname]);
     $api_action["data"].push(["Upload Limit",parseInt($up)]);
     $api_action["data"].push(["Download Limit",parseInt($down)]);
+    $api_action["data"].push(["Downloads Per Peer",parseInt($perpeer)]);
+    $api_action["data"].push(["Download Slots",parseInt($slots)]);
+    $api_action["data"].push(["Download Policy",$policy]);
+    $api_action["data"].push(["Download Durability",$durability]);
+    $api_action["data"].push(["Download Sync MB",parseInt($syncmb)]);
     $api_action["data"].push(["Download Location",$download_location]);
     $api_action["data"].push(["TacoNET Certificates Store",$cert]);
     $("button[id='save-settings']").prop("disabled",true);
@@ -405,7 +421,7 @@ $( document ).ready(function() {
  $("span").popover();
  $("button").popover();
 
- $("input[id^='setting-']").on("change keyup paste", function(){
+ $("input[id^='setting-'],select[id^='setting-']").on("change keyup paste", function(){
    $(this).addClass("input-changed");
    $("span[id='settings-unsaved']").removeClass("hide");
  });
@@ -1,5 +1,16 @@
 var $dontrefresh = false;
 var $helperdontrefresh = false;
+var $priority_labels = ["High","Normal","Low"];
+var $priority_classes = ["label-danger","label-default","label-info"];
+var $priority_next = [2,0,1];
+
+function Format_ETA(seconds)
+{
+  if (seconds < 0) { return ""; }
+  if (seconds < 60) { return seconds + "s left"; }
+  if (seconds < 3600) { return Math.floor(seconds / 60) + "m " + (seconds % 60) + "s left"; }
+  return Math.floor(seconds / 3600) + "h " + Math.floor((seconds % 3600) / 60) + "m left";
+}
 
 //http://stackoverflow.com/questions/1307705/jquery-ui-sortable-with-table-and-tr-width
 trhelper = function(e, tr)
@@ -102,12 +113,23 @@ function Update_Download_Q()
         for (var i = 0; i < data["result"][peer_uuid].length; i++) 
         {
           $rows_added++;
-          percent = (data["fileinfo"][peer_uuid][data["result"][peer_uuid][i][1]] * 100.00 ) / data["result"][peer_uuid][i][2];
-          table.push("<tr data-peeruuid='"+peer_uuid+"' data-filename='"+btoa(data["result"][peer_uuid][i][1])+"' data-sharedir='"+btoa(data["result"][peer_uuid][i][0])+"' data-size='"+data["result"][peer_uuid][i][2]+"' data-modtime='"+data["result"][peer_uuid][i][3]+"'>");
+          currentsize = 0;
+          progress = [0,-1];
+          if (peer_uuid in data["fileinfo"] && i in data["fileinfo"][peer_uuid])
+          {
+            currentsize = data["fileinfo"][peer_uuid][i];
+            progress = data["progress"][peer_uuid][i];
+          }
+          percent = (currentsize * 100.00 ) / data["result"][peer_uuid][i][2];
+          priority = data["priorities"][peer_uuid][i];
+          progresstext = "";
+          if (progress[0] > 0) { progresstext = "<br><small>" + (progress[0]/1024).toFixed(2) + " KB/s " + Format_ETA(progress[1]) + "</small>"; }
+          table.push("<tr data-priority='"+priority+"' data-peeruuid='"+peer_uuid+"' data-filename='"+btoa(data["result"][peer_uuid][i][1])+"' data-sharedir='"+btoa(data["result"][peer_uuid][i][0])+"' data-size='"+data["result"][peer_uuid][i][2]+"' data-modtime='"+data["result"][peer_uuid][i][3]+"'>");
           table.push("<td style='cursor: move'><big><b><span style='margin-right: 10px;' class='glyphicon glyphicon-file'></span> " + data["result"][peer_uuid][i][1] + "</b></big><br><small>"+ data["result"][peer_uuid][i][0]+"</small></td>");
-          table.push("<td class='text-right' style='cursor:move; width: 150px;vertical-align: middle;'><span class='currentfilesize'>"+commify(data["fileinfo"][peer_uuid][data["result"][peer_uuid][i][1]])+"</span> / "+commify(data["result"][peer_uuid][i][2])+"</td>");
+          table.push("<td class='text-right' style='cursor:move; width: 150px;vertical-align: middle;'><span class='currentfilesize'>"+commify(currentsize)+"</span> / "+commify(data["result"][peer_uuid][i][2])+"</td>");
           table.push("</td>");
-          table.push('<td style="cursor: move; width: 250px; vertical-align: middle;" class="text-center"><div style="margin-bottom: 0px" class="progress progress-striped"><div class="progress-bar" role="progressbar" style="width: '+percent+'%;"></div></div>'+percent.toFixed(2)+'%</td>');
+          table.push('<td style="cursor: move; width: 250px; vertical-align: middle;" class="text-center"><div style="margin-bottom: 0px" class="progress progress-striped"><div class="progress-bar" role="progressbar" style="width: '+percent+'%;"></div></div>'+percent.toFixed(2)+'%'+progresstext+'</td>');
+          table.push('<td class="text-center" style="width: 70px;vertical-align: middle;"><span style="cursor: pointer" class="label '+$priority_classes[priority]+' priorityiteminq">'+$priority_labels[priority]+'</span></td>');
           table.push('<td class="text-center" style="width: 40px;vertical-align: middle;"><span class="glyphicon glyphicon-minus-sign removeiteminq"></span></td>');
           table.push("</tr>");
           //console.log(data["result"][peer_uuid][i]);
@@ -118,6 +140,21 @@ function Update_Download_Q()
       $("#downloadqdiv").html(table.join(""));
       $(".table tbody").sortable({helper: trhelper,start:starthelper,update:updatehelper,distance: 35}).disableSelection();
       $(".table tbody span").click(function() { });
+      $(".table td span.priorityiteminq").click(function(event) {
+        event.stopPropagation();
+        row = $(this).closest("tr");
+        priority = $priority_next[row.data("priority")];
+        var $api_action = {"action":"downloadqpriority","data":{"uuid":row.data("peeruuid"),"sharedir":atob(row.data("sharedir")),"filename":atob(row.data("filename")),"filesize":row.data("size"),"filemodtime":row.data("modtime"),"priority":priority}};
+        buttonthis = $(this);
+        $.ajax({url:"/api.post",type:"POST",data:JSON.stringify($api_action),contentType:"application/json; charset=utf-8",dataType:"json",error: API_Alert,success: function(data)
+        {
+          if (data == 1)
+          {
+            buttonthis.closest("tr").data("priority",priority);
+            buttonthis.removeClass($priority_classes.join(" ")).addClass($priority_classes[priority]).text($priority_labels[priority]);
+          }
+        }});
+      });
       $(".table td span.removeiteminq").click(function(event) {
         event.stopPropagation();
         var remove_q_peer_uuid = $(this).closest("tr").data("peeruuid");
@@ -0,0 +1,49 @@
+import struct
+import hashlib
+
+HASH_PAIR = struct.Struct("<QQ")
+
+class BloomFilter(object):
+  #double hashing over md5 so every peer derives the same bit positions for a key
+  def __init__(self,bits,hashes,data=None):
+    self.bits = bits
+    self.hashes = hashes
+    if data is None: self.data = bytearray(bits / 8)
+    else:            self.data = bytearray(data)
+
+  def positions(self,key):
+    if type(key) == type(u""): key = key.encode("utf-8")
+    (h1,h2) = HASH_PAIR.unpack(hashlib.md5(key).digest())
+    return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+  def add(self,key):
+    for position in self.positions(key):
+      self.data[position >> 3] |= 1 << (position & 7)
+
+  def __contains__(self,key):
+    for position in self.positions(key):
+      if not self.data[position >> 3] & (1 << (position & 7)): return False
+    return True
+
+  def pack(self):
+    return {"bits":self.bits,"hashes":self.hashes,"filter":str(self.data)}
+
+def Build_Bloom_Filter(keys,bits_per_key,min_bits,max_bits,hashes):
+  bits = min(max(len(keys) * bits_per_key,min_bits),max_bits)
+  bits += -bits % 8
+  bloom = BloomFilter(bits,hashes)
+  for key in keys: bloom.add(key)
+  return bloom
+
+def Unpack_Bloom_Filter(datablock,max_bits):
+  #returns None for anything that does not look like a filter we could have built ourselves
+  try:
+    bits = int(datablock["bits"])
+    hashes = int(datablock["hashes"])
+    data = datablock["filter"]
+    assert bits > 0 and bits <= max_bits and bits % 8 == 0
+    assert hashes > 0 and hashes <= 16
+    assert len(data) * 8 == bits
+  except:
+    return None
+  return BloomFilter(bits,hashes,data)
@@ -6,10 +6,12 @@ from zmq.auth.thread import ThreadAuthenticator
 import taco.globals
 import taco.constants
 import taco.commands
+import taco.timers
 import os
 import Queue
 import socket
 import random
+import math
 import msgpack
 
 class TacoClients(threading.Thread):
@@ -26,25 +28,31 @@ class TacoClients(threading.Thread):
 
     self.clients = {}
 
-    self.next_rollcall = {}
-    self.client_connect_time = {}
-    self.client_reconnect_mod = {}
+    self.timers = taco.timers.TimerQueue()
+
+    self.client_failures = {}
+
+    self.client_state = {}
+    self.client_state_lock = threading.Lock()
  
     self.client_last_reply_time = {}
     self.client_last_reply_time_lock = threading.Lock()
 
     self.client_timeout = {}
 
-    self.connect_block_time = 0
+    self.rollcall_known = {}
 
     self.file_request_time = time.time()
     
   def set_client_last_reply(self,peer_uuid):
     #logging.debug("Got Reply from: " + peer_uuid)
-    self.client_reconnect_mod[peer_uuid] = taco.constants.CLIENT_RECONNECT_MIN
+    self.client_failures[peer_uuid] = 0
+    self.set_client_state(peer_uuid,taco.constants.CLIENT_STATE_UP)
     self.client_timeout[peer_uuid] = time.time() + taco.constants.ROLLCALL_TIMEOUT
     with self.client_last_reply_time_lock:
+      reachability_changed = abs(time.time() - self.client_last_reply_time.get(peer_uuid,-1)) >= taco.constants.ROLLCALL_TIMEOUT
       self.client_last_reply_time[peer_uuid] = time.time()
+    if reachability_changed: taco.commands.Invalidate_Rollcall_Cache()
 
   def get_client_last_reply(self,peer_uuid):
     with self.client_last_reply_time_lock:
@@ -52,6 +60,115 @@ class TacoClients(threading.Thread):
         return self.client_last_reply_time[peer_uuid]
     return -1
   
+  def set_client_state(self,peer_uuid,state):
+    with self.client_state_lock:
+      if peer_uuid in self.client_state and self.client_state[peer_uuid][0] == state: return
+      self.client_state[peer_uuid] = (state,time.time())
+    self.set_status("Client state for " + peer_uuid + " is now: " + state)
+
+  def get_client_state(self,peer_uuid):
+    with self.client_state_lock:
+      if peer_uuid in self.client_state:
+        return self.client_state[peer_uuid]
+    return (taco.constants.CLIENT_STATE_DISABLED,-1)
+
+  def schedule_reconnect(self,peer_uuid):
+    failures = self.client_failures.get(peer_uuid,0)
+    delay = min(taco.constants.CLIENT_RECONNECT_MAX,taco.constants.CLIENT_RECONNECT_MIN * (2 ** failures))
+    delay = random.uniform(delay * (1.0 - taco.constants.CLIENT_RECONNECT_JITTER),delay)
+    #no point counting past the failure that first reaches the cap
+    self.client_failures[peer_uuid] = min(failures + 1,int(math.ceil(math.log(float(taco.constants.CLIENT_RECONNECT_MAX) / taco.constants.CLIENT_RECONNECT_MIN,2))))
+    self.set_client_state(peer_uuid,taco.constants.CLIENT_STATE_BACKOFF)
+    self.timers.schedule(("connect",peer_uuid),time.time() + delay)
+
+  def wake_client(self,peer_uuid):
+    #the peer just talked to our server, so skip whatever is left of its backoff
+    if self.get_client_state(peer_uuid)[0] != taco.constants.CLIENT_STATE_BACKOFF: return
+    self.timers.schedule(("connect",peer_uuid),time.time())
+    self.sleep.set()
+
+  def connect_client(self,clientctx,poller,privatedir,peer_uuid):
+    if peer_uuid in self.clients: return
+    with taco.globals.settings_lock:
+      if not peer_uuid in taco.globals.settings["Peers"] or not taco.globals.settings["Peers"][peer_uuid]["enabled"]:
+        self.set_client_state(peer_uuid,taco.constants.CLIENT_STATE_DISABLED)
+        return
+      hostname  = taco.globals.settings["Peers"][peer_uuid]["hostname"]
+      port      = taco.globals.settings["Peers"][peer_uuid]["port"]
+      serverkey = taco.globals.settings["Peers"][peer_uuid]["serverkey"]
+
+    self.set_client_state(peer_uuid,taco.constants.CLIENT_STATE_RESOLVING)
+    self.set_status("Starting Client for: " + peer_uuid)
+    try:
+      ip_of_client = socket.gethostbyname(hostname)
+    except:
+      self.set_status("Starting of client failed due to bad dns lookup:" + peer_uuid)
+      self.schedule_reconnect(peer_uuid)
+      return
+
+    self.set_client_state(peer_uuid,taco.constants.CLIENT_STATE_CONNECTING)
+    self.clients[peer_uuid] = clientctx.socket(zmq.DEALER)
+    self.clients[peer_uuid].setsockopt(zmq.LINGER, 0)
+    client_public, client_secret = zmq.auth.load_certificate(os.path.normpath(os.path.abspath(privatedir + "/" + taco.constants.KEY_GENERATION_PREFIX +"-client.key_secret")))
+    self.clients[peer_uuid].curve_secretkey = client_secret
+    self.clients[peer_uuid].curve_publickey = client_public
+    self.clients[peer_uuid].curve_serverkey = str(serverkey)
+    self.clients[peer_uuid].connect("tcp://" + ip_of_client + ":" + str(port))
+    self.client_timeout[peer_uuid] = time.time() + taco.constants.ROLLCALL_TIMEOUT
+    self.timers.schedule(("rollcall",peer_uuid),time.time())
+    self.timers.schedule(("timeout",peer_uuid),self.client_timeout[peer_uuid] + taco.constants.ROLLCALL_TIMEOUT)
+
+    taco.globals.Restore_Output_Queues(peer_uuid)
+
+    poller.register(self.clients[peer_uuid],zmq.POLLIN)
+
+  def disconnect_client(self,poller,peer_uuid,error_msg):
+    self.set_status("Stopping client: " + peer_uuid + " -- " + " and ".join(error_msg),2)
+    poller.unregister(self.clients[peer_uuid])
+    self.clients[peer_uuid].close(0)
+    del self.clients[peer_uuid]
+    del self.client_timeout[peer_uuid]
+    self.timers.cancel(("rollcall",peer_uuid))
+    self.timers.cancel(("timeout",peer_uuid))
+    if peer_uuid in self.rollcall_known: del self.rollcall_known[peer_uuid]
+    taco.globals.Park_Output_Queues(peer_uuid)
+    self.schedule_reconnect(peer_uuid)
+    taco.commands.Invalidate_Rollcall_Cache()
+
+  def check_client_timeout(self,poller,peer_uuid):
+    #client_timeout is pushed back on every reply, so only re-arm here instead of on every reply
+    if not peer_uuid in self.clients: return
+    if time.time() - self.client_timeout[peer_uuid] > taco.constants.ROLLCALL_TIMEOUT:
+      self.disconnect_client(poller,peer_uuid,["havn't seen communications"])
+    else:
+      self.timers.schedule(("timeout",peer_uuid),self.client_timeout[peer_uuid] + taco.constants.ROLLCALL_TIMEOUT)
+
+  def send_rollcall(self,peer_uuid):
+    if not peer_uuid in self.clients: return
+    #self.set_status("Requesting Rollcall from: " + peer_uuid)
+    data = taco.commands.Request_Rollcall(self.get_rollcall_known(peer_uuid)[0])
+    if self.get_client_state(peer_uuid)[0] == taco.constants.CLIENT_STATE_CONNECTING: self.set_client_state(peer_uuid,taco.constants.CLIENT_STATE_HANDSHAKING)
+    self.clients[peer_uuid].send_multipart(['',data])
+    with taco.globals.upload_limiter_lock: taco.globals.upload_limiter.add(len(data))
+    self.timers.schedule(("rollcall",peer_uuid),time.time() + random.randint(taco.constants.ROLLCALL_MIN,taco.constants.ROLLCALL_MAX))
+    self.sleep.set()
+
+  def refresh_limits(self):
+    with taco.globals.settings_lock: self.max_upload_rate   = taco.globals.settings["Upload Limit"] * taco.constants.KB
+    with taco.globals.settings_lock: self.max_download_rate = taco.globals.settings["Download Limit"] * taco.constants.KB
+    self.chunk_request_rate = float(taco.constants.FILESYSTEM_CHUNK_SIZE) / float(self.max_download_rate)
+    #logging.debug(str((self.max_download_rate,taco.constants.FILESYSTEM_CHUNK_SIZE,self.chunk_request_rate)))
+    taco.globals.Purge_Parked_Output_Queues()
+    self.timers.schedule(("refresh",""),time.time() + 1)
+
+  def set_rollcall_known(self,peer_uuid,version,rollcall):
+    self.rollcall_known[peer_uuid] = (version,rollcall)
+
+  def get_rollcall_known(self,peer_uuid):
+    if peer_uuid in self.rollcall_known:
+      return self.rollcall_known[peer_uuid]
+    return (-1,[])
+
   def set_status(self,text,level=0):
     if   level==1: logging.info(text)
     elif level==0: logging.debug(text)
@@ -81,6 +198,14 @@ class TacoClients(threading.Thread):
     self.set_status("Configuring Curve to use publickey dir:" + publicdir)
     clientauth.configure_curve(domain='*', location=publicdir)
     
+    with taco.globals.settings_lock:
+      for peer_uuid in taco.globals.settings["Peers"].keys():
+        if taco.globals.settings["Peers"][peer_uuid]["enabled"]:
+          self.set_client_state(peer_uuid,taco.constants.CLIENT_STATE_BACKOFF)
+          self.timers.schedule(("connect",peer_uuid),time.time() + random.uniform(0,taco.constants.CLIENT_RECONNECT_MIN))
+
+    self.refresh_limits()
+
     poller = zmq.Poller()
     while not self.stop.is_set():
       #logging.debug("PRE")
@@ -89,43 +214,11 @@ class TacoClients(threading.Thread):
       self.sleep.clear()
       if self.stop.is_set(): break
 
-      if abs(time.time() - self.connect_block_time) > 1:
-        with taco.globals.settings_lock: self.max_upload_rate   = taco.globals.settings["Upload Limit"] * taco.constants.KB
-        with taco.globals.settings_lock: self.max_download_rate = taco.globals.settings["Download Limit"] * taco.constants.KB
-        self.chunk_request_rate = float(taco.constants.FILESYSTEM_CHUNK_SIZE) / float(self.max_download_rate)
-        #logging.debug(str((self.max_download_rate,taco.constants.FILESYSTEM_CHUNK_SIZE,self.chunk_request_rate)))
-        self.connect_block_time = time.time() 
-        with taco.globals.settings_lock:
-          for peer_uuid in taco.globals.settings["Peers"].keys():
-            if taco.globals.settings["Peers"][peer_uuid]["enabled"]:
-              #init some defaults
-              if not peer_uuid in self.client_reconnect_mod: self.client_reconnect_mod[peer_uuid] = taco.constants.CLIENT_RECONNECT_MIN
-              if not peer_uuid in self.client_connect_time:  self.client_connect_time[peer_uuid]  = time.time() + self.client_reconnect_mod[peer_uuid]
-              if not peer_uuid in self.client_timeout:       self.client_timeout[peer_uuid]       = time.time() + taco.constants.ROLLCALL_TIMEOUT
-
-              if time.time() >= self.client_connect_time[peer_uuid]:
-                if peer_uuid not in self.clients.keys():
-                  self.set_status("Starting Client for: " + peer_uuid)
-                  try:
-                    ip_of_client = socket.gethostbyname(taco.globals.settings["Peers"][peer_uuid]["hostname"])
-                  except:
-                    self.set_status("Starting of client failed due to bad dns lookup:" + peer_uuid)
-                    continue
-                  self.clients[peer_uuid] = clientctx.socket(zmq.DEALER)
-                  self.clients[peer_uuid].setsockopt(zmq.LINGER, 0)
-                  client_public, client_secret = zmq.auth.load_certificate(os.path.normpath(os.path.abspath(privatedir + "/" + taco.constants.KEY_GENERATION_PREFIX +"-client.key_secret")))
-                  self.clients[peer_uuid].curve_secretkey = client_secret
-                  self.clients[peer_uuid].curve_publickey = client_public
-                  self.clients[peer_uuid].curve_serverkey = str(taco.globals.settings["Peers"][peer_uuid]["serverkey"])
-                  self.clients[peer_uuid].connect("tcp://" + ip_of_client + ":" + str(taco.globals.settings["Peers"][peer_uuid]["port"]))
-                  self.next_rollcall[peer_uuid] = time.time()
-
-                  with taco.globals.high_priority_output_queue_lock:   taco.globals.high_priority_output_queue[peer_uuid]   = Queue.Queue()
-                  with taco.globals.medium_priority_output_queue_lock: taco.globals.medium_priority_output_queue[peer_uuid] = Queue.Queue()
-                  with taco.globals.low_priority_output_queue_lock:    taco.globals.low_priority_output_queue[peer_uuid]    = Queue.Queue()
-                  with taco.globals.file_request_output_queue_lock:    taco.globals.file_request_output_queue[peer_uuid]    = Queue.Queue()
-
-                  poller.register(self.clients[peer_uuid],zmq.POLLIN)
+      for (timer_type,peer_uuid) in self.timers.pop_expired():
+        if   timer_type == "connect":  self.connect_client(clientctx,poller,privatedir,peer_uuid)
+        elif timer_type == "rollcall": self.send_rollcall(peer_uuid)
+        elif timer_type == "timeout":  self.check_client_timeout(poller,peer_uuid)
+        elif timer_type == "refresh":  self.refresh_limits()
 
       if len(self.clients.keys()) == 0: continue
 
@@ -182,16 +275,6 @@ class TacoClients(threading.Thread):
               self.sleep.set()
               with taco.globals.upload_limiter_lock: taco.globals.upload_limiter.add(len(data))
 
-        #rollcall special case
-        if self.next_rollcall[peer_uuid] < time.time():
-          #self.set_status("Requesting Rollcall from: " + peer_uuid)
-          data = taco.commands.Request_Rollcall()
-          self.clients[peer_uuid].send_multipart(['',data])
-          with taco.globals.upload_limiter_lock: taco.globals.upload_limiter.add(len(data))
-          self.next_rollcall[peer_uuid] = time.time() + random.randint(taco.constants.ROLLCALL_MIN,taco.constants.ROLLCALL_MAX)
-          self.sleep.set()
-          #continue
-
         #RECEIVE BLOCK
         socks = dict(poller.poll(0))
         while self.clients[peer_uuid] in socks and socks[self.clients[peer_uuid]] == zmq.POLLIN:
@@ -206,29 +289,16 @@ class TacoClients(threading.Thread):
           self.sleep.set()
           socks = dict(poller.poll(0))
 
-        #cleanup block
-        self.error_msg = []
-        if self.clients[peer_uuid] in socks and socks[self.clients[peer_uuid]] == zmq.POLLERR: self.error_msg.append("got a socket error")
-        if abs(self.client_timeout[peer_uuid] - time.time()) > taco.constants.ROLLCALL_TIMEOUT: self.error_msg.append("havn't seen communications")
-
-        if len(self.error_msg) > 0:
-          self.set_status("Stopping client: " + peer_uuid + " -- " + " and ".join(self.error_msg),2)
-          poller.unregister(self.clients[peer_uuid])
-          self.clients[peer_uuid].close(0)
-          del self.clients[peer_uuid]          
-          del self.client_timeout[peer_uuid]
-          with taco.globals.high_priority_output_queue_lock:    del taco.globals.high_priority_output_queue[peer_uuid]
-          with taco.globals.medium_priority_output_queue_lock:  del taco.globals.medium_priority_output_queue[peer_uuid]
-          with taco.globals.low_priority_output_queue_lock:     del taco.globals.low_priority_output_queue[peer_uuid]
-          with taco.globals.file_request_output_queue_lock:     del taco.globals.file_request_output_queue[peer_uuid]
-          self.client_reconnect_mod[peer_uuid] = min(self.client_reconnect_mod[peer_uuid] + taco.constants.CLIENT_RECONNECT_MOD,taco.constants.CLIENT_RECONNECT_MAX)
-          self.client_connect_time[peer_uuid] = time.time() + self.client_reconnect_mod[peer_uuid]
+        #cleanup block, timeouts are handled by the timers
+        if self.clients[peer_uuid] in socks and socks[self.clients[peer_uuid]] == zmq.POLLERR:
+          self.disconnect_client(poller,peer_uuid,["got a socket error"])
           
 
         
     self.set_status("Terminating Clients")
     for peer_uuid in self.clients.keys():
       self.clients[peer_uuid].close(0)
+      taco.globals.Park_Output_Queues(peer_uuid)
     self.set_status("Stopping zmq ThreadedAuthenticator")
     clientauth.stop() 
     clientctx.term()
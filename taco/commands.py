@@ -1,6 +1,10 @@
 import taco.globals
 import taco.constants
 import taco.settings
+import taco.filesystem
+import taco.bloom
+import taco.searchindex
+import taco.downloads
 import msgpack
 import logging
 import time
@@ -35,11 +39,16 @@ def Proccess_Request(packed):
     else:
       logging.info("NET_REQUEST: " + str(unpacked))
     IDENT = unpacked[taco.constants.NET_IDENT]
-    if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_ROLLCALL:              return (IDENT,Reply_Rollcall())
+    if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_ROLLCALL:              return (IDENT,Reply_Rollcall(unpacked[taco.constants.NET_DATABLOCK]))
     if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_CERTS:                 return (IDENT,Reply_Certs(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
     if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_CHAT:                  return (IDENT,Reply_Chat(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
     if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_SHARE_LISTING:         return (IDENT,Reply_Share_Listing(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
     if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_SHARE_LISTING_RESULTS: return (IDENT,Reply_Share_Listing_Result(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
+    if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_SEARCH:                return (IDENT,Reply_Search(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
+    if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_SEARCH_RESULTS:        return (IDENT,Reply_Search_Results(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
+    if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_SEARCH_SUMMARY:        return (IDENT,Reply_Search_Summary(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
+    if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_SHARE_TREE:            return (IDENT,Reply_Share_Tree(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
+    if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_SHARE_TREE_RESULTS:    return (IDENT,Reply_Share_Tree_Results(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
     if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_GET_FILE_CHUNK:        return (IDENT,Reply_Get_File_Chunk(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
     if unpacked[taco.constants.NET_REQUEST] == taco.constants.NET_REQUEST_GIVE_FILE_CHUNK:       return (IDENT,Reply_Give_File_Chunk(IDENT,unpacked[taco.constants.NET_DATABLOCK]))
 
@@ -56,10 +65,19 @@ def Process_Reply(peer_uuid,packed):
     logging.debug("Bad Reply")
     return response
   if taco.constants.NET_REPLY in unpacked:
-    logging.info("NET_REPLY: " + str(unpacked))
+    if unpacked[taco.constants.NET_REPLY] == taco.constants.NET_REPLY_SEARCH_SUMMARY:
+      #the filter itself can be a megabyte, it has no business in the log
+      datablock = unpacked[taco.constants.NET_DATABLOCK]
+      try:
+        logging.info("NET_REPLY: search summary version " + str(datablock.get("version")) + ", " + str(len(datablock.get("filter",""))) + " byte filter")
+      except:
+        logging.info("NET_REPLY: malformed search summary")
+    else:
+      logging.info("NET_REPLY: " + str(unpacked))
     if unpacked[taco.constants.NET_REPLY] == taco.constants.NET_REPLY_ROLLCALL:       return Process_Reply_Rollcall(peer_uuid,unpacked[taco.constants.NET_DATABLOCK])
     if unpacked[taco.constants.NET_REPLY] == taco.constants.NET_REPLY_CERTS:          return Process_Reply_Certs(peer_uuid,unpacked[taco.constants.NET_DATABLOCK])
     if unpacked[taco.constants.NET_REPLY] == taco.constants.NET_REPLY_GET_FILE_CHUNK: return Process_Reply_Get_File_Chunk(peer_uuid,unpacked[taco.constants.NET_DATABLOCK])
+    if unpacked[taco.constants.NET_REPLY] == taco.constants.NET_REPLY_SEARCH_SUMMARY: return Process_Reply_Search_Summary(peer_uuid,unpacked[taco.constants.NET_DATABLOCK])
 
   return response
 
@@ -85,21 +103,64 @@ def Reply_Chat(peer_uuid,datablock):
   reply = Create_Reply(taco.constants.NET_REPLY_CHAT,{})
   return msgpack.packb(reply)
 
-def Request_Rollcall():
-  request = Create_Request(taco.constants.NET_REQUEST_ROLLCALL,"")
+def Request_Rollcall(version=-1):
+  request = Create_Request(taco.constants.NET_REQUEST_ROLLCALL,{"version":version})
   return msgpack.packb(request)
 
-def Reply_Rollcall():
+def Invalidate_Rollcall_Cache():
+  with taco.globals.rollcall_cache_lock:
+    taco.globals.rollcall_cache_expires = 0
+
+def Local_Summary_Version():
+  #-1 until the filesystem manager has opened the share index and built a summary
+  index = getattr(taco.globals.filesys,"index",None)
+  if index is None: return -1
+  return index.search_index.get_summary()[0]
+
+def Rebuild_Rollcall_Cache():
+  #caller must hold rollcall_cache_lock
   peers_i_can_talk_to = []
+  expires = time.time() + taco.constants.ROLLCALL_TIMEOUT
   with taco.globals.settings_lock:
+    nickname  = taco.globals.settings["Nickname"]
+    localuuid = taco.globals.settings["Local UUID"]
     for peer_uuid in taco.globals.settings["Peers"].keys():
-      if abs(taco.globals.clients.get_client_last_reply(peer_uuid) - time.time())  < taco.constants.ROLLCALL_TIMEOUT:
+      last_reply = taco.globals.clients.get_client_last_reply(peer_uuid)
+      if abs(last_reply - time.time()) < taco.constants.ROLLCALL_TIMEOUT:
         peers_i_can_talk_to.append(peer_uuid)
-  reply = Create_Reply(taco.constants.NET_REPLY_ROLLCALL,[taco.globals.settings["Nickname"],taco.globals.settings["Local UUID"]] + peers_i_can_talk_to)
-  return msgpack.packb(reply)
+        expires = min(expires,last_reply + taco.constants.ROLLCALL_TIMEOUT)
+  peers_i_can_talk_to.sort()
+  content = [nickname,localuuid] + peers_i_can_talk_to
+  summary = Local_Summary_Version()
+  taco.globals.rollcall_cache_expires = expires
+  if content == taco.globals.rollcall_cache_content and summary == taco.globals.rollcall_cache_summary: return
+  taco.globals.rollcall_cache_version += 1
+  taco.globals.rollcall_cache_content = content
+  taco.globals.rollcall_cache_summary = summary
+  version = taco.globals.rollcall_cache_version
+  taco.globals.rollcall_cache_legacy_reply    = msgpack.packb(Create_Reply(taco.constants.NET_REPLY_ROLLCALL,content))
+  taco.globals.rollcall_cache_reply           = msgpack.packb(Create_Reply(taco.constants.NET_REPLY_ROLLCALL,{"version":version,"rollcall":content,"summary":summary}))
+  taco.globals.rollcall_cache_unchanged_reply = msgpack.packb(Create_Reply(taco.constants.NET_REPLY_ROLLCALL,{"version":version,"summary":summary}))
+  logging.debug("Rollcall cache is now at version: " + str(version))
+
+def Reply_Rollcall(datablock=""):
+  with taco.globals.rollcall_cache_lock:
+    if time.time() >= taco.globals.rollcall_cache_expires: Rebuild_Rollcall_Cache()
+    if type(datablock) != type({}): return taco.globals.rollcall_cache_legacy_reply
+    if datablock.get("version") == taco.globals.rollcall_cache_version: return taco.globals.rollcall_cache_unchanged_reply
+    return taco.globals.rollcall_cache_reply
  
 def Process_Reply_Rollcall(peer_uuid,unpacked):
   requested_peers = []
+  if type(unpacked) == type({}):
+    if "summary" in unpacked: Check_Search_Summary(peer_uuid,unpacked["summary"])
+    if "rollcall" in unpacked:
+      taco.globals.clients.set_rollcall_known(peer_uuid,unpacked["version"],unpacked["rollcall"])
+      unpacked = unpacked["rollcall"]
+    else:
+      (version,rollcall) = taco.globals.clients.get_rollcall_known(peer_uuid)
+      if version != unpacked.get("version"): return ""
+      unpacked = rollcall
   #logging.warning(str(unpacked))
   with taco.globals.settings_lock:
     new_nickname = unpacked[0]
@@ -120,6 +181,7 @@ def Process_Reply_Rollcall(peer_uuid,unpacked):
       if taco.constants.UUID_CHECKER.match(peerid):
         if peerid not in taco.globals.settings["Peers"].keys() and peerid != taco.globals.settings["Local UUID"]:
           requested_peers.append(peerid)
+  requested_peers = taco.globals.cert_discovery.need_certs(peer_uuid,requested_peers)
   if len(requested_peers) > 0:
     return Request_Certs(requested_peers)
   return ""
@@ -142,6 +204,7 @@ def Process_Reply_Certs(peer_uuid,unpacked):
   response = ""
   logging.debug("Got some new peers to add:" + str(unpacked))
   if type(unpacked) == type({}):
+    taco.globals.cert_discovery.got_certs(peer_uuid,unpacked)
     for peerid in unpacked.keys():
       if len(unpacked[peerid]) == 6:
         (nickname,hostname,port,clientkey,serverkey,dynamic) = unpacked[peerid]
@@ -162,10 +225,14 @@ def Process_Reply_Certs(peer_uuid,unpacked):
   return response
  
 
-def Request_Share_Listing(peer_uuid,sharedir,share_listing_uuid):
+def Request_Share_Listing(peer_uuid,sharedir,share_listing_uuid,page=None,version=None):
   with taco.globals.share_listings_i_care_about_lock:
     taco.globals.share_listings_i_care_about[share_listing_uuid] = time.time()
-  request =  Create_Request(taco.constants.NET_REQUEST_SHARE_LISTING,{"sharedir":sharedir,"results_uuid":share_listing_uuid})
+  taco.globals.filesys.timers.schedule(("icareabout",share_listing_uuid),time.time() + taco.constants.FILESYSTEM_LISTING_TIMEOUT)
+  datablock = {"sharedir":sharedir,"results_uuid":share_listing_uuid}
+  if page is not None: datablock.update(page)
+  if version is not None: datablock["version"] = version
+  request =  Create_Request(taco.constants.NET_REQUEST_SHARE_LISTING,datablock)
   return msgpack.packb(request)
 
 def Reply_Share_Listing(peer_uuid,datablock):
@@ -180,13 +247,19 @@ def Reply_Share_Listing(peer_uuid,datablock):
   #logging.debug("Got a share listing request from: " + peer_uuid + " for: " + sharedir)
   with taco.globals.share_listing_requests_lock:
     if not peer_uuid in taco.globals.share_listing_requests: taco.globals.share_listing_requests[peer_uuid] = Queue.Queue()
-    taco.globals.share_listing_requests[peer_uuid].put((sharedir,shareuuid))
+    taco.globals.share_listing_requests[peer_uuid].put((sharedir,shareuuid,taco.filesystem.Listing_Page(datablock),datablock.get("version")))
     taco.globals.filesys.sleep.set()
 
   return msgpack.packb(reply)
 
-def Request_Share_Listing_Results(sharedir,results_uuid,results):
-  request =  Create_Request(taco.constants.NET_REQUEST_SHARE_LISTING_RESULTS,{"sharedir":sharedir,"results_uuid":results_uuid,"results":results}) 
+def Request_Share_Listing_Results(sharedir,results_uuid,results,page=None,version=None):
+  #results of None tells the requester the copy it has of this version is still good
+  datablock = {"sharedir":sharedir,"results_uuid":results_uuid}
+  if results is None: datablock["notmodified"] = 1
+  else:               datablock["results"] = results
+  if page is not None: datablock["page"] = page
+  if version is not None: datablock["version"] = version
+  request =  Create_Request(taco.constants.NET_REQUEST_SHARE_LISTING_RESULTS,datablock) 
   return msgpack.packb(request)
 
 def Reply_Share_Listing_Result(peer_uuid,datablock):
@@ -194,21 +267,213 @@ def Reply_Share_Listing_Result(peer_uuid,datablock):
   try:
     sharedir = datablock["sharedir"]
     shareuuid = datablock["results_uuid"]
-    results   = datablock["results"]
+    notmodified = "notmodified" in datablock
+    if not notmodified: results = datablock["results"]
     with taco.globals.share_listings_i_care_about_lock:
       assert shareuuid in taco.globals.share_listings_i_care_about
+      del taco.globals.share_listings_i_care_about[shareuuid]
   except:
     reply = Create_Reply(taco.constants.NET_REPLY_SHARE_LISTING_RESULTS,0)
     return msgpack.packb(reply)
   
   #logging.debug("Got share listing RESULTS from: " + peer_uuid + " for: " + sharedir)
-  with taco.globals.share_listings_lock:
-    taco.globals.share_listings[(peer_uuid,sharedir)] = [time.time(),results]
-  with taco.globals.share_listings_i_care_about_lock:
-    del taco.globals.share_listings_i_care_about[shareuuid]
+  page = taco.filesystem.Listing_Page(datablock.get("page"))
+  version = datablock.get("version")
+  iterkey = (peer_uuid,sharedir,taco.filesystem.Listing_Page_Key(page))
+  if notmodified:
+    if not taco.globals.share_listings.touch(iterkey,version):
+      #our copy was evicted while the request was in flight, ask again for the whole thing
+      request = Request_Share_Listing(peer_uuid,sharedir,shareuuid,page)
+      taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
+  else:
+    total = -1
+    if page is not None:
+      try:
+        total = int(datablock["page"]["total"])
+      except:
+        total = -1
+    taco.globals.share_listings.set(iterkey,results,total,version)
+
+  return msgpack.packb(reply)
+
+def Prefetch_Share_Listings(peer_uuid,sharedir,page,dirs):
+  #the first page of the directories someone is looking at is the likeliest next click
+  if page is None: return
+  subpage = dict(page,offset=0,filter=u"")
+  for dirname in dirs[:taco.constants.LISTING_PREFETCH_MAX]:
+    if type(dirname) != type(u""): dirname = dirname.decode("utf-8","replace")
+    subdir = sharedir.rstrip(u"/") + u"/" + dirname
+    iterkey = (peer_uuid,subdir,taco.filesystem.Listing_Page_Key(subpage))
+    if not taco.globals.share_listings.claim_refresh(iterkey): continue
+    request = Request_Share_Listing(peer_uuid,subdir,uuid.uuid4().hex,subpage,taco.globals.share_listings.get_version(iterkey))
+    taco.globals.Add_To_Output_Queue(peer_uuid,request,3)
+
+def Request_Share_Tree(peer_uuid,sharedir,tree_uuid,enqueue=False,depth=taco.constants.FILESYSTEM_TREE_MAX_DEPTH,limit=taco.constants.FILESYSTEM_TREE_MAX_ENTRIES):
+  #enqueue puts every file into the download queue as its batch arrives
+  with taco.globals.share_trees_lock:
+    taco.globals.share_trees[tree_uuid] = [time.time(),peer_uuid,sharedir,enqueue,0,0,[]]
+  taco.globals.filesys.timers.schedule(("sharetree",tree_uuid),time.time() + taco.constants.FILESYSTEM_TREE_TIMEOUT)
+  request = Create_Request(taco.constants.NET_REQUEST_SHARE_TREE,{"sharedir":sharedir,"results_uuid":tree_uuid,"depth":depth,"limit":limit})
+  return msgpack.packb(request)
+
+def Reply_Share_Tree(peer_uuid,datablock):
+  reply = Create_Reply(taco.constants.NET_REPLY_SHARE_TREE,1)
+  try:
+    sharedir = datablock["sharedir"]
+    tree_uuid = datablock["results_uuid"]
+    depth = min(max(0,int(datablock["depth"])),taco.constants.FILESYSTEM_TREE_MAX_DEPTH)
+    limit = min(max(1,int(datablock["limit"])),taco.constants.FILESYSTEM_TREE_MAX_ENTRIES)
+    if type(sharedir) != type(u""): sharedir = sharedir.decode("utf-8")
+  except:
+    reply[taco.constants.NET_DATABLOCK] = 0
+    return msgpack.packb(reply)
+
+  with taco.globals.share_tree_requests_lock:
+    if not peer_uuid in taco.globals.share_tree_requests: taco.globals.share_tree_requests[peer_uuid] = Queue.Queue()
+    taco.globals.share_tree_requests[peer_uuid].put((sharedir,tree_uuid,depth,limit))
+    taco.globals.filesys.sleep.set()
 
   return msgpack.packb(reply)
 
+def Request_Share_Tree_Results(tree_uuid,results,done,truncated):
+  request = Create_Request(taco.constants.NET_REQUEST_SHARE_TREE_RESULTS,{"results_uuid":tree_uuid,"results":results,"done":done,"truncated":truncated})
+  return msgpack.packb(request)
+
+def Reply_Share_Tree_Results(peer_uuid,datablock):
+  reply = Create_Reply(taco.constants.NET_REPLY_SHARE_TREE_RESULTS,1)
+  try:
+    tree_uuid = datablock["results_uuid"]
+    results   = datablock["results"]
+    done      = int(datablock["done"])
+    truncated = int(datablock["truncated"])
+    assert type(results) == type([])
+  except:
+    reply[taco.constants.NET_DATABLOCK] = 0
+    return msgpack.packb(reply)
+
+  with taco.globals.share_trees_lock:
+    if not tree_uuid in taco.globals.share_trees or taco.globals.share_trees[tree_uuid][1] != peer_uuid:
+      reply[taco.constants.NET_DATABLOCK] = 0
+      return msgpack.packb(reply)
+    tree = taco.globals.share_trees[tree_uuid]
+    room = taco.constants.FILESYSTEM_TREE_MAX_ENTRIES - len(tree[6])
+    files = []
+    for result in results[:room]:
+      try:
+        (sharedir,filename,filesize,filemod) = result
+        if type(sharedir) != type(u""): sharedir = sharedir.decode("utf-8")
+        if type(filename) != type(u""): filename = filename.decode("utf-8")
+        files.append((sharedir,filename,int(filesize),float(filemod)))
+      except:
+        continue
+    tree[6].extend(files)
+    if done: tree[4] = 1
+    if truncated: tree[5] = 1
+    enqueue = tree[3]
+    root = tree[2]
+
+  if enqueue:
+    with taco.globals.download_q_lock:
+      taco.downloads.Queue_Downloads(peer_uuid,files,root)
+
+  return msgpack.packb(reply)
+
+def Request_Search(peer_uuids,query,search_uuid):
+  with taco.globals.search_results_lock:
+    taco.globals.search_results[search_uuid] = [time.time(),query,dict([(peer_uuid,[0,[]]) for peer_uuid in peer_uuids])]
+  taco.globals.filesys.timers.schedule(("search",search_uuid),time.time() + taco.constants.SEARCH_RESULTS_TIMEOUT)
+  request = Create_Request(taco.constants.NET_REQUEST_SEARCH,{"query":query,"results_uuid":search_uuid})
+  return msgpack.packb(request)
+
+def Reply_Search(peer_uuid,datablock):
+  reply = Create_Reply(taco.constants.NET_REPLY_SEARCH,1)
+  try:
+    query = datablock["query"]
+    search_uuid = datablock["results_uuid"]
+    assert len(query) <= taco.constants.SEARCH_MAX_QUERY_LENGTH
+  except:
+    reply[taco.constants.NET_DATABLOCK] = 0
+    return msgpack.packb(reply)
+
+  with taco.globals.search_requests_lock:
+    if not peer_uuid in taco.globals.search_requests: taco.globals.search_requests[peer_uuid] = Queue.Queue()
+    taco.globals.search_requests[peer_uuid].put((query,search_uuid))
+    taco.globals.filesys.sleep.set()
+
+  return msgpack.packb(reply)
+
+def Request_Search_Results(search_uuid,results,done):
+  request = Create_Request(taco.constants.NET_REQUEST_SEARCH_RESULTS,{"results_uuid":search_uuid,"results":results,"done":done})
+  return msgpack.packb(request)
+
+def Reply_Search_Results(peer_uuid,datablock):
+  reply = Create_Reply(taco.constants.NET_REPLY_SEARCH_RESULTS,1)
+  try:
+    search_uuid = datablock["results_uuid"]
+    results     = datablock["results"]
+    done        = int(datablock["done"])
+    assert type(results) == type([])
+  except:
+    reply[taco.constants.NET_DATABLOCK] = 0
+    return msgpack.packb(reply)
+
+  with taco.globals.search_results_lock:
+    if not search_uuid in taco.globals.search_results or not peer_uuid in taco.globals.search_results[search_uuid][2]:
+      reply[taco.constants.NET_DATABLOCK] = 0
+      return msgpack.packb(reply)
+    peer_results = taco.globals.search_results[search_uuid][2][peer_uuid]
+    room = taco.constants.SEARCH_MAX_RESULTS - len(peer_results[1])
+    peer_results[1].extend([result for result in results[:room] if type(result) == type([]) and len(result) == 4])
+    if done: peer_results[0] = 1
+
+  return msgpack.packb(reply)
+
+def Check_Search_Summary(peer_uuid,summary_version):
+  #summaries are only fetched when a peer advertises a version we have not got and are not already waiting on
+  if summary_version < 0: return
+  with taco.globals.peer_summaries_lock:
+    if peer_uuid in taco.globals.peer_summaries and taco.globals.peer_summaries[peer_uuid][0] == summary_version: return
+    if peer_uuid in taco.globals.peer_summaries_requested:
+      (requested_version,requested_time) = taco.globals.peer_summaries_requested[peer_uuid]
+      if requested_version == summary_version and abs(time.time() - requested_time) < taco.constants.SEARCH_SUMMARY_REQUEST_TIMEOUT: return
+    taco.globals.peer_summaries_requested[peer_uuid] = (summary_version,time.time())
+  logging.debug("Requesting search summary version " + str(summary_version) + " from: " + peer_uuid)
+  taco.globals.Add_To_Output_Queue(peer_uuid,Request_Search_Summary(),3)
+
+def Request_Search_Summary():
+  request = Create_Request(taco.constants.NET_REQUEST_SEARCH_SUMMARY,{})
+  return msgpack.packb(request)
+
+def Reply_Search_Summary(peer_uuid,datablock):
+  index = getattr(taco.globals.filesys,"index",None)
+  (version,summary) = (-1,None)
+  if index is not None: (version,summary) = index.search_index.get_summary()
+  if summary is None:
+    reply = Create_Reply(taco.constants.NET_REPLY_SEARCH_SUMMARY,{})
+  else:
+    reply = Create_Reply(taco.constants.NET_REPLY_SEARCH_SUMMARY,dict(summary.pack(),version=version))
+  return msgpack.packb(reply)
+
+def Process_Reply_Search_Summary(peer_uuid,datablock):
+  with taco.globals.peer_summaries_lock:
+    if peer_uuid in taco.globals.peer_summaries_requested: del taco.globals.peer_summaries_requested[peer_uuid]
+  try:
+    version = int(datablock["version"])
+  except:
+    return ""
+  summary = taco.bloom.Unpack_Bloom_Filter(datablock,taco.constants.SEARCH_SUMMARY_MAX_BITS)
+  if summary is None: return ""
+  with taco.globals.peer_summaries_lock:
+    taco.globals.peer_summaries[peer_uuid] = (version,summary)
+  return ""
+
+def Peer_Might_Have(peer_uuid,query):
+  #peers without a summary always get asked
+  with taco.globals.peer_summaries_lock:
+    if not peer_uuid in taco.globals.peer_summaries: return True
+    summary = taco.globals.peer_summaries[peer_uuid][1]
+  return taco.searchindex.Might_Match(summary,query)
+
 def Request_Get_File_Chunk(sharedir,filename,offset,chunk_uuid):
   request = Create_Request(taco.constants.NET_REQUEST_GET_FILE_CHUNK,{"sharedir":sharedir,"filename":filename,"offset":offset,"chunk_uuid":chunk_uuid})
   return msgpack.packb(request)
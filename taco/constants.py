@@ -33,27 +33,110 @@ KEY_GENERATION_PREFIX = "taconet" #needs to be changed later
 
 LOOP_TOKEN_COUNT = 250
 
-CLIENT_RECONNECT_MIN = 0
-CLIENT_RECONNECT_MOD = 2
-CLIENT_RECONNECT_MAX = 16
+CLIENT_RECONNECT_MIN = 1
+CLIENT_RECONNECT_MAX = 120
+CLIENT_RECONNECT_JITTER = 0.5
+
+CLIENT_STATE_DISABLED    = "disabled"
+CLIENT_STATE_RESOLVING   = "resolving"
+CLIENT_STATE_CONNECTING  = "connecting"
+CLIENT_STATE_HANDSHAKING = "handshaking"
+CLIENT_STATE_UP          = "up"
+CLIENT_STATE_BACKOFF     = "backing-off"
 
 FILESYSTEM_CACHE_TIMEOUT = 120
 FILESYSTEM_LISTING_TIMEOUT = 300
-FILESYSTEM_CACHE_PURGE = 30
+FILESYSTEM_LISTING_PAGE_SIZE = 500
+FILESYSTEM_LISTING_PAGE_MAX = 2000
+FILESYSTEM_LISTING_SORTS = ["name","-name","size","-size","mtime","-mtime"]
+FILESYSTEM_TREE_MAX_DEPTH = 32
+FILESYSTEM_TREE_MAX_ENTRIES = 20000
+FILESYSTEM_TREE_BATCH = 500
+FILESYSTEM_TREE_TIMEOUT = 600
+
+LISTING_CACHE_MAX_BYTES = MB * 32
+LISTING_CACHE_MAX_ENTRIES = 4096
+LISTING_CACHE_MAX_AGE = 3600
+LISTING_CACHE_PENDING_TIMEOUT = 30
+LISTING_CACHE_PURGE = 60
+LISTING_PREFETCH_MAX = 8
+
 FILESYSTEM_WORKER_COUNT = 4
 FILESYSTEM_RESULTS_SIZE = 16
 FILESYSTEM_CHUNK_SIZE = KB * 128
 FILESYSTEM_CREDIT_MAX = 35
 FILESYSTEM_WORKINPROGRESS_SUFFIX = u".filepart"
+FILESYSTEM_WRITE_QUEUE_SIZE = 256
+FILESYSTEM_WRITE_COALESCE = MB * 4
+FILESYSTEM_WRITE_LATENCY_SMOOTHING = 0.2
+FILESYSTEM_READ_AHEAD = MB * 1
+FILESYSTEM_READ_SEQUENTIAL_AFTER = 2
+FILESYSTEM_READ_STREAMS_MAX = 256
+#read ahead buffers across every stream, the least recently used ones give theirs up first
+FILESYSTEM_READ_AHEAD_BUDGET = MB * 32
+FILESYSTEM_INDEX_FILENAME = "shareindex.sqlite"
+FILESYSTEM_INDEX_REFRESH = 60
+FILESYSTEM_INDEX_FULL_RESCAN = 3600
+FILESYSTEM_WATCH_SETTLE = 1
+FILESYSTEM_WATCH_RETRY = 600
+
+OUTPUT_QUEUE_PARK_TTL = 60
+OUTPUT_QUEUE_PARK_MAX_BYTES = MB * 16
+OUTPUT_QUEUE_PARK_DROP_ORDER = [3,4,2,1]
 
 DOWNLOAD_Q_CHECK_TIME = 2
 DOWNLOAD_Q_WAIT_FOR_ACK = 30
 DOWNLOAD_Q_WAIT_FOR_DATA = 300
+DOWNLOAD_PER_PEER_DEFAULT = 4
+DOWNLOAD_PER_PEER_MAX = 32
+DOWNLOAD_SLOTS_DEFAULT = 8
+DOWNLOAD_SLOTS_MAX = 128
+DOWNLOAD_POLICIES = ["fifo","smallest","fair"]
+DOWNLOAD_POLICY_DEFAULT = "fifo"
+DOWNLOAD_PRIORITY_HIGH = 0
+DOWNLOAD_PRIORITY_NORMAL = 1
+DOWNLOAD_PRIORITY_LOW = 2
+#how far past the end of the .filepart chunks may be fetched while earlier ones are still on their way
+DOWNLOAD_REORDER_WINDOW = MB * 16
+DOWNLOAD_SWARM_MIN_SIZE = MB * 4
+DOWNLOAD_SWARM_SEARCH_INTERVAL = 300
+DOWNLOAD_SWARM_CHUNK_TIMEOUT = 60
+
+DOWNLOAD_JOURNAL_FILENAME = "downloads.journal"
+DOWNLOAD_JOURNAL_SYNC = 5
+DOWNLOAD_JOURNAL_COMPACT_MIN = 1000
+COMPLETED_Q_MAX = 1000
+DOWNLOAD_PROGRESS_INTERVAL = 1
+DOWNLOAD_RATE_SMOOTHING = 0.3
+DOWNLOAD_DURABILITY = ["flush","interval","completion"]
+DOWNLOAD_DURABILITY_DEFAULT = "completion"
+DOWNLOAD_SYNC_MB_DEFAULT = 64
+DOWNLOAD_SYNC_MB_MAX = 4096
 
 ROLLCALL_MIN = 2 
 ROLLCALL_MAX = 5
 ROLLCALL_TIMEOUT = ROLLCALL_MAX * 2
 
+DISCOVERY_PENDING_TTL = 30
+DISCOVERY_NEGATIVE_TTL = 300
+DISCOVERY_BATCH_MAX = 64
+
+SEARCH_MAX_QUERY_LENGTH = 128
+SEARCH_MAX_TERMS = 8
+SEARCH_MAX_RESULTS = 500
+SEARCH_RESULTS_BATCH = 100
+SEARCH_RESULTS_TIMEOUT = 600
+#roughly 320 bytes per indexed file on 64 bit python 2 (see benchmarks/bench_search.py), so about 1GB at the cap
+SEARCH_INDEX_MAX_FILES = 3000000
+SEARCH_INDEX_COMPACT_MIN = 10000
+SEARCH_INDEX_MAX_INTERSECT = 4
+SEARCH_SUMMARY_BITS_PER_KEY = 10
+SEARCH_SUMMARY_HASHES = 7
+SEARCH_SUMMARY_MIN_BITS = 8 * KB
+SEARCH_SUMMARY_MAX_BITS = 8 * MB
+SEARCH_SUMMARY_REBUILD = 60
+SEARCH_SUMMARY_REQUEST_TIMEOUT = 30
+
 NET_GARBAGE = "G"
 NET_IDENT = "I"
 
@@ -76,6 +159,21 @@ NET_REPLY_SHARE_LISTING   = "D"
 NET_REQUEST_SHARE_LISTING_RESULTS = "e"
 NET_REPLY_SHARE_LISTING_RESULTS   = "E"
 
+NET_REQUEST_SEARCH = "f"
+NET_REPLY_SEARCH   = "F"
+
+NET_REQUEST_SEARCH_RESULTS = "h"
+NET_REPLY_SEARCH_RESULTS   = "H"
+
+NET_REQUEST_SEARCH_SUMMARY = "j"
+NET_REPLY_SEARCH_SUMMARY   = "J"
+
+NET_REQUEST_SHARE_TREE = "k"
+NET_REPLY_SHARE_TREE   = "K"
+
+NET_REQUEST_SHARE_TREE_RESULTS = "l"
+NET_REPLY_SHARE_TREE_RESULTS   = "L"
+
 NET_REQUEST_GET_FILE_CHUNK  = "x"
 NET_REPLY_GET_FILE_CHUNK    = "X"
 
@@ -10,6 +10,11 @@ default_settings_kv["Web Port"] = 5340
 default_settings_kv["Web IP"] = "127.0.0.1"
 default_settings_kv["Download Limit"] = 50
 default_settings_kv["Upload Limit"] = 50
+default_settings_kv["Downloads Per Peer"] = taco.constants.DOWNLOAD_PER_PEER_DEFAULT
+default_settings_kv["Download Slots"] = taco.constants.DOWNLOAD_SLOTS_DEFAULT
+default_settings_kv["Download Policy"] = taco.constants.DOWNLOAD_POLICY_DEFAULT
+default_settings_kv["Download Durability"] = taco.constants.DOWNLOAD_DURABILITY_DEFAULT
+default_settings_kv["Download Sync MB"] = taco.constants.DOWNLOAD_SYNC_MB_DEFAULT
 default_settings_kv["Local UUID"] = unicode(uuid.uuid4().hex)
 default_settings_kv["TacoNET Certificates Store"] = "certstore/"
 
@@ -0,0 +1,68 @@
+import threading
+import time
+import uuid
+from collections import deque
+import taco.constants
+
+class CertDiscovery(object):
+  def __init__(self):
+    self.lock = threading.Lock()
+    #peer_uuid -> (asked_uuid,deadline,batch_uuid)
+    self.pending = {}
+    #asked_uuid -> deque of (batch_uuid,set of peer uuids,deadline), oldest request first
+    self.batches = {}
+    self.negative = {}
+    self.last_purge = time.time()
+
+  def purge(self):
+    #caller must hold self.lock
+    current_time = time.time()
+    if abs(current_time - self.last_purge) < taco.constants.DISCOVERY_PENDING_TTL: return
+    self.last_purge = current_time
+    for peer_uuid in self.pending.keys():
+      if self.pending[peer_uuid][1] <= current_time: del self.pending[peer_uuid]
+    for asked_uuid in self.batches.keys():
+      while len(self.batches[asked_uuid]) > 0 and self.batches[asked_uuid][0][2] <= current_time: self.batches[asked_uuid].popleft()
+      if len(self.batches[asked_uuid]) == 0: del self.batches[asked_uuid]
+    for keyname in self.negative.keys():
+      if self.negative[keyname] <= current_time: del self.negative[keyname]
+
+  def need_certs(self,asked_uuid,unknown_uuids):
+    #returns the subset of unknown_uuids that should be asked of asked_uuid right now
+    requested_peers = []
+    current_time = time.time()
+    batch_uuid = uuid.uuid4().hex
+    deadline = current_time + taco.constants.DISCOVERY_PENDING_TTL
+    with self.lock:
+      self.purge()
+      for peer_uuid in unknown_uuids:
+        if len(requested_peers) >= taco.constants.DISCOVERY_BATCH_MAX: break
+        if peer_uuid in self.pending and self.pending[peer_uuid][1] > current_time: continue
+        if (asked_uuid,peer_uuid) in self.negative and self.negative[(asked_uuid,peer_uuid)] > current_time: continue
+        self.pending[peer_uuid] = (asked_uuid,deadline,batch_uuid)
+        requested_peers.append(peer_uuid)
+      if len(requested_peers) > 0: self.batches.setdefault(asked_uuid,deque()).append((batch_uuid,set(requested_peers),deadline))
+    return requested_peers
+
+  def got_certs(self,asked_uuid,found_uuids):
+    #a reply answers the oldest request to asked_uuid that could have produced it, only what that request asked for
+    #and did not come back is cached as a negative answer, later requests still in flight are left alone
+    current_time = time.time()
+    with self.lock:
+      batches = self.batches.get(asked_uuid,deque())
+      answered = None
+      for batch in batches:
+        if set(found_uuids) <= batch[1]:
+          answered = batch
+          break
+      if answered is None:
+        for peer_uuid in found_uuids:
+          if peer_uuid in self.pending and self.pending[peer_uuid][0] == asked_uuid: del self.pending[peer_uuid]
+        return
+      batches.remove(answered)
+      if len(batches) == 0 and asked_uuid in self.batches: del self.batches[asked_uuid]
+      (batch_uuid,asked_peers,deadline) = answered
+      for peer_uuid in asked_peers:
+        if peer_uuid not in found_uuids:
+          self.negative[(asked_uuid,peer_uuid)] = current_time + taco.constants.DISCOVERY_NEGATIVE_TTL
+        if peer_uuid in self.pending and self.pending[peer_uuid][2] == batch_uuid: del self.pending[peer_uuid]
@@ -0,0 +1,161 @@
+import math
+import random
+
+SKIPLIST_LEVELS = 24
+
+class SkipNode(object):
+  __slots__ = ("key","next","width")
+
+  def __init__(self,key,levels):
+    self.key = key
+    self.next = [None] * levels
+    self.width = [1] * levels
+
+class IndexedSkiplist(object):
+  #sorted, unique keys with O(log n) insert, remove and lookup by position
+  #every link remembers how many entries it skips, a link off the end counts as reaching one past the last entry
+  def __init__(self):
+    self.head = SkipNode(None,SKIPLIST_LEVELS)
+    self.size = 0
+
+  def __len__(self):
+    return self.size
+
+  def __iter__(self):
+    node = self.head.next[0]
+    while node is not None:
+      yield node.key
+      node = node.next[0]
+
+  def __getitem__(self,index):
+    if index < 0: index += self.size
+    if index < 0 or index >= self.size: raise IndexError(index)
+    node = self.head
+    index += 1
+    for level in reversed(range(SKIPLIST_LEVELS)):
+      while node.width[level] <= index:
+        index -= node.width[level]
+        node = node.next[level]
+    return node.key
+
+  def insert(self,key):
+    chain = [None] * SKIPLIST_LEVELS
+    steps_at_level = [0] * SKIPLIST_LEVELS
+    node = self.head
+    for level in reversed(range(SKIPLIST_LEVELS)):
+      while node.next[level] is not None and node.next[level].key <= key:
+        steps_at_level[level] += node.width[level]
+        node = node.next[level]
+      chain[level] = node
+    levels = min(SKIPLIST_LEVELS,1 - int(math.log(1.0 - random.random(),2.0)))
+    newnode = SkipNode(key,levels)
+    steps = 0
+    for level in range(levels):
+      prevnode = chain[level]
+      newnode.next[level] = prevnode.next[level]
+      prevnode.next[level] = newnode
+      newnode.width[level] = prevnode.width[level] - steps
+      prevnode.width[level] = steps + 1
+      steps += steps_at_level[level]
+    for level in range(levels,SKIPLIST_LEVELS):
+      chain[level].width[level] += 1
+    self.size += 1
+
+  def remove(self,key):
+    chain = [None] * SKIPLIST_LEVELS
+    node = self.head
+    for level in reversed(range(SKIPLIST_LEVELS)):
+      while node.next[level] is not None and node.next[level].key < key:
+        node = node.next[level]
+      chain[level] = node
+    target = chain[0].next[0]
+    if target is None or target.key != key: raise KeyError(key)
+    for level in range(len(target.next)):
+      prevnode = chain[level]
+      prevnode.width[level] += target.width[level] - 1
+      prevnode.next[level] = target.next[level]
+    for level in range(len(target.next),SKIPLIST_LEVELS):
+      chain[level].width[level] -= 1
+    self.size -= 1
+
+class PeerQueue(object):
+  #one peer's download queue, in the order the user sees it
+  #entries maps fileinfo -> [priority,sequence] so nothing ever scans the queue to find a file, and the
+  #per priority orderings let the scheduler read off the best few files without looking at the rest
+  def __init__(self):
+    self.entries = {}
+    #fileinfo -> folder under the download location, only for files queued as part of a folder
+    self.subdirs = {}
+    self.order = IndexedSkiplist()
+    self.by_sequence = {}
+    self.by_size = {}
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self,fileinfo):
+    return fileinfo in self.entries
+
+  def __iter__(self):
+    for (sequence,fileinfo) in self.order:
+      yield fileinfo
+
+  def __getitem__(self,index):
+    return self.order[index][1]
+
+  def get(self,fileinfo):
+    #returns (priority,sequence) or None
+    if not fileinfo in self.entries: return None
+    return tuple(self.entries[fileinfo])
+
+  def subdir(self,fileinfo):
+    return self.subdirs.get(fileinfo,u"")
+
+  def sequence_at(self,index):
+    return self.order[index][0]
+
+  def add(self,fileinfo,priority,sequence,subdir=u""):
+    if fileinfo in self.entries: return False
+    self.entries[fileinfo] = [priority,sequence]
+    if subdir != u"": self.subdirs[fileinfo] = subdir
+    self.order.insert((sequence,fileinfo))
+    if not priority in self.by_sequence:
+      self.by_sequence[priority] = IndexedSkiplist()
+      self.by_size[priority] = IndexedSkiplist()
+    self.by_sequence[priority].insert((sequence,fileinfo))
+    self.by_size[priority].insert((fileinfo[2],sequence,fileinfo))
+    return True
+
+  def remove(self,fileinfo):
+    #returns the (priority,sequence) the file had, or None if it was not queued
+    if not fileinfo in self.entries: return None
+    (priority,sequence) = self.entries.pop(fileinfo)
+    self.subdirs.pop(fileinfo,None)
+    self.order.remove((sequence,fileinfo))
+    self.by_sequence[priority].remove((sequence,fileinfo))
+    self.by_size[priority].remove((fileinfo[2],sequence,fileinfo))
+    if len(self.by_sequence[priority]) == 0:
+      del self.by_sequence[priority]
+      del self.by_size[priority]
+    return (priority,sequence)
+
+  def clear(self):
+    self.__init__()
+
+  def head(self,count):
+    #the first count files by (priority,sequence), as (priority,sequence,fileinfo)
+    found = []
+    for priority in sorted(self.by_sequence.keys()):
+      for (sequence,fileinfo) in self.by_sequence[priority]:
+        if len(found) >= count: return found
+        found.append((priority,sequence,fileinfo))
+    return found
+
+  def smallest(self,count):
+    #the first count files by (priority,filesize,sequence), as (priority,filesize,sequence,fileinfo)
+    found = []
+    for priority in sorted(self.by_size.keys()):
+      for (filesize,sequence,fileinfo) in self.by_size[priority]:
+        if len(found) >= count: return found
+        found.append((priority,filesize,sequence,fileinfo))
+    return found
@@ -0,0 +1,383 @@
+import os
+import time
+import uuid
+import logging
+import heapq
+import taco.globals
+import taco.constants
+import taco.commands
+import taco.downloadqueue
+
+def Peer_Is_Up(peer_uuid):
+  #both directions have to have answered a rollcall recently
+  incoming = taco.globals.server.get_client_last_request(peer_uuid)
+  outgoing = taco.globals.clients.get_client_last_reply(peer_uuid)
+  if incoming < 0 or outgoing < 0: return False
+  if abs(time.time() - incoming) > taco.constants.ROLLCALL_TIMEOUT: return False
+  if abs(time.time() - outgoing) > taco.constants.ROLLCALL_TIMEOUT: return False
+  return True
+
+def Swarm_Query(filename):
+  #every word of the name has to match, so peers only send back files that could be this one
+  return filename[:taco.constants.SEARCH_MAX_QUERY_LENGTH].strip()
+
+class Transfer(object):
+  #one file being fetched, possibly from several peers at once
+  #chunks may arrive in any order, they wait in a reorder buffer so the .filepart only ever grows at its end
+  #and a restart can always resume from its size
+  def __init__(self,peer_uuid,sharedir,filename,filesize,filemod,fullpath,current_size):
+    self.peer_uuid = peer_uuid
+    self.sharedir = sharedir
+    self.filename = filename
+    self.filesize = filesize
+    self.filemod = filemod
+    self.key = (sharedir,filename,filesize,filemod)
+    self.tid = (peer_uuid,) + self.key
+    self.fullpath = fullpath
+    self.written = current_size
+    self.next_offset = current_size
+    self.retry = []
+    self.requested = {}
+    self.buffered = {}
+    self.buffered_bytes = 0
+    self.sources = {peer_uuid:sharedir}
+    self.failed_sources = set()
+    self.search_uuid = None
+    self.search_time = 0.0
+    self.last_data = time.time()
+    self.rate = 0.0
+    self.rate_written = current_size
+    self.rate_time = time.time()
+
+  def sample_rate(self):
+    #smoothed bytes per second of data that made it into the .filepart since the last sample
+    elapsed = time.time() - self.rate_time
+    if elapsed <= 0: return self.rate
+    current = (self.written - self.rate_written) / elapsed
+    self.rate += (current - self.rate) * taco.constants.DOWNLOAD_RATE_SMOOTHING
+    self.rate_written = self.written
+    self.rate_time = time.time()
+    return self.rate
+
+  def eta(self):
+    if self.rate < 1.0: return -1
+    return int((self.filesize - self.written) / self.rate)
+
+  def is_complete(self):
+    return self.written >= self.filesize
+
+  def chunk_length(self,offset):
+    return min(taco.constants.FILESYSTEM_CHUNK_SIZE,self.filesize - offset)
+
+  def take_offset(self):
+    #lowest offset first, and never so far ahead of the file that the reorder buffer could grow past its window
+    if len(self.retry) > 0: return heapq.heappop(self.retry)
+    if self.next_offset >= self.filesize: return None
+    if self.next_offset >= self.written + taco.constants.DOWNLOAD_REORDER_WINDOW: return None
+    offset = self.next_offset
+    self.next_offset += taco.constants.FILESYSTEM_CHUNK_SIZE
+    return offset
+
+  def request_chunk(self,peer_uuid):
+    #returns (chunk_uuid,request) or None when there is nothing more to ask for right now
+    offset = self.take_offset()
+    if offset is None: return None
+    chunk_uuid = uuid.uuid4().hex
+    self.requested[chunk_uuid] = [peer_uuid,offset,time.time(),0.0]
+    return (chunk_uuid,taco.commands.Request_Get_File_Chunk(self.sources[peer_uuid],self.filename,offset,chunk_uuid))
+
+  def requeue(self,chunk_uuid):
+    (peer_uuid,offset,time_sent,time_ack) = self.requested.pop(chunk_uuid)
+    heapq.heappush(self.retry,offset)
+    return peer_uuid
+
+  def chunk_arrived(self,chunk_uuid,data):
+    #returns the blocks that can now be appended to the .filepart, or None if the chunk was the wrong size
+    (peer_uuid,offset,time_sent,time_ack) = self.requested[chunk_uuid]
+    if len(data) != self.chunk_length(offset):
+      self.requeue(chunk_uuid)
+      return None
+    del self.requested[chunk_uuid]
+    self.last_data = time.time()
+    self.buffered[offset] = data
+    self.buffered_bytes += len(data)
+    blocks = []
+    while self.written in self.buffered:
+      block = self.buffered.pop(self.written)
+      self.buffered_bytes -= len(block)
+      self.written += len(block)
+      blocks.append(block)
+    return blocks
+
+  def add_source(self,peer_uuid,sharedir):
+    if peer_uuid in self.sources or peer_uuid in self.failed_sources: return False
+    self.sources[peer_uuid] = sharedir
+    return True
+
+  def drop_source(self,peer_uuid):
+    #returns the chunk uuids that were outstanding with the peer, their offsets go back to be asked for elsewhere
+    self.failed_sources.add(peer_uuid)
+    if peer_uuid in self.sources: del self.sources[peer_uuid]
+    dropped = [chunk_uuid for chunk_uuid in self.requested if self.requested[chunk_uuid][0] == peer_uuid]
+    for chunk_uuid in dropped: self.requeue(chunk_uuid)
+    return dropped
+
+  def wants_sources(self):
+    if self.filesize - self.written < taco.constants.DOWNLOAD_SWARM_MIN_SIZE: return False
+    return abs(time.time() - self.search_time) > taco.constants.DOWNLOAD_SWARM_SEARCH_INTERVAL
+
+  def find_sources(self):
+    #exact name, size and modification time matches from the last swarm search become extra sources
+    if self.search_uuid is None: return []
+    added = []
+    with taco.globals.search_results_lock:
+      if not self.search_uuid in taco.globals.search_results: return []
+      peer_results = taco.globals.search_results[self.search_uuid][2]
+      for peer_uuid in peer_results:
+        for result in peer_results[peer_uuid][1]:
+          try:
+            (sharedir,filename,filesize,filemod) = result
+            if type(sharedir) != type(u""): sharedir = sharedir.decode("utf-8")
+            if type(filename) != type(u""): filename = filename.decode("utf-8")
+            if filename != self.filename or int(filesize) != self.filesize or float(filemod) != self.filemod: continue
+          except:
+            continue
+          if self.add_source(peer_uuid,sharedir): added.append(peer_uuid)
+          break
+    return added
+
+def Download_Subdir(root,sharedir):
+  #where a file found below the folder root goes under the download location, None if it is not below root at all
+  root = root.rstrip(u"/")
+  sharedir = sharedir.rstrip(u"/")
+  if sharedir == root: return u""
+  if not sharedir.startswith(root + u"/"): return None
+  return sharedir[len(root) + 1:].strip(u"/")
+
+def Download_Path(download_directory,subdir,filename):
+  #the .filepart for a queued file, or None if the peer supplied names that would put it outside the download location
+  download_directory = os.path.normpath(download_directory)
+  fullpath = os.path.normpath(download_directory + u"/" + subdir + u"/" + filename + taco.constants.FILESYSTEM_WORKINPROGRESS_SUFFIX)
+  if not os.path.abspath(fullpath).startswith(os.path.join(os.path.abspath(download_directory),u"")): return None
+  return fullpath
+
+def Queue_Download(peer_uuid,fileinfo,priority=taco.constants.DOWNLOAD_PRIORITY_NORMAL):
+  #caller must hold download_q_lock; returns False if the file is already queued from that peer
+  if not peer_uuid in taco.globals.download_q: taco.globals.download_q[peer_uuid] = taco.downloadqueue.PeerQueue()
+  queue = taco.globals.download_q[peer_uuid]
+  if fileinfo in queue: return False
+  taco.globals.download_q_sequence += 1
+  queue.add(fileinfo,priority,float(taco.globals.download_q_sequence))
+  taco.globals.download_journal.append(["queue",peer_uuid,fileinfo,priority,float(taco.globals.download_q_sequence)])
+  taco.globals.download_q_version += 1
+  return True
+
+def Queue_Downloads(peer_uuid,fileinfos,root,priority=taco.constants.DOWNLOAD_PRIORITY_NORMAL):
+  #caller must hold download_q_lock; Queue_Download for a whole batch, with one journal write; returns how many were added
+  #every file keeps its folder below root, so files with the same name in different folders never share a .filepart
+  if not peer_uuid in taco.globals.download_q: taco.globals.download_q[peer_uuid] = taco.downloadqueue.PeerQueue()
+  queue = taco.globals.download_q[peer_uuid]
+  records = []
+  for fileinfo in fileinfos:
+    if fileinfo in queue: continue
+    subdir = Download_Subdir(root,fileinfo[0])
+    if subdir is None: continue
+    taco.globals.download_q_sequence += 1
+    queue.add(fileinfo,priority,float(taco.globals.download_q_sequence),subdir)
+    records.append(["queue",peer_uuid,fileinfo,priority,float(taco.globals.download_q_sequence),subdir])
+  taco.globals.download_journal.append_many(records)
+  if len(records) > 0: taco.globals.download_q_version += 1
+  return len(records)
+
+def Unqueue_Download(peer_uuid,fileinfo):
+  #caller must hold download_q_lock
+  if not peer_uuid in taco.globals.download_q: return False
+  if taco.globals.download_q[peer_uuid].remove(fileinfo) is None: return False
+  taco.globals.download_journal.append(["unqueue",peer_uuid,fileinfo])
+  taco.globals.download_q_version += 1
+  return True
+
+def Move_Download(peer_uuid,fileinfo,newloc):
+  #caller must hold download_q_lock
+  #the moved file takes a sequence number between its new neighbours, so each peer's queue stays in sequence order
+  #and the fifo policy follows the order the user dragged things into
+  if not peer_uuid in taco.globals.download_q: return False
+  queue = taco.globals.download_q[peer_uuid]
+  subdir = queue.subdir(fileinfo)
+  removed = queue.remove(fileinfo)
+  if removed is None: return False
+  taco.globals.download_q_version += 1
+  (priority,sequence) = removed
+  newloc = min(max(0,newloc),len(queue))
+  if len(queue) == 0:        pass
+  elif newloc == 0:          sequence = queue.sequence_at(0) - 1.0
+  elif newloc == len(queue): sequence = queue.sequence_at(newloc - 1) + 1.0
+  else:
+    before = queue.sequence_at(newloc - 1)
+    after  = queue.sequence_at(newloc)
+    sequence = (before + after) / 2.0
+    if sequence in (before,after):
+      #out of room between the two, give the whole queue fresh numbers at the back of the line
+      entries = [(entry,queue.get(entry)[0],queue.subdir(entry)) for entry in queue]
+      entries.insert(newloc,(fileinfo,priority,subdir))
+      queue.clear()
+      for (entry,entry_priority,entry_subdir) in entries:
+        taco.globals.download_q_sequence += 1
+        queue.add(entry,entry_priority,float(taco.globals.download_q_sequence),entry_subdir)
+        taco.globals.download_journal.append(["queue",peer_uuid,entry,entry_priority,float(taco.globals.download_q_sequence),entry_subdir])
+      return True
+  queue.add(fileinfo,priority,sequence,subdir)
+  taco.globals.download_journal.append(["queue",peer_uuid,fileinfo,priority,sequence,subdir])
+  taco.globals.download_q_sequence = max(taco.globals.download_q_sequence,int(sequence))
+  return True
+
+def Set_Download_Priority(peer_uuid,fileinfo,priority):
+  #caller must hold download_q_lock
+  if not peer_uuid in taco.globals.download_q: return False
+  queue = taco.globals.download_q[peer_uuid]
+  subdir = queue.subdir(fileinfo)
+  removed = queue.remove(fileinfo)
+  if removed is None: return False
+  queue.add(fileinfo,priority,removed[1],subdir)
+  taco.globals.download_journal.append(["queue",peer_uuid,fileinfo,priority,removed[1],subdir])
+  taco.globals.download_q_version += 1
+  return True
+
+def Complete_Download(peer_uuid,sharedir,filename,filesize):
+  with taco.globals.completed_q_lock:
+    entry = (time.time(),peer_uuid,sharedir,filename,filesize)
+    taco.globals.completed_q.append(entry)
+    taco.globals.download_journal.append(["completed",entry])
+
+def Clear_Completed():
+  with taco.globals.completed_q_lock:
+    taco.globals.completed_q.clear()
+    taco.globals.download_journal.append(["clear"])
+
+def Journal_Path():
+  with taco.globals.settings_lock:
+    return os.path.normpath(os.path.abspath(taco.globals.settings["TacoNET Certificates Store"] + "/" + taco.globals.settings["Local UUID"] + "/" + taco.constants.DOWNLOAD_JOURNAL_FILENAME))
+
+def Journal_Text(value):
+  if type(value) == type(""): return value.decode("utf-8")
+  return value
+
+def Restore_Download_Queue():
+  #replays the journal into download_q and completed_q, then rewrites it so startup never replays the same history twice
+  start = time.time()
+  path = Journal_Path()
+  records = taco.globals.download_journal.open(path)
+  queued = {}
+  completed = taco.globals.completed_q
+  completed.clear()
+  for record in records:
+    try:
+      if record[0] == "queue":
+        #files queued on their own have no folder, records from before folders were kept have no field for it
+        (peer_uuid,(sharedir,filename,filesize,filemod),priority,sequence) = record[1:5]
+        subdir = u""
+        if len(record) > 5: subdir = Journal_Text(record[5])
+        queued[(Journal_Text(peer_uuid),(Journal_Text(sharedir),Journal_Text(filename),int(filesize),float(filemod)))] = (int(priority),float(sequence),subdir)
+      elif record[0] == "unqueue":
+        (peer_uuid,(sharedir,filename,filesize,filemod)) = record[1:]
+        queued.pop((Journal_Text(peer_uuid),(Journal_Text(sharedir),Journal_Text(filename),int(filesize),float(filemod))),None)
+      elif record[0] == "completed":
+        (thetime,peer_uuid,sharedir,filename,filesize) = record[1]
+        completed.append((float(thetime),Journal_Text(peer_uuid),Journal_Text(sharedir),Journal_Text(filename),int(filesize)))
+      elif record[0] == "clear":
+        completed.clear()
+    except:
+      logging.warning("Skipping a malformed download journal record: " + repr(record))
+  with taco.globals.download_q_lock:
+    taco.globals.download_q = {}
+    for ((peer_uuid,fileinfo),(priority,sequence,subdir)) in queued.items():
+      if not peer_uuid in taco.globals.download_q: taco.globals.download_q[peer_uuid] = taco.downloadqueue.PeerQueue()
+      taco.globals.download_q[peer_uuid].add(fileinfo,priority,sequence,subdir)
+      taco.globals.download_q_sequence = max(taco.globals.download_q_sequence,int(sequence) + 1)
+    taco.globals.download_q_version += 1
+  Compact_Download_Journal(True)
+  logging.info("Restored " + str(len(queued)) + " queued downloads and " + str(len(completed)) + " completed downloads from " + str(len(records)) + " journal records in " + str(round(time.time() - start,2)) + "s")
+
+def Compact_Download_Journal(force=False):
+  #once most of the journal is history that no longer matters, rewrite it as one record per live entry
+  #otherwise just get what has been appended onto the disk; either way the disk is only touched outside the queue locks
+  with taco.globals.download_q_lock:
+    with taco.globals.completed_q_lock:
+      live = len(taco.globals.completed_q) + sum([len(queue) for queue in taco.globals.download_q.values()])
+      compact = force or taco.globals.download_journal.records >= max(taco.constants.DOWNLOAD_JOURNAL_COMPACT_MIN,live * 2)
+  if not compact:
+    taco.globals.download_journal.sync()
+    return False
+  with taco.globals.download_q_lock:
+    with taco.globals.completed_q_lock:
+      records = [["completed",entry] for entry in taco.globals.completed_q]
+      for peer_uuid in taco.globals.download_q:
+        queue = taco.globals.download_q[peer_uuid]
+        for fileinfo in queue:
+          (priority,sequence) = queue.get(fileinfo)
+          records.append(["queue",peer_uuid,fileinfo,priority,sequence,queue.subdir(fileinfo)])
+      #every append happens under one of these two locks, so nothing lands between the snapshot and the capture starting
+      taco.globals.download_journal.begin_rewrite()
+  taco.globals.download_journal.rewrite(records)
+  return True
+
+def Download_Queue_Listing():
+  #caller must hold download_q_lock; plain lists for handing to json, and each entry's priority in the same order
+  listing = {}
+  priorities = {}
+  for peer_uuid in taco.globals.download_q:
+    queue = taco.globals.download_q[peer_uuid]
+    listing[peer_uuid] = list(queue)
+    priorities[peer_uuid] = [queue.get(fileinfo)[0] for fileinfo in listing[peer_uuid]]
+  return (listing,priorities)
+
+def Downloads_Per_Peer(value):
+  try:
+    return min(max(1,int(value)),taco.constants.DOWNLOAD_PER_PEER_MAX)
+  except:
+    return taco.constants.DOWNLOAD_PER_PEER_DEFAULT
+
+def Download_Slots(value):
+  try:
+    return min(max(1,int(value)),taco.constants.DOWNLOAD_SLOTS_MAX)
+  except:
+    return taco.constants.DOWNLOAD_SLOTS_DEFAULT
+
+def Download_Policy(value):
+  if value in taco.constants.DOWNLOAD_POLICIES: return value
+  return taco.constants.DOWNLOAD_POLICY_DEFAULT
+
+def Download_Durability(value):
+  #flush: the os decides when data reaches the disk, completion: fsync before the rename, interval: also fsync every Download Sync MB
+  if value in taco.constants.DOWNLOAD_DURABILITY: return value
+  return taco.constants.DOWNLOAD_DURABILITY_DEFAULT
+
+def Download_Sync_MB(value):
+  try:
+    return min(max(1,int(value)),taco.constants.DOWNLOAD_SYNC_MB_MAX)
+  except:
+    return taco.constants.DOWNLOAD_SYNC_MB_DEFAULT
+
+def Schedule_Downloads(peer_uuids,written,policy,slots,per_peer):
+  #caller must hold download_q_lock; returns the (peer_uuid,fileinfo) pairs that should be downloading, best first
+  #no peer ever gets more than per_peer of the slots, so only the per_peer best files of each peer can make the cut,
+  #and those come straight off the front of the queue's per priority orderings
+  candidates = []
+  for peer_uuid in peer_uuids:
+    if not peer_uuid in taco.globals.download_q: continue
+    queue = taco.globals.download_q[peer_uuid]
+    if policy == "smallest":
+      #a part downloaded file can be smaller than its size says, so those are always in the running too
+      keyed = dict([(entry[-1],entry) for entry in queue.smallest(per_peer)])
+      for tid in written:
+        if tid[0] != peer_uuid or not tid[1:] in queue: continue
+        (priority,sequence) = queue.get(tid[1:])
+        keyed[tid[1:]] = (priority,tid[3] - written[tid],sequence,tid[1:])
+      keyed = heapq.nsmallest(per_peer,keyed.values())
+    else:
+      keyed = queue.head(per_peer)
+    for (rank,entry) in enumerate(keyed):
+      #fair share interleaves the peers, a peer's second file only goes ahead of everyone's first ones if its priority is higher
+      if policy == "fair": candidates.append((entry[0],rank,entry[1],peer_uuid,entry[-1]))
+      else:                candidates.append(entry[:-1] + (peer_uuid,entry[-1]))
+  return [(candidate[-2],candidate[-1]) for candidate in heapq.nsmallest(slots,candidates)]
@@ -6,8 +6,15 @@ import Queue
 import random
 import taco.constants
 import taco.globals
+import taco.timers
+import taco.shareindex
+import taco.watcher
+import taco.downloads
+import taco.uploadreader
 import uuid
-from collections import defaultdict
+import hashlib
+import msgpack
+from collections import defaultdict, OrderedDict
 
 if os.name=='nt':
   import ctypes
@@ -28,27 +35,53 @@ elif os.name=='posix':
       return (0,0)
 
 def Is_Path_Under_A_Share(path):
-  return_value = False
-  if os.path.isdir(os.path.normpath(path)):
-    with taco.globals.settings_lock:
-      for [sharename,sharepath] in taco.globals.settings["Shares"]:
-        dirpath = os.path.abspath(os.path.normcase(unicode(sharepath)))
-        dirpath2 = os.path.abspath(os.path.normcase(unicode(path)))
-        if os.path.commonprefix([dirpath,dirpath2]) == dirpath:
-          return_value = True
-          break
-  #logging.debug(path + " -- " + str(return_value))
-  return return_value
+  #string checks only, callers that need the path to be a directory check that themselves
+  return taco.globals.share_table.contains(path)
 
 def Convert_Share_To_Path(share):
-  return_val = ""
-  with taco.globals.settings_lock:
-    for [sharename,sharepath] in taco.globals.settings["Shares"]:
-      if sharename==share:
-        return_val = sharepath
-        break
-  #logging.debug(share + " -- " + str(return_val))
-  return return_val
+  return taco.globals.share_table.path_for(share)
+
+def Listing_Version(dirs,files):
+  #same contents, same version, no matter which worker built the listing or when
+  return hashlib.md5(msgpack.packb([dirs,files])).hexdigest()[:16]
+
+def Listing_Page(datablock):
+  #cursor, sort key and name filter for a paged listing; None means the whole listing in one message
+  if type(datablock) != type({}) or not "limit" in datablock: return None
+  try:
+    offset = max(0,int(datablock.get("offset",0)))
+    limit  = min(max(1,int(datablock["limit"])),taco.constants.FILESYSTEM_LISTING_PAGE_MAX)
+  except:
+    return None
+  sort = datablock.get("sort","name")
+  if not sort in taco.constants.FILESYSTEM_LISTING_SORTS: sort = "name"
+  namefilter = datablock.get("filter",u"")
+  if type(namefilter) != type(u""): namefilter = unicode(str(namefilter),"utf-8","replace")
+  namefilter = namefilter.lower()[:taco.constants.SEARCH_MAX_QUERY_LENGTH]
+  return {"offset":offset,"limit":limit,"sort":sort,"filter":namefilter}
+
+def Listing_Page_Key(page):
+  if page is None: return None
+  return (page["offset"],page["limit"],page["sort"],page["filter"])
+
+def Page_Listing(listing,page):
+  #directories come first, then files; directories are always in name order
+  (thetime,dirs,files) = listing[:3]
+  if page["filter"] != u"":
+    dirs  = [dirname for dirname in dirs if page["filter"] in dirname.lower()]
+    files = [fileinfo for fileinfo in files if page["filter"] in fileinfo[0].lower()]
+  sortkey = page["sort"].lstrip("-")
+  if sortkey == "size":    files = sorted(files,key=lambda fileinfo: fileinfo[1])
+  elif sortkey == "mtime": files = sorted(files,key=lambda fileinfo: fileinfo[2])
+  if page["sort"].startswith("-"):
+    if sortkey == "name": dirs = dirs[::-1]
+    files = files[::-1]
+  offset = page["offset"]
+  limit = page["limit"]
+  page_dirs = dirs[offset:offset + limit]
+  file_offset = max(0,offset - len(dirs))
+  page_files = files[file_offset:file_offset + limit - len(page_dirs)]
+  return ([thetime,page_dirs,page_files],len(dirs) + len(files))
 
 class TacoFilesystemManager(threading.Thread):
   def __init__(self):
@@ -62,34 +95,298 @@ class TacoFilesystemManager(threading.Thread):
     self.status_time = -1
 
     self.workers = []
-    self.last_purge = time.time()
+    self.timers = taco.timers.TimerQueue()
 
     self.listings_lock = threading.Lock()
     self.listings = {}
 
     self.listing_work_queue            = Queue.Queue()
+    self.search_work_queue             = Queue.Queue()
+    self.tree_work_queue               = Queue.Queue()
     self.listing_results_queue         = Queue.Queue()
     self.chunk_requests_incoming_queue = Queue.Queue() 
     self.chunk_requests_outgoing_queue = Queue.Queue() 
     self.chunk_requests_ack_queue      = Queue.Queue() 
 
-    self.results_to_return = []
+    #normalized sharedir -> [(peer_uuid,sharedir,shareuuid,page,version),...] waiting on the one queued scan of it
+    self.listing_waiters = {}
 
     self.download_q_check_time = time.time()
-    self.client_downloading = {}
-    self.client_downloading_status = {}
-    self.client_downloading_pending_chunks = {}
-    self.client_downloading_requested_chunks = {}
-    self.client_downloading_chunks_last_recieved = {}
-    self.client_downloading_filename = {} 
-    self.files_w = {}
-    self.files_r = {}
-    self.files_r_last_access = {}
-    self.files_w_last_access = {}
+    self.published_q_version = -1
+    #the published listing, and tid -> its index in that listing
+    self.published_q = ({},{})
+    self.published_q_index = {}
+    #(peer_uuid,sharedir,filename,filesize,filemod) -> Transfer, for the first few files of every peer's download queue
+    self.transfers = {}
+    #chunk_uuid -> Transfer it was asked for, and how many chunks each peer has outstanding across every transfer
+    self.chunk_owners = {}
+    self.peer_inflight = {}
+    #tid -> bytes in the .filepart, for queued files that were started and then put aside, or left from an earlier run
+    self.partial_sizes = {}
+    #tid -> Transfer whose .filepart the writer is closing and renaming
+    self.finishing = {}
+    self.durability = taco.constants.DOWNLOAD_DURABILITY_DEFAULT
+    self.sync_bytes = taco.constants.DOWNLOAD_SYNC_MB_DEFAULT * taco.constants.MB
+    self.writer = TacoFilesystemWriter()
+    self.reader = taco.uploadreader.UploadReader()
  
   def add_listing(self,thetime,sharedir,dirs,files):
+    listing = [thetime,dirs,files,Listing_Version(dirs,files)]
+    with self.listings_lock:
+      self.listings[sharedir] = listing
+    #watched shares tell us when a listing changes, so those can stay cached
+    if not self.watcher.is_watching(): self.timers.schedule(("listing",sharedir),thetime + taco.constants.FILESYSTEM_CACHE_TIMEOUT)
+    return listing
+
+  def send_listing(self,listing,waiters):
+    (thetime,dirs,files,listing_version) = listing
+    for (peer_uuid,sharedir,shareuuid,page,version) in waiters:
+      self.set_status("RESULTS ready to send:" + str((sharedir,shareuuid)))
+      if version == listing_version:
+        request = taco.commands.Request_Share_Listing_Results(sharedir,shareuuid,None,page,listing_version)
+      elif page is None:
+        request = taco.commands.Request_Share_Listing_Results(sharedir,shareuuid,[thetime,dirs,files],None,listing_version)
+      else:
+        (results,total) = Page_Listing(listing,page)
+        request = taco.commands.Request_Share_Listing_Results(sharedir,shareuuid,results,dict(page,total=total),listing_version)
+      taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
+    if len(waiters) > 0: taco.globals.clients.sleep.set()
+
+  def start_transfer(self,peer_uuid,fileinfo,download_directory):
+    (sharedir,filename,filesize,filemod) = fileinfo
+    with taco.globals.download_q_lock:
+      if not peer_uuid in taco.globals.download_q or not fileinfo in taco.globals.download_q[peer_uuid]: return None
+      subdir = taco.globals.download_q[peer_uuid].subdir(fileinfo)
+    filename_incomplete = taco.downloads.Download_Path(download_directory,subdir,filename)
+    if filename_incomplete is None:
+      self.set_status("Refusing to download outside the download location: " + repr((subdir,filename)),2)
+      with taco.globals.download_q_lock:
+        taco.downloads.Unqueue_Download(peer_uuid,fileinfo)
+      return None
+    if not os.path.isdir(os.path.dirname(filename_incomplete)):
+      try:
+        os.makedirs(os.path.dirname(filename_incomplete))
+      except Exception,e:
+        self.set_status("Could not create the download folder for: " + filename_incomplete + " " + str(e),2)
+        return None
+    #two queued files with the same name would end up appending to the same .filepart
+    for transfer in self.transfers.values():
+      if transfer.fullpath == filename_incomplete: return None
+    #the size on disk is only the truth once the writer has caught up with it
+    if self.writer.is_busy(filename_incomplete): return None
+    try:
+      current_size = os.path.getsize(filename_incomplete)
+    except:
+      current_size = 0
+    if current_size > filesize:
+      self.set_status("Partial download is bigger than the file it is for, starting it over: " + filename_incomplete,2)
+      self.writer.discard(filename_incomplete)
+      return None
+    transfer = taco.downloads.Transfer(peer_uuid,sharedir,filename,filesize,filemod,filename_incomplete,current_size)
+    self.transfers[transfer.tid] = transfer
+    self.partial_sizes.pop(transfer.tid,None)
+    return transfer
+
+  def release_chunk(self,peer_uuid,chunk_uuid):
+    if chunk_uuid in self.chunk_owners: del self.chunk_owners[chunk_uuid]
+    if self.peer_inflight.get(peer_uuid,0) > 0: self.peer_inflight[peer_uuid] -= 1
+
+  def drop_transfer(self,transfer):
+    #whatever is still in its reorder buffer is lost, the .filepart is left as it is to resume from later
+    if self.transfers.pop(transfer.tid,None) is None: return
+    if transfer.written > 0: self.partial_sizes[transfer.tid] = transfer.written
+    for chunk_uuid in transfer.requested: self.release_chunk(transfer.requested[chunk_uuid][0],chunk_uuid)
+
+  def drop_source(self,transfer,peer_uuid):
+    self.set_status("Dropping swarm source: " + peer_uuid + " for: " + transfer.filename)
+    for chunk_uuid in transfer.drop_source(peer_uuid): self.release_chunk(peer_uuid,chunk_uuid)
+
+  def check_transfer(self,transfer):
+    for chunk_uuid in transfer.requested.keys():
+      if not chunk_uuid in transfer.requested: continue
+      (peer_uuid,offset,time_sent,time_ack) = transfer.requested[chunk_uuid]
+      if abs(time.time() - time_sent) <= taco.constants.DOWNLOAD_SWARM_CHUNK_TIMEOUT: continue
+      if peer_uuid != transfer.peer_uuid:
+        self.drop_source(transfer,peer_uuid)
+        continue
+      #the primary source is never dropped, but a chunk it lost would pin the reorder window until the transfer is borked
+      self.set_status("Asking again for a chunk that never came: " + str((transfer.filename,offset)))
+      transfer.requeue(chunk_uuid)
+      self.release_chunk(peer_uuid,chunk_uuid)
+    for peer_uuid in transfer.sources.keys():
+      if peer_uuid != transfer.peer_uuid and not taco.downloads.Peer_Is_Up(peer_uuid): self.drop_source(transfer,peer_uuid)
+
+    if len(transfer.requested) > 0 and abs(time.time() - transfer.last_data) > taco.constants.DOWNLOAD_Q_WAIT_FOR_DATA:
+      self.set_status("Download Borked for: "+ transfer.peer_uuid)
+      self.drop_transfer(transfer)
+      return
+
+    for peer_uuid in transfer.find_sources(): self.set_status("Found a swarm source: " + peer_uuid + " for: " + transfer.filename)
+    if transfer.wants_sources(): self.search_for_sources(transfer)
+
+  def search_for_sources(self,transfer):
+    #other peers sharing the same file are found the same way a user would find them, with a search
+    transfer.search_time = time.time()
+    query = taco.downloads.Swarm_Query(transfer.filename)
+    if query == u"": return
+    with taco.globals.settings_lock:
+      peer_uuids = [peer_uuid for peer_uuid in taco.globals.settings["Peers"].keys() if taco.globals.settings["Peers"][peer_uuid]["enabled"]]
+    peer_uuids = [peer_uuid for peer_uuid in peer_uuids if not peer_uuid in transfer.sources and not peer_uuid in transfer.failed_sources]
+    peer_uuids = [peer_uuid for peer_uuid in peer_uuids if taco.downloads.Peer_Is_Up(peer_uuid) and taco.commands.Peer_Might_Have(peer_uuid,query)]
+    if len(peer_uuids) == 0: return
+    self.set_status("Searching " + str(len(peer_uuids)) + " peers for more sources of: " + transfer.filename)
+    transfer.search_uuid = uuid.uuid4().hex
+    request = taco.commands.Request_Search(peer_uuids,query,transfer.search_uuid)
+    for peer_uuid in peer_uuids:
+      taco.globals.Add_To_Output_Queue(peer_uuid,request,3)
+    taco.globals.clients.sleep.set()
+
+  def finish_transfer(self,transfer):
+    #the writer renames the .filepart once everything before it is on disk, it is unqueued when that comes back
+    self.set_status("FILE DOWNLOAD COMPLETE")
+    self.drop_transfer(transfer)
+    self.finishing[transfer.tid] = transfer
+    self.writer.finish(transfer.fullpath,transfer.tid,self.durability)
+
+  def finished_transfers(self):
+    while not self.writer.finished_queue.empty():
+      (tid,filename_complete) = self.writer.finished_queue.get()
+      transfer = self.finishing.pop(tid)
+      if filename_complete is None: continue
+      self.set_status("Download finished: " + filename_complete,1)
+      taco.downloads.Complete_Download(transfer.peer_uuid,transfer.sharedir,transfer.filename,transfer.filesize)
+      with taco.globals.download_q_lock:
+        taco.downloads.Unqueue_Download(transfer.peer_uuid,transfer.key)
+      #start on the next file straight away instead of on the next queue check
+      self.download_q_check_time = 0
+
+  def drop_listing(self,sharedir):
+    with self.listings_lock:
+      if sharedir in self.listings: del self.listings[sharedir]
+    self.timers.cancel(("listing",sharedir))
+
+  def drop_listings(self):
     with self.listings_lock:
-      self.listings[sharedir] = [thetime,dirs,files]
+      for sharedir in self.listings.keys():
+        self.timers.cancel(("listing",sharedir))
+      self.listings = {}
+
+  def expire_reads(self):
+    self.reader.close_idle()
+    self.timers.schedule(("closeread",None),time.time() + taco.constants.FILESYSTEM_CACHE_TIMEOUT)
+
+  def send_chunk(self,peer_uuid,sharedir,filename,offset,chunk_uuid):
+    self.set_status("Need to send a chunk of data: " + str((peer_uuid,sharedir,filename,offset,chunk_uuid)))
+    resolved = taco.globals.share_table.resolve(sharedir)
+    if resolved is None: return
+    directory = resolved[3]
+    fullpath = os.path.normpath(directory + u"/" + filename)
+    if not Is_Path_Under_A_Share(os.path.dirname(fullpath)): return
+    try:
+      chunk_data = self.reader.read(peer_uuid,fullpath,offset,taco.constants.FILESYSTEM_CHUNK_SIZE)
+    except Exception,e:
+      self.set_status("Could not read a chunk of: " + fullpath + " " + str(e),2)
+      return
+    if chunk_data is None: return
+    request = taco.commands.Request_Give_File_Chunk(chunk_data,chunk_uuid)
+    taco.globals.Add_To_Output_Queue(peer_uuid,request,3)
+    taco.globals.clients.sleep.set()
+
+  def expire_listing(self,sharedir):
+    with self.listings_lock:
+      if not sharedir in self.listings: return
+      thetime = self.listings[sharedir][0]
+      if abs(time.time() - thetime) > taco.constants.FILESYSTEM_CACHE_TIMEOUT:
+        self.set_status("Purging Filesystem cache for share: " + sharedir)
+        del self.listings[sharedir]
+        return
+    self.timers.schedule(("listing",sharedir),thetime + taco.constants.FILESYSTEM_CACHE_TIMEOUT)
+
+  def purge_share_listings(self):
+    taco.globals.share_listings.purge()
+    self.timers.schedule(("sharelistings",None),time.time() + taco.constants.LISTING_CACHE_PURGE)
+
+  def expire_share_listing_i_care_about(self,share_listing_uuid):
+    with taco.globals.share_listings_i_care_about_lock:
+      if not share_listing_uuid in taco.globals.share_listings_i_care_about: return
+      thetime = taco.globals.share_listings_i_care_about[share_listing_uuid]
+      if abs(time.time() - thetime) > taco.constants.FILESYSTEM_LISTING_TIMEOUT:
+        self.set_status("Purging Filesystem listing i care about for: " + share_listing_uuid)
+        del taco.globals.share_listings_i_care_about[share_listing_uuid]
+        return
+    self.timers.schedule(("icareabout",share_listing_uuid),thetime + taco.constants.FILESYSTEM_LISTING_TIMEOUT)
+
+  def publish_download_queue(self):
+    #only rebuilt when the queue has changed, so an idle queue of any size costs nothing
+    with taco.globals.download_q_lock:
+      if taco.globals.download_q_version == self.published_q_version: return
+      self.published_q_version = taco.globals.download_q_version
+      self.published_q = taco.downloads.Download_Queue_Listing()
+    self.published_q_index = {}
+    for peer_uuid in self.published_q[0]:
+      for (index,fileinfo) in enumerate(self.published_q[0][peer_uuid]): self.published_q_index[(peer_uuid,) + fileinfo] = index
+    self.publish_download_snapshot(False)
+
+  def publish_download_snapshot(self,sample):
+    #progress is keyed by the file's place in the listing it is published with, two queued files with the same name never mix
+    for tid in self.partial_sizes.keys():
+      if not tid in self.published_q_index: del self.partial_sizes[tid]
+    progress = {}
+    for tid in self.partial_sizes:
+      progress.setdefault(tid[0],{})[self.published_q_index[tid]] = [self.partial_sizes[tid],0.0,-1]
+    for transfer in self.transfers.values():
+      if not transfer.tid in self.published_q_index: continue
+      if sample: transfer.sample_rate()
+      progress.setdefault(transfer.peer_uuid,{})[self.published_q_index[transfer.tid]] = [transfer.written,transfer.rate,transfer.eta()]
+    taco.globals.download_q_snapshot = self.published_q + (progress,)
+
+  def publish_download_progress(self):
+    #the transfers page polls every second, it reads this snapshot instead of stat'ing every queued .filepart
+    self.publish_download_snapshot(True)
+    self.timers.schedule(("progress",None),time.time() + taco.constants.DOWNLOAD_PROGRESS_INTERVAL)
+
+  def seed_partial_sizes(self):
+    #.fileparts left from an earlier run show their real size straight away, not only once they are scheduled again
+    with taco.globals.settings_lock:
+      download_directory = os.path.normpath(taco.globals.settings["Download Location"])
+    with taco.globals.download_q_lock:
+      queued = [((peer_uuid,) + fileinfo,queue.subdir(fileinfo)) for (peer_uuid,queue) in taco.globals.download_q.items() for fileinfo in queue]
+    for (tid,subdir) in queued:
+      filename_incomplete = taco.downloads.Download_Path(download_directory,subdir,tid[2])
+      if filename_incomplete is None: continue
+      try:
+        current_size = os.path.getsize(filename_incomplete)
+      except OSError:
+        continue
+      if current_size > 0: self.partial_sizes[tid] = current_size
+
+  def compact_download_journal(self):
+    taco.downloads.Compact_Download_Journal()
+    self.timers.schedule(("journal",None),time.time() + taco.constants.DOWNLOAD_JOURNAL_SYNC)
+
+  def refresh_search_summary(self):
+    if self.index.search_index.refresh_summary(): taco.commands.Invalidate_Rollcall_Cache()
+    self.timers.schedule(("summary",None),time.time() + taco.constants.SEARCH_SUMMARY_REBUILD)
+
+  def expire_share_tree(self,tree_uuid):
+    with taco.globals.share_trees_lock:
+      if not tree_uuid in taco.globals.share_trees: return
+      thetime = taco.globals.share_trees[tree_uuid][0]
+      if abs(time.time() - thetime) > taco.constants.FILESYSTEM_TREE_TIMEOUT:
+        self.set_status("Purging share tree results for: " + tree_uuid)
+        del taco.globals.share_trees[tree_uuid]
+        return
+    self.timers.schedule(("sharetree",tree_uuid),thetime + taco.constants.FILESYSTEM_TREE_TIMEOUT)
+
+  def expire_search(self,search_uuid):
+    with taco.globals.search_results_lock:
+      if not search_uuid in taco.globals.search_results: return
+      thetime = taco.globals.search_results[search_uuid][0]
+      if abs(time.time() - thetime) > taco.constants.SEARCH_RESULTS_TIMEOUT:
+        self.set_status("Purging search results for: " + search_uuid)
+        del taco.globals.search_results[search_uuid]
+        return
+    self.timers.schedule(("search",search_uuid),thetime + taco.constants.SEARCH_RESULTS_TIMEOUT)
 
   def set_status(self,text,level=0):
     if   level==1: logging.info(text)
@@ -106,6 +403,22 @@ class TacoFilesystemManager(threading.Thread):
 
   def run(self):
     self.set_status("Starting Up Filesystem Manager")
+    with taco.globals.settings_lock:
+      index_filename = os.path.normpath(os.path.abspath(taco.globals.settings["TacoNET Certificates Store"] + "/" + taco.globals.settings["Local UUID"] + "/" + taco.constants.FILESYSTEM_INDEX_FILENAME))
+    self.set_status("Opening Share Index: " + index_filename)
+    self.index = taco.shareindex.ShareIndex(index_filename)
+    self.indexer = taco.shareindex.TacoShareIndexer(self.index)
+    self.indexer.start()
+    self.watcher = taco.watcher.TacoShareWatcher(self.index,self.indexer)
+    self.watcher.start()
+    self.refresh_search_summary()
+    self.purge_share_listings()
+    self.compact_download_journal()
+    self.seed_partial_sizes()
+    self.publish_download_queue()
+    self.publish_download_progress()
+    self.expire_reads()
+    self.writer.start()
     for i in range(taco.constants.FILESYSTEM_WORKER_COUNT):
       self.workers.append(TacoFilesystemWorker(i))
     for i in self.workers:
@@ -116,96 +429,71 @@ class TacoFilesystemManager(threading.Thread):
       self.sleep.clear()
       if self.stop.is_set(): break
       
+      self.finished_transfers()
+      self.publish_download_queue()
+
       #CHECK downloadq state
       if time.time() >= self.download_q_check_time:
-        #self.set_status("Checking if the download q is in a good state")
-        with taco.globals.settings_lock: local_copy_download_directory = os.path.normpath(taco.globals.settings["Download Location"])
+        with taco.globals.settings_lock:
+          local_copy_download_directory = os.path.normpath(taco.globals.settings["Download Location"])
+          per_peer = taco.downloads.Downloads_Per_Peer(taco.globals.settings.get("Downloads Per Peer"))
+          slots = taco.downloads.Download_Slots(taco.globals.settings.get("Download Slots"))
+          policy = taco.downloads.Download_Policy(taco.globals.settings.get("Download Policy"))
+          self.durability = taco.downloads.Download_Durability(taco.globals.settings.get("Download Durability"))
+          self.sync_bytes = taco.downloads.Download_Sync_MB(taco.globals.settings.get("Download Sync MB")) * taco.constants.MB
         self.download_q_check_time = time.time() + taco.constants.DOWNLOAD_Q_CHECK_TIME
 
-        #check for download q items
         with taco.globals.download_q_lock:
           for peer_uuid in taco.globals.download_q.keys():
-
-            incoming = taco.globals.server.get_client_last_request(peer_uuid)
-            outgoing = taco.globals.clients.get_client_last_reply(peer_uuid)
-
-            if incoming < 0 or outgoing < 0: 
-              self.set_status("I have items in the download queue, but client has never been contactable: "+peer_uuid)
-              continue
-            if abs(time.time() - incoming) > taco.constants.ROLLCALL_TIMEOUT or abs(time.time() - outgoing) > taco.constants.ROLLCALL_TIMEOUT: 
-              self.set_status("I have items in the download queue, but client has timed out rollcalls: "+peer_uuid)
-              continue
-
             if len(taco.globals.download_q[peer_uuid]) == 0:
               self.set_status("Download Q empty for: " + peer_uuid)
-              self.client_downloading[peer_uuid] = 0
               del taco.globals.download_q[peer_uuid]
-              self.client_downloading_pending_chunks[peer_uuid] = []
-              self.client_downloading_requested_chunks[peer_uuid] = []
-              self.client_downloading_status[peer_uuid] = {}
-              self.client_downloading_chunks_last_recieved = {}
+              taco.globals.download_q_version += 1
+          peer_uuids = taco.globals.download_q.keys()
+        for peer_uuid in peer_uuids[:]:
+          if not taco.downloads.Peer_Is_Up(peer_uuid):
+            self.set_status("I have items in the download queue, but client is not contactable: "+peer_uuid)
+            peer_uuids.remove(peer_uuid)
+
+        #one schedule across every peer, so the slots go to the best files wherever they are queued
+        written = dict([(transfer.tid,transfer.written) for transfer in self.transfers.values()])
+        with taco.globals.download_q_lock:
+          schedule = taco.downloads.Schedule_Downloads(peer_uuids,written,policy,slots,per_peer)
+
+        #anything that was removed, moved down, lost its slot or whose peer went away
+        scheduled = set([(peer_uuid,) + fileinfo for (peer_uuid,fileinfo) in schedule])
+        for transfer in self.transfers.values():
+          if not transfer.tid in scheduled: self.drop_transfer(transfer)
+
+        if os.path.isdir(local_copy_download_directory):
+          for (peer_uuid,fileinfo) in schedule:
+            if (peer_uuid,) + fileinfo in self.finishing: continue
+            transfer = self.transfers.get((peer_uuid,) + fileinfo)
+            if transfer is not None and self.writer.take_error(transfer.fullpath):
+              self.drop_transfer(transfer)
               continue
-            else:
-              (sharedir,filename,filesize,filemod) = taco.globals.download_q[peer_uuid][0]
-              if not peer_uuid in self.client_downloading: self.client_downloading[peer_uuid] = 0
-
-              if self.client_downloading[peer_uuid] != (sharedir,filename,filesize,filemod):
-                self.set_status("Need to check on the file we should be downloading:" + str((peer_uuid,sharedir,filename,filesize,filemod)))
-                self.client_downloading[peer_uuid] = (sharedir,filename,filesize,filemod)
-                self.client_downloading_pending_chunks[peer_uuid] = []
-                self.client_downloading_requested_chunks[peer_uuid] = []
-                if not os.path.isdir(local_copy_download_directory): continue
-                filename_incomplete = os.path.normpath(local_copy_download_directory + u"/" + filename + taco.constants.FILESYSTEM_WORKINPROGRESS_SUFFIX)
-
-                try:
-                  current_size = os.path.getsize(filename_incomplete)
-                except:
-                  current_size = 0
-                if current_size != filesize:
-                  self.set_status("Building in memory 'torrent'")
-                  self.client_downloading_filename[peer_uuid] = filename_incomplete
-                  self.client_downloading_status[peer_uuid] = {}
-                  self.client_downloading_chunks_last_recieved = {}
-                  for file_offset in range(current_size,filesize+1,taco.constants.FILESYSTEM_CHUNK_SIZE):
-                    tmp_uuid = uuid.uuid4().hex
-                    self.client_downloading_pending_chunks[peer_uuid].append((tmp_uuid,file_offset))
-                    self.client_downloading_status[peer_uuid][tmp_uuid] = (0.0,0.0,file_offset)
-                  self.client_downloading_pending_chunks[peer_uuid].reverse()
-                  self.set_status("Building in memory 'torrent' -- done")
-              else:
-                if not os.path.isdir(local_copy_download_directory): continue
-                filename_incomplete = os.path.normpath(local_copy_download_directory + u"/" + filename + taco.constants.FILESYSTEM_WORKINPROGRESS_SUFFIX)
-                filename_complete   = os.path.normpath(local_copy_download_directory + u"/" + filename)
-                try:
-                  current_size = os.path.getsize(filename_incomplete)
-                except:
-                  current_size = 0
-                #self.set_status(str((current_size,filesize,len(self.client_downloading_pending_chunks[peer_uuid]),len(self.client_downloading_requested_chunks[peer_uuid]))))
-                if current_size == filesize and len(self.client_downloading_pending_chunks[peer_uuid]) == 0 and len(self.client_downloading_requested_chunks[peer_uuid]) == 0:
-                  self.set_status("FILE DOWNLOAD COMPLETE")
-                  if not os.path.exists(filename_complete):
-                    os.rename(filename_incomplete,filename_complete)
-                  else:
-                    (root,ext) = os.path.splitext(filename_complete)
-                    filename_complete = root + u"." + unicode(uuid.uuid4().hex) + u"." + ext
-                    os.rename(filename_incomplete,filename_complete)
-                  with taco.globals.completed_q_lock:
-                    taco.globals.completed_q.append((time.time(),peer_uuid,sharedir,filename,filesize))
-                  del taco.globals.download_q[peer_uuid][0]
-
-
-      #send out requests for downloads 
-      for peer_uuid in self.client_downloading:
-        if self.client_downloading[peer_uuid] == 0: continue
-        (sharedir,filename,filesize,filemod) = self.client_downloading[peer_uuid]
-        while len(self.client_downloading_pending_chunks[peer_uuid]) > 0 and len(self.client_downloading_requested_chunks[peer_uuid]) < taco.constants.FILESYSTEM_CREDIT_MAX: 
-          (chunk_uuid,file_offset) = self.client_downloading_pending_chunks[peer_uuid].pop()
-          self.set_status("Credits Free:" + str((sharedir,filename,filesize,filemod,chunk_uuid,file_offset)))
-          request = taco.commands.Request_Get_File_Chunk(sharedir,filename,file_offset,chunk_uuid)
-          taco.globals.Add_To_Output_Queue(peer_uuid,request,4)
-          self.client_downloading_requested_chunks[peer_uuid].append(chunk_uuid)
-          (time_request_sent,time_request_ack,offset) = self.client_downloading_status[peer_uuid][chunk_uuid]
-          self.client_downloading_status[peer_uuid][chunk_uuid] = (time.time(),0.0,offset)
+            if transfer is None:
+              self.set_status("Need to check on the file we should be downloading:" + str((peer_uuid,) + fileinfo))
+              transfer = self.start_transfer(peer_uuid,fileinfo,local_copy_download_directory)
+              if transfer is None: continue
+            if transfer.is_complete(): self.finish_transfer(transfer)
+            else: self.check_transfer(transfer)
+
+      #send out requests for downloads, a chunk at a time to each transfer in turn so they share every source's credits
+      #unless the writer is falling behind, then the data would only pile up in its queue
+      requested = not self.writer.is_backed_up()
+      while requested:
+        requested = False
+        for transfer in self.transfers.values():
+          for peer_uuid in transfer.sources.keys():
+            if self.peer_inflight.get(peer_uuid,0) >= taco.constants.FILESYSTEM_CREDIT_MAX: continue
+            chunk = transfer.request_chunk(peer_uuid)
+            if chunk is None: break
+            (chunk_uuid,request) = chunk
+            self.chunk_owners[chunk_uuid] = transfer
+            self.peer_inflight[peer_uuid] = self.peer_inflight.get(peer_uuid,0) + 1
+            taco.globals.Add_To_Output_Queue(peer_uuid,request,4)
+            requested = True
       
       #check for chunk ack
       while not self.chunk_requests_ack_queue.empty():
@@ -213,35 +501,13 @@ class TacoFilesystemManager(threading.Thread):
           (peer_uuid,chunk_uuid) = self.chunk_requests_ack_queue.get(0)
         except:
           break
-        if peer_uuid in self.client_downloading_requested_chunks and chunk_uuid in self.client_downloading_requested_chunks[peer_uuid] and peer_uuid in self.client_downloading_status:
-          (time_request_sent,time_request_ack,offset) = self.client_downloading_status[peer_uuid][chunk_uuid]
-          self.client_downloading_status[peer_uuid][chunk_uuid] = (time_request_sent,time.time(),offset)
-          self.set_status("File Chunk request has been ACK'D:" + str((peer_uuid,time_request_sent,chunk_uuid)))
+        transfer = self.chunk_owners.get(chunk_uuid)
+        if transfer is not None and chunk_uuid in transfer.requested and transfer.requested[chunk_uuid][0] == peer_uuid:
+          transfer.requested[chunk_uuid][3] = time.time()
+          self.set_status("File Chunk request has been ACK'D:" + str((peer_uuid,chunk_uuid)))
           self.sleep.set()
         else: 
-          self.set_status("File Chunk request SHOULD HAVE been ACK'D:" + str((peer_uuid,time_request_sent,chunk_uuid)))
-
-      #if chunk has not been ack'd in > x time or no data in > x time
-      #for peer_uuid in self.client_downloading_status:
-      #  download_borked = 
-      #  for chunk_uuid in self.client_downloading_status[peer_uuid]:
-      #    (time_request_sent,time_request_ack,offset) = self.client_downloading_status[peer_uuid][chunk_uuid]
-      #    if time_request_sent > 0.0 and peer_uuid in self.client_downloading:
-      #      if time_request_ack > 0.0:
-      #        download_borked=False
-      #        if abs(time.time() - time_request_ack) > taco.constants.DOWNLOAD_Q_WAIT_FOR_DATA:
-      #          download_borked = True
-      #          break
-      #  if download_borked:
-      #    self.set_status("Download Borked for: "+peer_uuid)
-      #    self.client_downloading[peer_uuid] = 0
-      
-      for peer_uuid in self.client_downloading_chunks_last_recieved:
-        if peer_uuid in self.client_downloading and self.client_downloading[peer_uuid] != 0:
-          if abs(time.time() - self.client_downloading_chunks_last_recieved[peer_uuid]) > taco.constants.DOWNLOAD_Q_WAIT_FOR_DATA:
-            self.set_status("Download Borked for: "+ peer_uuid)
-            self.client_downloading[peer_uuid] = 0
-        
+          self.set_status("File Chunk request SHOULD HAVE been ACK'D:" + str((peer_uuid,chunk_uuid)))
 
       #chunk data has been recieved
       while not self.chunk_requests_incoming_queue.empty():
@@ -250,128 +516,90 @@ class TacoFilesystemManager(threading.Thread):
           (peer_uuid,chunk_uuid,data) = self.chunk_requests_incoming_queue.get(0)
         except:
           break
-        if peer_uuid in self.client_downloading_requested_chunks and chunk_uuid in self.client_downloading_requested_chunks[peer_uuid] and peer_uuid in self.client_downloading_filename:
-          if peer_uuid in self.client_downloading and self.client_downloading[peer_uuid] == 0: continue
-          self.set_status("Chunk data has been recieved: " + str((peer_uuid,chunk_uuid,len(data))))
-          self.client_downloading_chunks_last_recieved[peer_uuid] = time.time()
-          (sharedir,filename,filesize,filemod) = self.client_downloading[peer_uuid]
-          fullpath = self.client_downloading_filename[peer_uuid]
-          if fullpath not in self.files_w.keys():
-            self.files_w[fullpath] = open(fullpath,"ab")
-          self.files_w_last_access[fullpath] = time.time()
-          self.files_w[fullpath].write(data)
-          self.files_w[fullpath].flush()
-          if self.files_w[fullpath].tell() >= filesize:
-            self.files_w[fullpath].close()
-            del self.files_w[fullpath]
-          del self.client_downloading_status[peer_uuid][chunk_uuid]
-          self.client_downloading_requested_chunks[peer_uuid].remove(chunk_uuid)
-          self.sleep.set()
-        else:
+        transfer = self.chunk_owners.get(chunk_uuid)
+        if transfer is None or not chunk_uuid in transfer.requested or transfer.requested[chunk_uuid][0] != peer_uuid:
           self.set_status("Got a chunk, but it's bogus:" + str((peer_uuid,chunk_uuid,len(data))))
+          continue
+        self.set_status("Chunk data has been recieved: " + str((peer_uuid,chunk_uuid,len(data))))
+        self.release_chunk(peer_uuid,chunk_uuid)
+        blocks = transfer.chunk_arrived(chunk_uuid,data)
+        if blocks is None:
+          self.set_status("Got a chunk of the wrong size for: " + transfer.filename + " from: " + peer_uuid,2)
+          if peer_uuid != transfer.peer_uuid: self.drop_source(transfer,peer_uuid)
+          continue
+        if len(blocks) > 0: self.writer.write(transfer.fullpath,blocks,self.durability,self.sync_bytes)
+        if transfer.is_complete(): self.finish_transfer(transfer)
+        self.sleep.set()
 
       if self.stop.is_set(): break
 
-      #chunk data has been requested 
-      if not self.chunk_requests_outgoing_queue.empty():
+      #chunk data has been requested, a bad request is skipped rather than ending the whole thread
+      while not self.chunk_requests_outgoing_queue.empty():
         if self.stop.is_set(): break
         try:
           (peer_uuid,sharedir,filename,offset,chunk_uuid) = self.chunk_requests_outgoing_queue.get(0)
         except:
           break
-        self.set_status("Need to send a chunk of data: " + str((peer_uuid,sharedir,filename,offset,chunk_uuid)))
-        rootsharename = sharedir.split(u"/")[1]
-        rootpath = os.path.normpath(u"/" + u"/".join(sharedir.split(u"/")[2:]) + u"/")
-        directory = os.path.normpath(Convert_Share_To_Path(rootsharename) + u"/" + rootpath)
-        fullpath = os.path.normpath(directory + u"/" + filename)
-        if not Is_Path_Under_A_Share(os.path.dirname(fullpath)): break
-        if not os.path.isdir(directory): break
-        if fullpath not in self.files_r.keys():
-          self.set_status("I need to open a file for reading:" + fullpath)
-          self.files_r[fullpath] = open(fullpath,"rb")
-        self.files_r_last_access[fullpath] = time.time()
-        if offset < os.path.getsize(fullpath):
-          self.files_r[fullpath].seek(offset)
-          chunk_data = self.files_r[fullpath].read(taco.constants.FILESYSTEM_CHUNK_SIZE)
-          request = taco.commands.Request_Give_File_Chunk(chunk_data,chunk_uuid)
-          taco.globals.Add_To_Output_Queue(peer_uuid,request,3)
-          self.sleep.set()
-          taco.globals.clients.sleep.set()
+        self.send_chunk(peer_uuid,sharedir,filename,offset,chunk_uuid)
 
       if self.stop.is_set(): break
             
-      if len(self.results_to_return) > 0:
-        #self.set_status("There are results that need to be sent once they are ready")
-        with self.listings_lock:
-          for [peer_uuid,sharedir,shareuuid] in self.results_to_return:
-            if sharedir in self.listings.keys():
-              self.set_status("RESULTS ready to send:" + str((sharedir,shareuuid))) 
-              request = taco.commands.Request_Share_Listing_Results(sharedir,shareuuid,self.listings[sharedir])
-              taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
-              taco.globals.clients.sleep.set()
-              self.results_to_return.remove([peer_uuid,sharedir,shareuuid])
-              self.sleep.set()
-              
-                 
-      if abs(time.time() - self.last_purge) > taco.constants.FILESYSTEM_CACHE_PURGE:
-        #self.set_status("Purging old filesystem results")
-        self.last_purge = time.time()
-        
-        for filename in self.files_r_last_access.keys():
-          if abs(time.time() - self.files_r_last_access[filename]) > taco.constants.FILESYSTEM_CACHE_TIMEOUT:
-            if filename in self.files_r.keys():
-              self.set_status("Closing a file for reading due to inactivity:" + filename)
-              self.files_r[filename].close()
-              del self.files_r[filename]
-            del self.files_r_last_access[filename]
-
-        for filename in self.files_w_last_access.keys():
-          if abs(time.time() - self.files_w_last_access[filename]) > taco.constants.FILESYSTEM_CACHE_TIMEOUT:
-            if filename in self.files_w.keys():
-              self.set_status("Closing a file for writing due to inactivity:" + filename)       
-              self.files_w[filename].close()
-              del self.files_w[filename]
-            del self.files_w_last_access[filename]
-
-        with taco.globals.share_listings_lock:
-          for iterkey in taco.globals.share_listings.keys():
-            if abs(time.time() - taco.globals.share_listings[iterkey][0]) > taco.constants.FILESYSTEM_CACHE_TIMEOUT:
-              self.set_status("Purging old local filesystem cached results")
-              del taco.globals.share_listings[iterkey]
-
-        with self.listings_lock:
-          for sharedir in self.listings.keys():
-            [thetime,dirs,files] = self.listings[sharedir]
-            if abs(time.time() - thetime) > taco.constants.FILESYSTEM_CACHE_TIMEOUT:
-              self.set_status("Purging Filesystem cache for share: " + sharedir)
-              del self.listings[sharedir]
-
-        with taco.globals.share_listings_i_care_about_lock:
-          for share_listing_uuid in taco.globals.share_listings_i_care_about.keys():
-            thetime = taco.globals.share_listings_i_care_about[share_listing_uuid]
-            if abs(time.time() - thetime) > taco.constants.FILESYSTEM_LISTING_TIMEOUT:
-              self.set_status("Purging Filesystem listing i care about for: " + share_listing_uuid)
-              del taco.globals.share_listings_i_care_about[share_listing_uuid]
+      for (timer_type,keyname) in self.timers.pop_expired():
+        if   timer_type == "closeread":    self.expire_reads()
+        elif timer_type == "listing":      self.expire_listing(keyname)
+        elif timer_type == "sharelistings":self.purge_share_listings()
+        elif timer_type == "icareabout":   self.expire_share_listing_i_care_about(keyname)
+        elif timer_type == "search":       self.expire_search(keyname)
+        elif timer_type == "summary":      self.refresh_search_summary()
+        elif timer_type == "sharetree":    self.expire_share_tree(keyname)
+        elif timer_type == "journal":      self.compact_download_journal()
+        elif timer_type == "progress":     self.publish_download_progress()
 
       with taco.globals.share_listing_requests_lock:
         for peer_uuid in taco.globals.share_listing_requests.keys():
           while not taco.globals.share_listing_requests[peer_uuid].empty():
-            (sharedir,shareuuid) = taco.globals.share_listing_requests[peer_uuid].get()
+            (sharedir,shareuuid,page,version) = taco.globals.share_listing_requests[peer_uuid].get()
             self.set_status("Filesystem thread has a pending share listing request: " + str((sharedir,shareuuid)))
             rootsharedir = os.path.normpath(sharedir)
-            rootsharename = rootsharedir.split(u"/")[1]
-            rootpath = os.path.normpath(u"/" + u"/".join(rootsharedir.split(u"/")[2:]) + u"/")
-            directory = os.path.normpath(Convert_Share_To_Path(rootsharename) + u"/" + rootpath)
-            if (Is_Path_Under_A_Share(directory) and os.path.isdir(directory)) or rootsharedir == u"/":
-              self.listing_work_queue.put(sharedir)
-              self.results_to_return.append([peer_uuid,sharedir,shareuuid])
+            resolved = taco.globals.share_table.resolve(rootsharedir)
+            if (resolved is not None and os.path.isdir(resolved[3])) or rootsharedir == u"/":
+              waiter = (peer_uuid,sharedir,shareuuid,page,version)
+              with self.listings_lock:
+                if rootsharedir in self.listings:
+                  self.send_listing(self.listings[rootsharedir],[waiter])
+                  continue
+              #one scan per directory no matter how many peers ask for it while it runs
+              if rootsharedir in self.listing_waiters:
+                self.listing_waiters[rootsharedir].append(waiter)
+              else:
+                self.listing_waiters[rootsharedir] = [waiter]
+                self.listing_work_queue.put(rootsharedir)
             else:
               self.set_status("User has requested a bogus share: " +str(sharedir))
 
+      with taco.globals.search_requests_lock:
+        for peer_uuid in taco.globals.search_requests.keys():
+          while not taco.globals.search_requests[peer_uuid].empty():
+            (query,search_uuid) = taco.globals.search_requests[peer_uuid].get()
+            self.set_status("Filesystem thread has a pending search request: " + str((query,search_uuid)))
+            self.search_work_queue.put((peer_uuid,query,search_uuid))
+
+      with taco.globals.share_tree_requests_lock:
+        for peer_uuid in taco.globals.share_tree_requests.keys():
+          while not taco.globals.share_tree_requests[peer_uuid].empty():
+            (sharedir,tree_uuid,depth,limit) = taco.globals.share_tree_requests[peer_uuid].get()
+            self.set_status("Filesystem thread has a pending share tree request: " + str((sharedir,tree_uuid,depth,limit)))
+            self.tree_work_queue.put((peer_uuid,sharedir,tree_uuid,depth,limit))
+
       while not self.listing_results_queue.empty():
         (success,thetime,sharedir,dirs,files) = self.listing_results_queue.get()
         self.set_status("Processing a worker result: " + sharedir)
-        self.add_listing(thetime,sharedir,dirs,files)
+        waiters = self.listing_waiters.pop(sharedir,[])
+        if success:
+          self.send_listing(self.add_listing(thetime,sharedir,dirs,files),waiters)
+        else:
+          #failed scans are answered with an empty listing but not cached
+          self.send_listing([thetime,dirs,files,Listing_Version(dirs,files)],waiters)
         self.sleep.set()
       
     self.set_status("Killing Workers")
@@ -379,12 +607,240 @@ class TacoFilesystemManager(threading.Thread):
       i.stop.set()
     for i in self.workers:
       i.join()
+    self.set_status("Stopping Share Watcher")
+    self.watcher.stop.set()
+    self.watcher.resync.set()
+    self.watcher.join()
+    self.set_status("Stopping Share Indexer")
+    self.indexer.stop.set()
+    self.indexer.sleep.set()
+    self.indexer.join()
+    self.index.close()
+    self.set_status("Stopping Filesystem Writer")
+    self.writer.stop.set()
+    self.writer.join()
+    self.finished_transfers()
     self.set_status("Closing Open Files")
-    for filename in self.files_r: self.files_r[filename].close()
-    for filename in self.files_w: self.files_w[filename].close()
+    self.reader.close()
     self.set_status("Filesystem Manager Exit")
 
 
+class TacoFilesystemWriter(threading.Thread):
+  #write behind for incoming chunk data, so a slow disk only ever holds up the writes themselves
+  #each file's operations happen in the order they were queued, whatever is waiting for one file goes down in as few writes as possible
+  def __init__(self):
+    threading.Thread.__init__(self)
+
+    self.stop = threading.Event()
+
+    self.status_lock = threading.Lock()
+    self.status = ""
+    self.status_time = -1
+
+    self.queue = Queue.Queue(taco.constants.FILESYSTEM_WRITE_QUEUE_SIZE)
+    self.finished_queue = Queue.Queue()
+
+    #fullpath -> [operations queued,bytes queued], a path with anything queued is not safe to stat or start over
+    self.stats_lock = threading.Lock()
+    self.pending = {}
+    self.pending_bytes = 0
+    self.errors = set()
+    self.latency = 0.0
+    self.latency_max = 0.0
+
+    #fullpath -> [file handle,last access,bytes written since the last fsync]
+    self.files = {}
+
+  def set_status(self,text,level=0):
+    if   level==1: logging.info(text)
+    elif level==0: logging.debug(text)
+    elif level==2: logging.warning(text)
+    elif level==3: logging.error(text)
+    with self.status_lock:
+      self.status = text
+      self.status_time = time.time()
+
+  def get_status(self):
+    with self.status_lock:
+      return (self.status,self.status_time)
+
+  def get_stats(self):
+    #(operations waiting,bytes waiting,smoothed write latency,recent worst write latency), latencies in seconds
+    with self.stats_lock:
+      return (self.queue.qsize(),self.pending_bytes,self.latency,self.latency_max)
+
+  def enqueue(self,fullpath,size,operation):
+    with self.stats_lock:
+      if not fullpath in self.pending: self.pending[fullpath] = [0,0]
+      self.pending[fullpath][0] += 1
+      self.pending[fullpath][1] += size
+      self.pending_bytes += size
+    self.queue.put(operation)
+
+  def done(self,fullpath,size):
+    with self.stats_lock:
+      self.pending[fullpath][0] -= 1
+      self.pending[fullpath][1] -= size
+      self.pending_bytes -= size
+      if self.pending[fullpath][0] == 0: del self.pending[fullpath]
+
+  def write(self,fullpath,blocks,durability,sync_bytes):
+    size = sum([len(block) for block in blocks])
+    self.enqueue(fullpath,size,("write",fullpath,blocks,size,durability,sync_bytes))
+
+  def finish(self,fullpath,tid,durability):
+    #the result comes back on finished_queue as (tid,completed filename or None)
+    self.enqueue(fullpath,0,("finish",fullpath,tid,durability))
+
+  def discard(self,fullpath):
+    self.enqueue(fullpath,0,("discard",fullpath))
+
+  def is_busy(self,fullpath):
+    with self.stats_lock:
+      return fullpath in self.pending
+
+  def is_backed_up(self):
+    return self.queue.qsize() >= taco.constants.FILESYSTEM_WRITE_QUEUE_SIZE / 2
+
+  def take_error(self,fullpath):
+    #True once for a path whose write failed, everything queued for it after the failure was thrown away
+    with self.stats_lock:
+      if not fullpath in self.errors: return False
+      self.errors.remove(fullpath)
+      return True
+
+  def close_file(self,fullpath,sync):
+    if not fullpath in self.files: return
+    (handle,last_access,unsynced) = self.files.pop(fullpath)
+    handle.flush()
+    if sync and unsynced > 0: os.fsync(handle.fileno())
+    handle.close()
+
+  def close_idle(self):
+    for fullpath in self.files.keys():
+      if abs(time.time() - self.files[fullpath][1]) > taco.constants.FILESYSTEM_CACHE_TIMEOUT:
+        self.set_status("Closing a file due to inactivity:" + fullpath)
+        self.close_file(fullpath,False)
+
+  def write_blocks(self,fullpath,blocks,durability,sync_bytes):
+    with self.stats_lock:
+      failed = fullpath in self.errors
+    if failed: return
+    start = time.time()
+    try:
+      if not fullpath in self.files: self.files[fullpath] = [open(fullpath,"ab"),0.0,0]
+      entry = self.files[fullpath]
+      batch = []
+      batch_size = 0
+      for block in blocks:
+        batch.append(block)
+        batch_size += len(block)
+        if batch_size >= taco.constants.FILESYSTEM_WRITE_COALESCE:
+          entry[0].write("".join(batch))
+          batch = []
+          batch_size = 0
+      if batch_size > 0: entry[0].write("".join(batch))
+      entry[0].flush()
+      entry[1] = time.time()
+      entry[2] += sum([len(block) for block in blocks])
+      if durability == "interval" and entry[2] >= sync_bytes:
+        os.fsync(entry[0].fileno())
+        entry[2] = 0
+    except Exception,e:
+      self.set_status("Writing to: " + fullpath + " failed, the download will start over from what is on disk: " + str(e),3)
+      try:
+        self.close_file(fullpath,False)
+      except:
+        if fullpath in self.files: del self.files[fullpath]
+      with self.stats_lock:
+        self.errors.add(fullpath)
+      return
+    elapsed = time.time() - start
+    with self.stats_lock:
+      self.latency += (elapsed - self.latency) * taco.constants.FILESYSTEM_WRITE_LATENCY_SMOOTHING
+      self.latency_max = max(self.latency_max * (1.0 - taco.constants.FILESYSTEM_WRITE_LATENCY_SMOOTHING),elapsed)
+
+  def finish_file(self,fullpath,tid,durability):
+    filename_complete = None
+    with self.stats_lock:
+      failed = fullpath in self.errors
+    if not failed:
+      try:
+        self.close_file(fullpath,durability != "flush")
+        filename_complete = fullpath[:-len(taco.constants.FILESYSTEM_WORKINPROGRESS_SUFFIX)]
+        if not os.path.exists(fullpath): open(fullpath,"ab").close()
+        if os.path.exists(filename_complete):
+          (root,ext) = os.path.splitext(filename_complete)
+          filename_complete = root + u"." + unicode(uuid.uuid4().hex) + u"." + ext
+        os.rename(fullpath,filename_complete)
+      except Exception,e:
+        self.set_status("Could not finish the download: " + fullpath + " " + str(e),3)
+        filename_complete = None
+    self.finished_queue.put((tid,filename_complete))
+
+  def discard_file(self,fullpath):
+    self.close_file(fullpath,False)
+    with self.stats_lock:
+      if fullpath in self.errors: self.errors.remove(fullpath)
+    try:
+      os.remove(fullpath)
+    except:
+      self.set_status("Could not remove: " + fullpath,2)
+
+  def flush_batch(self,batches,fullpath):
+    if not fullpath in batches: return
+    (blocks,size,durability,sync_bytes) = batches.pop(fullpath)
+    self.write_blocks(fullpath,blocks,durability,sync_bytes)
+    self.done(fullpath,size)
+
+  def process(self,operations):
+    #writes for one file are gathered up until something else has to happen to that file, or there is nothing left waiting
+    batches = OrderedDict()
+    for operation in operations:
+      fullpath = operation[1]
+      if operation[0] == "write":
+        (blocks,size,durability,sync_bytes) = operation[2:]
+        if fullpath in batches:
+          batches[fullpath][0].extend(blocks)
+          batches[fullpath][1] += size
+          batches[fullpath][2:] = [durability,sync_bytes]
+          #the first of the merged operations is done, the batch carries the rest
+          self.done(fullpath,0)
+        else:
+          batches[fullpath] = [list(blocks),size,durability,sync_bytes]
+        continue
+      self.flush_batch(batches,fullpath)
+      if operation[0] == "finish":    self.finish_file(fullpath,operation[2],operation[3])
+      elif operation[0] == "discard": self.discard_file(fullpath)
+      self.done(fullpath,0)
+    for fullpath in batches.keys(): self.flush_batch(batches,fullpath)
+
+  def take_operations(self,block):
+    operations = []
+    try:
+      operations.append(self.queue.get(block,1.0))
+      while len(operations) < taco.constants.FILESYSTEM_WRITE_QUEUE_SIZE: operations.append(self.queue.get(False))
+    except Queue.Empty:
+      pass
+    return operations
+
+  def run(self):
+    self.set_status("Starting Up Filesystem Writer")
+    while not self.stop.is_set():
+      operations = self.take_operations(True)
+      if len(operations) > 0:
+        self.process(operations)
+        (depth,pending_bytes,latency,latency_max) = self.get_stats()
+        self.set_status("Wrote " + str(len(operations)) + " operations, " + str(depth) + " waiting, " + str(round(latency * 1000,1)) + "ms per write")
+      self.close_idle()
+    #the manager has stopped queueing by now, everything it did queue still goes to disk
+    operations = self.take_operations(False)
+    while len(operations) > 0:
+      self.process(operations)
+      operations = self.take_operations(False)
+    for fullpath in self.files.keys(): self.close_file(fullpath,True)
+    self.set_status("Filesystem Writer Exit")
+
 class TacoFilesystemWorker(threading.Thread):
   def __init__(self,worker_id):
     threading.Thread.__init__(self)
@@ -410,53 +866,80 @@ class TacoFilesystemWorker(threading.Thread):
     with self.status_lock:
       return (self.status,self.status_time)
 
+  def search(self,peer_uuid,query,search_uuid):
+    #results go back in batches so the requester can show them while the rest are still on the wire
+    self.set_status("Filesystem Worker #" + str(self.worker_id) + " -- Search for: " + query)
+    try:
+      results = taco.globals.filesys.index.search(query,taco.constants.SEARCH_MAX_RESULTS)
+    except Exception,e:
+      self.set_status("Filesystem Worker #" + str(self.worker_id) + " -- Search failed: " + str(e),2)
+      results = []
+    for offset in range(0,max(len(results),1),taco.constants.SEARCH_RESULTS_BATCH):
+      batch = results[offset:offset + taco.constants.SEARCH_RESULTS_BATCH]
+      done = int(offset + taco.constants.SEARCH_RESULTS_BATCH >= len(results))
+      request = taco.commands.Request_Search_Results(search_uuid,batch,done)
+      taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
+    taco.globals.clients.sleep.set()
+
+  def share_tree(self,peer_uuid,sharedir,tree_uuid,depth,limit):
+    #every file below a directory, flattened and streamed back in batches like search results
+    self.set_status("Filesystem Worker #" + str(self.worker_id) + " -- Share tree for: " + sharedir)
+    resolved = taco.globals.share_table.resolve(sharedir)
+    (files,truncated) = ([],False)
+    if resolved is not None and os.path.isdir(resolved[3]):
+      (sharename,sharepath,relpath,directory) = resolved
+      try:
+        (files,truncated) = taco.globals.filesys.index.get_tree(sharename,sharepath,relpath,depth,limit)
+      except Exception,e:
+        self.set_status("Filesystem Worker #" + str(self.worker_id) + " -- Share tree failed: " + str(e),2)
+    else:
+      self.set_status("User has requested a bogus share tree: " + sharedir)
+    for offset in range(0,max(len(files),1),taco.constants.FILESYSTEM_TREE_BATCH):
+      batch = files[offset:offset + taco.constants.FILESYSTEM_TREE_BATCH]
+      done = int(offset + taco.constants.FILESYSTEM_TREE_BATCH >= len(files))
+      request = taco.commands.Request_Share_Tree_Results(tree_uuid,batch,done,int(truncated))
+      taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
+    taco.globals.clients.sleep.set()
+
   def run(self):
     self.set_status("Starting Filesystem Worker #" + str(self.worker_id))
     while not self.stop.is_set():
+      try:
+        (peer_uuid,query,search_uuid) = taco.globals.filesys.search_work_queue.get(0)
+        self.search(peer_uuid,query,search_uuid)
+      except Queue.Empty:
+        pass
+      try:
+        (peer_uuid,sharedir,tree_uuid,depth,limit) = taco.globals.filesys.tree_work_queue.get(0)
+        self.share_tree(peer_uuid,sharedir,tree_uuid,depth,limit)
+      except Queue.Empty:
+        pass
       try:
         rootsharedir = taco.globals.filesys.listing_work_queue.get(True,0.2)
         self.set_status(str(self.worker_id) + " -- " + str(rootsharedir))
-        rootsharedir = os.path.normpath(rootsharedir)
-        rootsharename = rootsharedir.split(u"/")[1]
-        rootpath = os.path.normpath(u"/" + u"/".join(rootsharedir.split(u"/")[2:]) + u"/")
-        directory = os.path.normpath(Convert_Share_To_Path(rootsharename) + u"/" + rootpath)
-        if rootsharedir == u"/":
+        if os.path.normpath(rootsharedir) == u"/":
           self.set_status("Root share listing request")
-          share_listing = []
-          with taco.globals.settings_lock:
-            for [sharename,sharepath] in taco.globals.settings["Shares"]:
-              share_listing.append(sharename)
-          share_listing.sort()
-          results = [1,time.time(),rootsharedir,share_listing,[]]
+          results = [1,time.time(),rootsharedir,list(taco.globals.share_table.names),[]]
           taco.globals.filesys.listing_results_queue.put(results)
           continue  
-        assert Is_Path_Under_A_Share(directory)
+        resolved = taco.globals.share_table.resolve(rootsharedir)
+        assert resolved is not None
+        (sharename,sharepath,relpath,directory) = resolved
         assert os.path.isdir(directory)
+      except Queue.Empty:
+        continue
       except:
+        #still report back so nobody is left waiting on this directory
+        taco.globals.filesys.listing_results_queue.put([0,time.time(),rootsharedir,[],[]])
+        taco.globals.filesys.sleep.set()
         continue
       self.set_status("Filesystem Worker #" + str(self.worker_id) + " -- Get Directory Listing for: " + directory)
 
-      dirs = []
-      files = []
-      try:
-        dirlist = os.listdir(directory)
-      except:
-        results = [0,time.time(),rootsharedir,[],[]]
-
       try:
-        for fileobject in dirlist:
-          joined = os.path.normpath(directory + u"/" + fileobject)
-          if os.path.isfile(joined):
-            filemod = os.stat(joined).st_mtime
-            filesize = os.path.getsize(joined)
-            files.append((fileobject,filesize,filemod))
-          elif os.path.isdir(joined):
-            dirs.append(fileobject)
-        dirs.sort()
-        files.sort()
+        (dirs,files) = taco.globals.filesys.index.get_listing(sharename,sharepath,relpath)
         results = [1,time.time(),rootsharedir,dirs,files]
       except Exception,e:
-        print str(e)
+        self.set_status("Filesystem Worker #" + str(self.worker_id) + " -- Listing failed: " + str(e),2)
         results = [0,time.time(),rootsharedir,[],[]]
 
       taco.globals.filesys.listing_results_queue.put(results)
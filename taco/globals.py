@@ -1,12 +1,19 @@
 import threading
 import taco.constants
+import taco.listingcache
+import taco.journal
+import taco.sharetable
 import logging
 import os
 import uuid
 import Queue
+import time
+from collections import deque
 
 settings_lock  = threading.Lock()
 settings = {}
+#rebuilt from settings["Shares"] by Load_Settings, swapped in whole so readers need no lock
+share_table = taco.sharetable.ShareTable([])
 
 chat_log = []
 chat_log_lock = threading.Lock()
@@ -14,6 +21,15 @@ chat_log_lock = threading.Lock()
 chat_uuid = uuid.uuid4().hex
 chat_uuid_lock = threading.Lock()
 
+rollcall_cache_lock = threading.Lock()
+rollcall_cache_version = int(time.time() * 1000)
+rollcall_cache_expires = 0
+rollcall_cache_content = None
+rollcall_cache_summary = -1
+rollcall_cache_reply = ""
+rollcall_cache_legacy_reply = ""
+rollcall_cache_unchanged_reply = ""
+
 stop = threading.Event()
 
 public_keys_lock = threading.Lock()
@@ -25,14 +41,38 @@ share_listings_i_care_about_lock = threading.Lock()
 share_listing_requests_lock = threading.Lock()
 share_listing_requests = {}
 
-share_listings = {}
-share_listings_lock = threading.Lock()
+share_listings = taco.listingcache.ListingCache()
+
+search_requests_lock = threading.Lock()
+search_requests = {}
+
+search_results = {}
+search_results_lock = threading.Lock()
+
+share_tree_requests_lock = threading.Lock()
+share_tree_requests = {}
+
+share_trees = {}
+share_trees_lock = threading.Lock()
 
+peer_summaries = {}
+peer_summaries_requested = {}
+peer_summaries_lock = threading.Lock()
+
+#peer_uuid -> taco.downloadqueue.PeerQueue of (sharedir,filename,filesize,filemod)
 download_q = {}
 download_q_lock = threading.Lock()
-
-completed_q = []
+download_q_sequence = 0
+#bumped on every change to download_q, the filesystem thread republishes download_q_snapshot when it moves
+download_q_version = 0
+#({peer_uuid: [fileinfo,...]},{peer_uuid: [priority,...]},{peer_uuid: {index into the fileinfo list: [bytes done,bytes per second,seconds left or -1]}})
+#swapped in whole by the filesystem thread so readers need no lock, and the progress always indexes the listing it came with
+download_q_snapshot = ({},{},{})
+
+completed_q = deque(maxlen=taco.constants.COMPLETED_Q_MAX)
 completed_q_lock = threading.Lock()
+#replayed into download_q and completed_q at startup by taco.downloads.Restore_Download_Queue
+download_journal = taco.journal.Journal()
 
 upload_q = {}
 upload_q_lock = threading.Lock()
@@ -50,63 +90,105 @@ medium_priority_output_queue = {}
 low_priority_output_queue = {}
 file_request_output_queue = {}
 
+parked_output_queue_lock = threading.Lock()
+parked_output_queue = {}
+parked_output_queue_bytes = {}
+parked_output_queue_expires = {}
+
+def Output_Queue_Lanes():
+  return [(1,high_priority_output_queue_lock,high_priority_output_queue),(2,medium_priority_output_queue_lock,medium_priority_output_queue),(3,low_priority_output_queue_lock,low_priority_output_queue),(4,file_request_output_queue_lock,file_request_output_queue)]
+
+def Park_Message(peer_uuid,msg,priority,prepend=False):
+  #caller must hold parked_output_queue_lock
+  item = (time.time() + taco.constants.OUTPUT_QUEUE_PARK_TTL,msg)
+  if prepend: parked_output_queue[peer_uuid][priority-1].appendleft(item)
+  else:       parked_output_queue[peer_uuid][priority-1].append(item)
+  parked_output_queue_bytes[peer_uuid] += len(msg)
+  for lane in taco.constants.OUTPUT_QUEUE_PARK_DROP_ORDER:
+    while parked_output_queue_bytes[peer_uuid] > taco.constants.OUTPUT_QUEUE_PARK_MAX_BYTES and len(parked_output_queue[peer_uuid][lane-1]) > 0:
+      (expires,dropped) = parked_output_queue[peer_uuid][lane-1].popleft()
+      parked_output_queue_bytes[peer_uuid] -= len(dropped)
+
+def Park_Output_Queues(peer_uuid):
+  logging.debug("Parking output qs for: " + peer_uuid)
+  with parked_output_queue_lock:
+    if not peer_uuid in parked_output_queue:
+      parked_output_queue[peer_uuid] = [deque(),deque(),deque(),deque()]
+      parked_output_queue_bytes[peer_uuid] = 0
+    parked_output_queue_expires[peer_uuid] = time.time() + taco.constants.OUTPUT_QUEUE_PARK_TTL
+  for (priority,lane_lock,lane) in Output_Queue_Lanes():
+    with lane_lock:
+      if not peer_uuid in lane: continue
+      pending = []
+      while not lane[peer_uuid].empty(): pending.append(lane[peer_uuid].get())
+      with parked_output_queue_lock:
+        for msg in reversed(pending): Park_Message(peer_uuid,msg,priority,True)
+      del lane[peer_uuid]
+
+def Restore_Output_Queues(peer_uuid):
+  replayed = 0
+  expired  = 0
+  for (priority,lane_lock,lane) in Output_Queue_Lanes():
+    with lane_lock:
+      lane[peer_uuid] = Queue.Queue()
+      with parked_output_queue_lock:
+        if not peer_uuid in parked_output_queue: continue
+        for (expires,msg) in parked_output_queue[peer_uuid][priority-1]:
+          if expires > time.time():
+            lane[peer_uuid].put(msg)
+            replayed += 1
+          else:
+            expired += 1
+        parked_output_queue[peer_uuid][priority-1].clear()
+  with parked_output_queue_lock:
+    if peer_uuid in parked_output_queue:
+      del parked_output_queue[peer_uuid]
+      del parked_output_queue_bytes[peer_uuid]
+      del parked_output_queue_expires[peer_uuid]
+  if replayed > 0 or expired > 0:
+    logging.info("Restored parked output qs for: " + peer_uuid + " -- replayed: " + str(replayed) + " expired: " + str(expired))
+
+def Purge_Parked_Output_Queues():
+  with parked_output_queue_lock:
+    for peer_uuid in parked_output_queue.keys():
+      for parked_lane in parked_output_queue[peer_uuid]:
+        while len(parked_lane) > 0 and parked_lane[0][0] <= time.time():
+          (expires,msg) = parked_lane.popleft()
+          parked_output_queue_bytes[peer_uuid] -= len(msg)
+      if parked_output_queue_expires[peer_uuid] <= time.time() and sum([len(parked_lane) for parked_lane in parked_output_queue[peer_uuid]]) == 0:
+        logging.debug("Parked output qs have expired for: " + peer_uuid)
+        del parked_output_queue[peer_uuid]
+        del parked_output_queue_bytes[peer_uuid]
+        del parked_output_queue_expires[peer_uuid]
+
 def Add_To_Output_Queue(peer_uuid,msg,priority=3):
   logging.debug("Add to "+ peer_uuid+" output q @ " + str(priority))
-  if priority==1:
-    with high_priority_output_queue_lock:
-      if peer_uuid in high_priority_output_queue:
-        high_priority_output_queue[peer_uuid].put(msg)
-        taco.globals.clients.sleep.set()
-        return 1
-  elif priority==2:
-    with medium_priority_output_queue_lock:
-      if peer_uuid in medium_priority_output_queue:
-        medium_priority_output_queue[peer_uuid].put(msg)
-        taco.globals.clients.sleep.set()
-        return 1
-  elif priority==3:
-    with low_priority_output_queue_lock:
-      if peer_uuid in low_priority_output_queue:
-        low_priority_output_queue[peer_uuid].put(msg)
-        taco.globals.clients.sleep.set()
-        return 1
-  else:
-    with file_request_output_queue_lock:
-      if peer_uuid in file_request_output_queue:
-        file_request_output_queue[peer_uuid].put(msg)
-        taco.globals.clients.sleep.set()
+  if priority not in (1,2,3): priority = 4
+  (priority,lane_lock,lane) = Output_Queue_Lanes()[priority-1]
+  with lane_lock:
+    if peer_uuid in lane:
+      lane[peer_uuid].put(msg)
+      taco.globals.clients.sleep.set()
+      return 1
+    with parked_output_queue_lock:
+      if peer_uuid in parked_output_queue:
+        Park_Message(peer_uuid,msg,priority)
         return 1
 
   return 0
 
 def Add_To_All_Output_Queues(msg,priority=3):
   logging.debug("Add to ALL output q @ " + str(priority))
-  if priority==1:
-    with high_priority_output_queue_lock:
-      for keyname in high_priority_output_queue:
-        high_priority_output_queue[keyname].put(msg)
-        taco.globals.clients.sleep.set()
-      return 1
-  elif priority==2:
-    with medium_priority_output_queue_lock:
-      for keyname in medium_priority_output_queue:
-        medium_priority_output_queue[keyname].put(msg)
-        taco.globals.clients.sleep.set()
-      return 1
-  elif priority==3:
-    with low_priority_output_queue_lock:
-      for keyname in low_priority_output_queue:
-        low_priority_output_queue[keyname].put(msg)
-        taco.globals.clients.sleep.set()
-      return 1
-  else:
-    with file_request_output_queue_lock:
-      for keyname in file_request_output_queue:
-        file_request_output_queue[keyname].put(msg)
-        taco.globals.clients.sleep.set()
-        return 1
-
-  return 0
+  if priority not in (1,2,3): priority = 4
+  (priority,lane_lock,lane) = Output_Queue_Lanes()[priority-1]
+  with lane_lock:
+    for keyname in lane:
+      lane[keyname].put(msg)
+    with parked_output_queue_lock:
+      for keyname in parked_output_queue:
+        Park_Message(keyname,msg,priority)
+  taco.globals.clients.sleep.set()
+  return 1
 
 
 
@@ -124,6 +206,7 @@ def properexit(signum, frame):
   server.join()
   clients.join()
   filesys.join()
+  download_journal.close()
   logging.info("Dispatcher Stopped Successfully")
   logging.info("Clean Exit")
   os._exit(3)
@@ -0,0 +1,109 @@
+import os
+import zlib
+import struct
+import logging
+import threading
+import msgpack
+
+RECORD_HEADER = struct.Struct("<II")
+
+class Journal(object):
+  #append only log of msgpack records, each framed by its length and crc32
+  #a crash can only ever tear the last record, replay stops there and cuts it off
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.path = None
+    self.handle = None
+    self.records = 0
+    self.dirty = False
+    #frames appended since begin_rewrite(), they go onto the end of the rewritten journal
+    self.capture = None
+
+  def open(self,path):
+    #returns every intact record in the journal, and leaves it open for appending
+    records = []
+    good = 0
+    try:
+      data = open(path,"rb").read()
+    except IOError:
+      data = ""
+    while good + RECORD_HEADER.size <= len(data):
+      (length,crc) = RECORD_HEADER.unpack_from(data,good)
+      start = good + RECORD_HEADER.size
+      payload = data[start:start + length]
+      if len(payload) != length or zlib.crc32(payload) & 0xffffffff != crc: break
+      try:
+        records.append(msgpack.unpackb(payload))
+      except:
+        break
+      good = start + length
+    if good != len(data): logging.warning("Dropping " + str(len(data) - good) + " bytes of torn journal records from: " + path)
+    with self.lock:
+      self.path = path
+      self.handle = open(path,"ab")
+      if good != len(data): self.handle.truncate(good)
+      self.records = len(records)
+    return records
+
+  def frame(self,record):
+    payload = msgpack.packb(record)
+    return RECORD_HEADER.pack(len(payload),zlib.crc32(payload) & 0xffffffff) + payload
+
+  def append(self,record):
+    self.append_many([record])
+
+  def append_many(self,records):
+    #written through to the os straight away in one write, fsync is left to sync() so a busy queue is not waiting on the disk
+    if len(records) == 0: return
+    data = "".join([self.frame(record) for record in records])
+    with self.lock:
+      if self.handle is None: return
+      self.handle.write(data)
+      self.handle.flush()
+      self.records += len(records)
+      self.dirty = True
+      if self.capture is not None: self.capture.append((data,len(records)))
+
+  def sync(self):
+    with self.lock:
+      if self.handle is None or not self.dirty: return
+      os.fsync(self.handle.fileno())
+      self.dirty = False
+
+  def begin_rewrite(self):
+    #call while whatever the snapshot for rewrite() is taken from cannot change, every append after this survives the rewrite
+    with self.lock:
+      self.capture = []
+
+  def rewrite(self,records):
+    #replaces the journal with the records given plus whatever was appended since begin_rewrite()
+    #the snapshot goes to disk without the lock, appends carry on meanwhile, and a temporary file means a crash leaves one journal or the other
+    if self.handle is None: return
+    temp = self.path + ".tmp"
+    output = open(temp,"wb")
+    output.write("".join([self.frame(record) for record in records]))
+    output.flush()
+    with self.lock:
+      captured = self.capture or []
+      self.capture = None
+      if self.handle is None:
+        output.close()
+        return
+      output.write("".join([data for (data,count) in captured]))
+      output.flush()
+      os.fsync(output.fileno())
+      output.close()
+      self.handle.close()
+      if os.name=='nt' and os.path.exists(self.path): os.remove(self.path)
+      os.rename(temp,self.path)
+      self.handle = open(self.path,"ab")
+      self.records = len(records) + sum([count for (data,count) in captured])
+      self.dirty = False
+
+  def close(self):
+    with self.lock:
+      if self.handle is None: return
+      self.handle.flush()
+      os.fsync(self.handle.fileno())
+      self.handle.close()
+      self.handle = None
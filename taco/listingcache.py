@@ -0,0 +1,72 @@
+import time
+import threading
+import msgpack
+from collections import OrderedDict
+import taco.constants
+
+class ListingCache(object):
+  #remote share listings keyed by (peer_uuid,sharedir,page key), least recently used first
+  #stale entries are still served, the caller revalidates them with a conditional request
+  def __init__(self,max_bytes=taco.constants.LISTING_CACHE_MAX_BYTES,max_entries=taco.constants.LISTING_CACHE_MAX_ENTRIES):
+    self.lock = threading.Lock()
+    self.entries = OrderedDict()
+    self.pending = {}
+    self.bytes = 0
+    self.max_bytes = max_bytes
+    self.max_entries = max_entries
+
+  def __len__(self):
+    with self.lock:
+      return len(self.entries)
+
+  def get(self,key):
+    #returns (results,total,version,age) or None
+    with self.lock:
+      if not key in self.entries: return None
+      entry = self.entries.pop(key)
+      self.entries[key] = entry
+      (fetched,results,total,version,size) = entry
+      return (results,total,version,abs(time.time() - fetched))
+
+  def get_version(self,key):
+    with self.lock:
+      if not key in self.entries: return None
+      return self.entries[key][3]
+
+  def set(self,key,results,total,version):
+    size = len(msgpack.packb(results))
+    with self.lock:
+      if key in self.pending: del self.pending[key]
+      if key in self.entries: self.bytes -= self.entries.pop(key)[4]
+      if size > self.max_bytes: return
+      self.entries[key] = [time.time(),results,total,version,size]
+      self.bytes += size
+      while self.bytes > self.max_bytes or len(self.entries) > self.max_entries:
+        (oldkey,oldentry) = self.entries.popitem(False)
+        self.bytes -= oldentry[4]
+
+  def touch(self,key,version):
+    #a not modified reply, returns False when the entry it refers to is gone
+    with self.lock:
+      if key in self.pending: del self.pending[key]
+      if not key in self.entries or self.entries[key][3] != version: return False
+      entry = self.entries.pop(key)
+      entry[0] = time.time()
+      self.entries[key] = entry
+      return True
+
+  def claim_refresh(self,key,force=False):
+    #True when the caller should send a request: the entry is missing or stale and nobody has asked for it recently
+    with self.lock:
+      if key in self.pending and abs(time.time() - self.pending[key]) < taco.constants.LISTING_CACHE_PENDING_TIMEOUT: return False
+      if not force and key in self.entries and abs(time.time() - self.entries[key][0]) < taco.constants.FILESYSTEM_CACHE_TIMEOUT: return False
+      self.pending[key] = time.time()
+      return True
+
+  def purge(self):
+    with self.lock:
+      for key in self.pending.keys():
+        if abs(time.time() - self.pending[key]) > taco.constants.LISTING_CACHE_PENDING_TIMEOUT: del self.pending[key]
+      for key in self.entries.keys():
+        if abs(time.time() - self.entries[key][0]) > taco.constants.LISTING_CACHE_MAX_AGE:
+          self.bytes -= self.entries.pop(key)[4]
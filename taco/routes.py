@@ -4,6 +4,7 @@ import taco.globals
 import taco.constants
 import taco.filesystem
 import taco.commands
+import taco.downloads
 import urllib
 import re,time
 import os,uuid
@@ -56,6 +57,12 @@ def index():
     (output["threads"]["server"]["status"],output["threads"]["server"]["lastupdate"]) = taco.globals.server.get_status()
     output["threads"]["server"]["lastupdate"] = abs(time.time() - float(output["threads"]["server"]["lastupdate"]))
 
+    output["threads"]["writer"] = {}
+    output["threads"]["writer"]["alive"] = taco.globals.filesys.writer.is_alive()
+    (output["threads"]["writer"]["status"],output["threads"]["writer"]["lastupdate"]) = taco.globals.filesys.writer.get_status()
+    output["threads"]["writer"]["lastupdate"] = abs(time.time() - float(output["threads"]["writer"]["lastupdate"]))
+    (output["threads"]["writer"]["depth"],output["threads"]["writer"]["bytes"],output["threads"]["writer"]["latency"],output["threads"]["writer"]["latencymax"]) = taco.globals.filesys.writer.get_stats()
+
     return json.dumps(output)
 
   if bottle.request.json[u"action"] == u"speed":
@@ -76,12 +83,33 @@ def index():
 
       with taco.globals.download_q_lock:
         logging.debug("Adding File to Download Q:" + str((peer_uuid,sharedir,filename,filesize,filemod)))
-        if not peer_uuid in taco.globals.download_q: taco.globals.download_q[peer_uuid] = []
-        if (sharedir,filename,filesize,filemod) not in taco.globals.download_q[peer_uuid]:
-          taco.globals.download_q[peer_uuid].append((sharedir,filename,filesize,filemod))
+        if taco.downloads.Queue_Download(peer_uuid,(sharedir,filename,filesize,filemod)):
           return "1"
         return "2"
 
+  if bottle.request.json[u"action"] == u"downloaddir":
+    if type(bottle.request.json[u"data"]) == type({}):
+      try:
+        peer_uuid = bottle.request.json[u"data"][u"uuid"]
+        sharedir = bottle.request.json[u"data"][u"sharedir"]
+      except:
+        return "-1"
+      tree_uuid = uuid.uuid4().hex
+      logging.info("Queueing every file below: " + sharedir + " from: " + peer_uuid)
+      request = taco.commands.Request_Share_Tree(peer_uuid,sharedir,tree_uuid,True)
+      taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
+      taco.globals.clients.sleep.set()
+      return json.dumps({"sharedir":sharedir,"result":tree_uuid})
+
+  if bottle.request.json[u"action"] == u"sharetreeresult":
+    output = {}
+    if type(bottle.request.json[u"data"]) == type({}) and u"uuid" in bottle.request.json[u"data"]:
+      with taco.globals.share_trees_lock:
+        if bottle.request.json[u"data"][u"uuid"] in taco.globals.share_trees:
+          (thetime,peer_uuid,sharedir,enqueue,done,truncated,files) = taco.globals.share_trees[bottle.request.json[u"data"][u"uuid"]]
+          output = {"sharedir":sharedir,"done":done,"truncated":truncated,"count":len(files)}
+    return json.dumps(output)
+
   if bottle.request.json[u"action"] == u"downloadqremove":
     if type(bottle.request.json[u"data"]) == type({}):
       try:
@@ -96,11 +124,7 @@ def index():
       with taco.globals.download_q_lock:
         logging.debug("Removing File to Download Q:" + str((peer_uuid,sharedir,filename,filesize,filemod)))
         if peer_uuid in taco.globals.download_q:
-          #logging.debug(str(((sharedir,filename,filesize,filemod))))
-          #logging.debug(str(taco.globals.download_q[peer_uuid]))
-          while (sharedir,filename,filesize,filemod) in taco.globals.download_q[peer_uuid]:
-            taco.globals.download_q[peer_uuid].remove((sharedir,filename,filesize,filemod))
-          #if len(taco.globals.download_q[peer_uuid]) == 0: del taco.globals.download_q[peer_uuid]
+          taco.downloads.Unqueue_Download(peer_uuid,(sharedir,filename,filesize,filemod))
           return "1"
         return "2"
 
@@ -117,38 +141,51 @@ def index():
         return "-1"
     with taco.globals.download_q_lock:
       logging.debug("Moving File in Download Q:" + str((peer_uuid,sharedir,filename,filesize,filemod,newloc)))
-      if peer_uuid in taco.globals.download_q:
-        while (sharedir,filename,filesize,filemod) in taco.globals.download_q[peer_uuid]:
-          taco.globals.download_q[peer_uuid].remove((sharedir,filename,filesize,filemod))
-        taco.globals.download_q[peer_uuid].insert(min(newloc,len(taco.globals.download_q[peer_uuid])),((sharedir,filename,filesize,filemod)))
+      if taco.downloads.Move_Download(peer_uuid,(sharedir,filename,filesize,filemod),newloc):
         return "1"
       return "2"
 
+  if bottle.request.json[u"action"] == u"downloadqpriority":
+    if type(bottle.request.json[u"data"]) == type({}):
+      try:
+        peer_uuid = bottle.request.json[u"data"][u"uuid"]
+        sharedir = bottle.request.json[u"data"][u"sharedir"]
+        filename = bottle.request.json[u"data"][u"filename"]
+        filesize = int(bottle.request.json[u"data"][u"filesize"])
+        filemod = float(bottle.request.json[u"data"][u"filemodtime"])
+        priority = int(bottle.request.json[u"data"][u"priority"])
+        assert priority in (taco.constants.DOWNLOAD_PRIORITY_HIGH,taco.constants.DOWNLOAD_PRIORITY_NORMAL,taco.constants.DOWNLOAD_PRIORITY_LOW)
+      except:
+        return "-1"
+      with taco.globals.download_q_lock:
+        logging.debug("Setting Priority in Download Q:" + str((peer_uuid,sharedir,filename,filesize,filemod,priority)))
+        if taco.downloads.Set_Download_Priority(peer_uuid,(sharedir,filename,filesize,filemod),priority):
+          return "1"
+        return "2"
+
   if bottle.request.json[u"action"] == u"downloadqget":
     output = {}
+    peerinfo = {}
     with taco.globals.settings_lock:
-      local_copy_download_directory = os.path.normpath(taco.globals.settings["Download Location"])
-      with taco.globals.download_q_lock:
-        peerinfo = {}
-        fileinfo = defaultdict(dict)
-        for peer_uuid in taco.globals.settings["Peers"]:
-          try:
-            peerinfo[peer_uuid] = [taco.globals.settings["Peers"][peer_uuid]["nickname"],taco.globals.settings["Peers"][peer_uuid]["localnick"]]
-          except:
-            peerinfo[peer_uuid] = [u"Unknown Nickname",u""]
-        for peer_uuid in taco.globals.download_q:
-          for (sharedir,filename,filesize,modtime) in taco.globals.download_q[peer_uuid]:
-            filename_incomplete = os.path.normpath(local_copy_download_directory + u"/" + filename + taco.constants.FILESYSTEM_WORKINPROGRESS_SUFFIX)
-            try:
-              current_size = os.path.getsize(filename_incomplete)
-            except:
-              current_size = 0
-            fileinfo[peer_uuid][filename] = current_size
-        output = {"result":taco.globals.download_q,"peerinfo":peerinfo,"fileinfo":fileinfo}
+      for peer_uuid in taco.globals.settings["Peers"]:
+        try:
+          peerinfo[peer_uuid] = [taco.globals.settings["Peers"][peer_uuid]["nickname"],taco.globals.settings["Peers"][peer_uuid]["localnick"]]
+        except:
+          peerinfo[peer_uuid] = [u"Unknown Nickname",u""]
+    #the snapshot comes from the filesystem thread, this takes no queue lock and only walks files that have progress
+    #fileinfo and progress are keyed by each file's index in result
+    (result,priorities,snapshot) = taco.globals.download_q_snapshot
+    fileinfo = defaultdict(dict)
+    progress = defaultdict(dict)
+    for peer_uuid in snapshot:
+      for index in snapshot[peer_uuid]:
+        (current_size,rate,eta) = snapshot[peer_uuid][index]
+        fileinfo[peer_uuid][index] = current_size
+        progress[peer_uuid][index] = [rate,eta]
+    output = {"result":result,"peerinfo":peerinfo,"fileinfo":fileinfo,"progress":progress,"priorities":priorities}
     return json.dumps(output)
   if bottle.request.json[u"action"] == u"completedqclear":
-    with taco.globals.completed_q_lock:
-      taco.globals.completed_q = []
+    taco.downloads.Clear_Completed()
     return "1"
 
   if bottle.request.json[u"action"] == u"completedqget":
@@ -161,7 +198,7 @@ def index():
             peerinfo[peer_uuid] = [taco.globals.settings["Peers"][peer_uuid]["nickname"],taco.globals.settings["Peers"][peer_uuid]["localnick"]]
           except:
             peerinfo[peer_uuid] = [u"Unknown Nickname",u""]
-        output = {"result":taco.globals.completed_q[::-1],"peerinfo":peerinfo}
+        output = {"result":list(taco.globals.completed_q)[::-1],"peerinfo":peerinfo}
     return json.dumps(output)
 
   if bottle.request.json[u"action"] == u"uploadqget":
@@ -171,9 +208,20 @@ def index():
     output = {}
     if type(bottle.request.json[u"data"]) == type({}):
       if u"sharedir" in bottle.request.json[u"data"] and u"uuid" in bottle.request.json[u"data"]:
-        with taco.globals.share_listings_lock:
-          if (bottle.request.json[u"data"][u"uuid"],bottle.request.json[u"data"][u"sharedir"]) in taco.globals.share_listings:
-            output = {"result":taco.globals.share_listings[(bottle.request.json[u"data"][u"uuid"],bottle.request.json[u"data"][u"sharedir"])][1]}
+        page = taco.filesystem.Listing_Page(bottle.request.json[u"data"])
+        iterkey = (bottle.request.json[u"data"][u"uuid"],bottle.request.json[u"data"][u"sharedir"],taco.filesystem.Listing_Page_Key(page))
+        legacykey = (iterkey[0],iterkey[1],None)
+        cached = taco.globals.share_listings.get(iterkey)
+        if cached is not None:
+          (results,total,version,age) = cached
+          output = {"result":results,"total":total,"page":page,"stale":age > taco.constants.FILESYSTEM_CACHE_TIMEOUT}
+          taco.commands.Prefetch_Share_Listings(iterkey[0],iterkey[1],page,results[1])
+        elif page is not None:
+          cached = taco.globals.share_listings.get(legacykey)
+          if cached is not None:
+            #peers that predate paging answer with the whole listing, page it here instead
+            (results,total) = taco.filesystem.Page_Listing(cached[0],page)
+            output = {"result":results,"total":total,"page":page,"stale":cached[3] > taco.constants.FILESYSTEM_CACHE_TIMEOUT}
     return json.dumps(output)
 
   if bottle.request.json[u"action"] == u"browse":
@@ -181,12 +229,53 @@ def index():
       if u"uuid" in bottle.request.json[u"data"] and u"sharedir" in bottle.request.json[u"data"]:
         peer_uuid = bottle.request.json[u"data"][u"uuid"]
         sharedir = bottle.request.json[u"data"][u"sharedir"]
+        page = taco.filesystem.Listing_Page(bottle.request.json[u"data"])
+        iterkey = (peer_uuid,sharedir,taco.filesystem.Listing_Page_Key(page))
         browse_result_uuid = uuid.uuid4().hex
-        logging.critical("Getting Directory Listing from: " + peer_uuid + " for share: " + sharedir)
-        request = taco.commands.Request_Share_Listing(peer_uuid,sharedir,browse_result_uuid)
-        taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
-        return json.dumps({"sharedir":sharedir,"result":browse_result_uuid})
+        #fresh copies are served as they are, stale ones are served while a conditional request revalidates them
+        if taco.globals.share_listings.claim_refresh(iterkey):
+          logging.critical("Getting Directory Listing from: " + peer_uuid + " for share: " + sharedir)
+          request = taco.commands.Request_Share_Listing(peer_uuid,sharedir,browse_result_uuid,page,taco.globals.share_listings.get_version(iterkey))
+          taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
+        return json.dumps({"sharedir":sharedir,"result":browse_result_uuid,"page":page})
         
+  if bottle.request.json[u"action"] == u"search":
+    if type(bottle.request.json[u"data"]) == type(u""):
+      query = bottle.request.json[u"data"].strip()
+      if len(query) > 0 and len(query) <= taco.constants.SEARCH_MAX_QUERY_LENGTH:
+        search_uuid = uuid.uuid4().hex
+        peer_uuids = []
+        skipped = 0
+        with taco.globals.settings_lock:
+          for peer_uuid in taco.globals.settings["Peers"].keys():
+            if not taco.globals.settings["Peers"][peer_uuid]["enabled"]: continue
+            if abs(time.time() - taco.globals.clients.get_client_last_reply(peer_uuid)) < taco.constants.ROLLCALL_TIMEOUT:
+              if taco.commands.Peer_Might_Have(peer_uuid,query): peer_uuids.append(peer_uuid)
+              else: skipped += 1
+        logging.info("Searching " + str(len(peer_uuids)) + " peers for: " + query + " (" + str(skipped) + " ruled out by their summaries)")
+        request = taco.commands.Request_Search(peer_uuids,query,search_uuid)
+        for peer_uuid in peer_uuids:
+          taco.globals.Add_To_Output_Queue(peer_uuid,request,2)
+        taco.globals.clients.sleep.set()
+        return json.dumps({"query":query,"result":search_uuid,"peers":len(peer_uuids),"skipped":skipped})
+
+  if bottle.request.json[u"action"] == u"searchresult":
+    output = {}
+    if type(bottle.request.json[u"data"]) == type({}) and u"uuid" in bottle.request.json[u"data"]:
+      search_uuid = bottle.request.json[u"data"][u"uuid"]
+      with taco.globals.settings_lock:
+        with taco.globals.search_results_lock:
+          if search_uuid in taco.globals.search_results:
+            (thetime,query,peer_results) = taco.globals.search_results[search_uuid]
+            output = {"query":query,"peers":{}}
+            for peer_uuid in peer_results:
+              try:
+                peerinfo = [taco.globals.settings["Peers"][peer_uuid]["nickname"],taco.globals.settings["Peers"][peer_uuid]["localnick"]]
+              except:
+                peerinfo = [u"Unknown Nickname",u""]
+              output["peers"][peer_uuid] = peerinfo + peer_results[peer_uuid]
+    return json.dumps(output)
+
   if bottle.request.json[u"action"] == u"peerstatus":
     output = {}
     with taco.globals.settings_lock:
@@ -201,7 +290,8 @@ def index():
             nickname_status = taco.globals.settings["Peers"][peer_uuid]["nickname"]
           except:
             nickname_status = "Unknown"
-          output[peer_uuid] = [incoming,outgoing,timediffinc,timediffout,nickname_status,taco.globals.settings["Peers"][peer_uuid]["localnick"]]
+          (client_state,client_state_time) = taco.globals.clients.get_client_state(peer_uuid)
+          output[peer_uuid] = [incoming,outgoing,timediffinc,timediffout,nickname_status,taco.globals.settings["Peers"][peer_uuid]["localnick"],client_state,abs(time.time()-client_state_time)]
     return json.dumps(output)
 
   if bottle.request.json[u"action"] == u"settingssave":
@@ -212,7 +302,8 @@ def index():
           for (keyname,value) in bottle.request.json[u"data"]:
             taco.globals.settings[keyname] = value
           taco.settings.Save_Settings(False)
-          return "1"
+        taco.commands.Invalidate_Rollcall_Cache()
+        return "1"
 
   if bottle.request.json[u"action"] == u"sharesave":
     if type(bottle.request.json[u"data"]) == type([]):
@@ -223,7 +314,9 @@ def index():
           for (sharename,sharelocation) in bottle.request.json[u"data"]:
             taco.globals.settings["Shares"].append([sharename,sharelocation])
           taco.settings.Save_Settings(False)
-          return "1"
+        taco.globals.filesys.indexer.sleep.set()
+        taco.globals.filesys.watcher.resync.set()
+        return "1"
 
   if bottle.request.json[u"action"] == u"getchat":
     output_chat = []
@@ -262,6 +355,7 @@ def index():
           for (hostname,port,localnick,peeruuid,clientpub,serverpub,dynamic,enabled) in bottle.request.json[u"data"]:
             taco.globals.settings["Peers"][unicode(peeruuid)] = {"hostname":hostname,"port": int(port),"localnick":localnick,"dynamic":int(dynamic),"enabled":int(enabled),"clientkey":clientpub,"serverkey":serverpub}
           taco.settings.Save_Settings(False)
+        taco.commands.Invalidate_Rollcall_Cache()
         taco.globals.server.stop.set()
         taco.globals.clients.stop.set()
         taco.globals.server.join()
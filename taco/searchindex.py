@@ -0,0 +1,206 @@
+import re
+import time
+import logging
+import threading
+from array import array
+import taco.constants
+import taco.bloom
+
+TOKEN_SPLITTER = re.compile(r"[\W_]+",re.UNICODE)
+
+def Search_Terms(query):
+  #lower cased, de-duplicated words of a search query
+  terms = []
+  for term in query.lower().split():
+    if term not in terms: terms.append(term)
+  return terms[:taco.constants.SEARCH_MAX_TERMS]
+
+def Query_Terms(query):
+  #terms of three or more characters match anywhere in a name, shorter terms and terms ending in * match the start of a word
+  terms = []
+  for term in Search_Terms(query):
+    prefix = term.endswith(u"*") or len(term.rstrip(u"*")) < 3
+    term = term.rstrip(u"*")
+    if term != u"": terms.append((term,prefix))
+  return terms
+
+def Summary_Keys(term):
+  if len(term) >= 3: return Trigrams(term)
+  return [u"^" + term]
+
+def Might_Match(bloom,query):
+  #False only when the summary proves no file name can match every term
+  for (term,prefix) in Query_Terms(query):
+    for key in Summary_Keys(term):
+      if not key in bloom: return False
+  return True
+
+def Tokens(lname):
+  return set([token for token in TOKEN_SPLITTER.split(lname) if token != u""])
+
+def Trigrams(text):
+  return set([text[i:i+3] for i in range(len(text) - 2)])
+
+class SearchIndex(object):
+  #in memory inverted index over the file names in the share index
+  #file ids are handed out in increasing order so every posting list stays sorted
+  #removed files leave a None behind until there are enough of them to be worth a compaction
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.files = []
+    self.dirs = {}
+    self.parents = {}
+    self.trigrams = {}
+    self.tokens = {}
+    #first one and two characters of a token -> the tokens starting with them, so short terms never scan the vocabulary
+    self.prefixes = {}
+    self.live = 0
+    self.dead = 0
+    self.full = False
+    self.version = 0
+    self.summary = None
+    self.summary_version = -1
+    self.summary_built_from = -1
+
+  def __len__(self):
+    return self.live
+
+  def add_file(self,share,parent,name,size,mtime):
+    #caller must hold self.lock
+    if self.live >= taco.constants.SEARCH_INDEX_MAX_FILES:
+      if not self.full: logging.warning("Search index is full, files past " + str(taco.constants.SEARCH_INDEX_MAX_FILES) + " will not be searchable")
+      self.full = True
+      return -1
+    file_id = len(self.files)
+    parentkey = self.parents.setdefault((share,parent),(share,parent))
+    self.files.append((parentkey,name,size,mtime))
+    lname = name.lower()
+    for trigram in Trigrams(lname):
+      if trigram in self.trigrams: self.trigrams[trigram].append(file_id)
+      else: self.trigrams[trigram] = array("I",[file_id])
+    for token in Tokens(lname):
+      if token in self.tokens: self.tokens[token].append(file_id)
+      else:
+        self.tokens[token] = array("I",[file_id])
+        self.prefixes.setdefault(token[:1],set()).add(token)
+        if len(token) > 1: self.prefixes.setdefault(token[:2],set()).add(token)
+    self.live += 1
+    return file_id
+
+  def remove_files(self,file_ids):
+    #caller must hold self.lock
+    for file_id in file_ids:
+      if self.files[file_id] is None: continue
+      self.files[file_id] = None
+      self.live -= 1
+      self.dead += 1
+    self.full = False
+
+  def set_directory(self,share,parent,files):
+    with self.lock:
+      self.version += 1
+      if (share,parent) in self.dirs: self.remove_files(self.dirs[(share,parent)])
+      file_ids = array("I")
+      for (filename,filesize,filemod) in files:
+        file_id = self.add_file(share,parent,filename,filesize,filemod)
+        if file_id >= 0: file_ids.append(file_id)
+      if len(file_ids) > 0: self.dirs[(share,parent)] = file_ids
+      elif (share,parent) in self.dirs: del self.dirs[(share,parent)]
+      self.maybe_compact()
+
+  def drop_subtree(self,share,relpath):
+    with self.lock:
+      self.version += 1
+      for (dirshare,parent) in self.dirs.keys():
+        if dirshare != share: continue
+        if relpath == u"/" or parent == relpath or parent.startswith(relpath + u"/"):
+          self.remove_files(self.dirs[(dirshare,parent)])
+          del self.dirs[(dirshare,parent)]
+          if (dirshare,parent) in self.parents: del self.parents[(dirshare,parent)]
+      self.maybe_compact()
+
+  def maybe_compact(self):
+    #caller must hold self.lock; renumbers the live files so posting lists drop their dead ids
+    if self.dead < taco.constants.SEARCH_INDEX_COMPACT_MIN or self.dead < self.live: return
+    logging.debug("Compacting search index: " + str(self.live) + " live, " + str(self.dead) + " dead")
+    files = self.files
+    dirs = self.dirs
+    self.files = []
+    self.dirs = {}
+    self.parents = {}
+    self.trigrams = {}
+    self.tokens = {}
+    self.prefixes = {}
+    self.live = 0
+    self.dead = 0
+    for (share,parent) in dirs:
+      file_ids = array("I")
+      for old_id in dirs[(share,parent)]:
+        if files[old_id] is None: continue
+        (parentkey,name,size,mtime) = files[old_id]
+        file_ids.append(self.add_file(share,parent,name,size,mtime))
+      if len(file_ids) > 0: self.dirs[(share,parent)] = file_ids
+
+  def candidates(self,term):
+    #caller must hold self.lock; returns the smallest posting list a file matching the term has to be in
+    if len(term) >= 3:
+      best = None
+      for trigram in Trigrams(term):
+        if not trigram in self.trigrams: return array("I")
+        if best is None or len(self.trigrams[trigram]) < len(best): best = self.trigrams[trigram]
+      return best
+    matched = set()
+    for token in self.prefixes.get(term,()): matched.update(self.tokens[token])
+    return matched
+
+  def refresh_summary(self):
+    #rebuilds the bloom filter peers use to skip us in searches, only when the index has changed since the last build
+    with self.lock:
+      if self.version == self.summary_built_from: return False
+      built_from = self.version
+      keys = self.trigrams.keys()
+      keys.extend([u"^" + prefix for prefix in self.prefixes])
+    keys = set(keys)
+    start = time.time()
+    summary = taco.bloom.Build_Bloom_Filter(keys,taco.constants.SEARCH_SUMMARY_BITS_PER_KEY,taco.constants.SEARCH_SUMMARY_MIN_BITS,taco.constants.SEARCH_SUMMARY_MAX_BITS,taco.constants.SEARCH_SUMMARY_HASHES)
+    with self.lock:
+      self.summary = summary
+      self.summary_version = int(time.time() * 1000)
+      self.summary_built_from = built_from
+    logging.debug("Built a " + str(summary.bits / 8) + " byte search summary from " + str(len(keys)) + " keys in " + str(round(time.time() - start,2)) + "s")
+    return True
+
+  def get_summary(self):
+    with self.lock:
+      return (self.summary_version,self.summary)
+
+  def search(self,query,limit):
+    terms = Query_Terms(query)
+    if len(terms) == 0: return []
+    results = []
+    with self.lock:
+      postings = [self.candidates(term) for (term,prefix) in terms]
+      postings.sort(key=len)
+      #with several terms, intersecting in C beats checking names one by one once the smallest list holds far more ids than we need
+      candidates = postings[0]
+      for posting in postings[1:taco.constants.SEARCH_INDEX_MAX_INTERSECT + 1]:
+        if len(candidates) <= limit * 8: break
+        candidates = set(candidates).intersection(posting)
+      for file_id in candidates:
+        entry = self.files[file_id]
+        if entry is None: continue
+        ((share,parent),name,size,mtime) = entry
+        lname = name.lower()
+        tokens = None
+        matched = True
+        for (term,prefix) in terms:
+          if not prefix:
+            if not term in lname: matched = False
+          else:
+            if tokens is None: tokens = Tokens(lname)
+            if not any([token.startswith(term) for token in tokens]): matched = False
+          if not matched: break
+        if not matched: continue
+        results.append((share,parent,name,size,mtime))
+        if len(results) >= limit: break
+    return results
@@ -28,6 +28,7 @@ class TacoServer(threading.Thread):
     #self.set_status("Server has serviced a request from:" + peer_uuid)
     with self.client_last_request_time_lock:
       self.client_last_request_time[peer_uuid] = time.time()
+    taco.globals.clients.wake_client(peer_uuid)
 
   def get_client_last_request(self,peer_uuid):
     with self.client_last_request_time_lock:
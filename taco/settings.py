@@ -1,6 +1,7 @@
 import taco.globals
 import taco.constants
 import taco.defaults
+import taco.sharetable
 import os
 import json
 import logging
@@ -35,9 +36,15 @@ def Load_Settings(needlock=True):
     valid_list = True
 
   if not valid_list:       
-    taco.globals.shares = []
+    taco.globals.settings["Shares"] = []
     save_after = True
 
+  try:
+    taco.globals.share_table = taco.sharetable.ShareTable(taco.globals.settings["Shares"])
+  except:
+    logging.error("Share list is malformed, nothing will be shared until it is saved again")
+    taco.globals.share_table = taco.sharetable.ShareTable([])
+
   logging.debug("Verifying settings peer dict is in correct format")
   keep_keys = []
   for peer_uuid in taco.globals.settings["Peers"].keys():
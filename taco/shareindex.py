@@ -0,0 +1,227 @@
+import os
+import sqlite3
+import logging
+import threading
+import time
+from collections import deque
+import taco.constants
+import taco.globals
+import taco.walker
+import taco.searchindex
+
+def Split_Share_Dir(sharedir):
+  #"/Share Name/some/dir" -> (u"Share Name",u"/some/dir")
+  parts = [part for part in sharedir.split(u"/") if part not in (u"",u".")]
+  if len(parts) == 0: return (u"",u"/")
+  return (parts[0],u"/" + u"/".join(parts[1:]))
+
+def Join_Rel_Path(relpath,name):
+  if relpath == u"/": return u"/" + name
+  return relpath + u"/" + name
+
+class ShareIndex(object):
+  def __init__(self,filename):
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(filename,check_same_thread=False)
+    self.db.executescript("""
+      CREATE TABLE IF NOT EXISTS shares  (share TEXT PRIMARY KEY, path TEXT);
+      CREATE TABLE IF NOT EXISTS dirs    (share TEXT, path TEXT, mtime REAL, generation INTEGER, PRIMARY KEY (share,path));
+      CREATE TABLE IF NOT EXISTS entries (share TEXT, parent TEXT, name TEXT, isdir INTEGER, size INTEGER, mtime REAL, PRIMARY KEY (share,parent,name));
+    """)
+    self.db.commit()
+    self.shares = dict(self.db.execute("SELECT share,path FROM shares").fetchall())
+    self.generation = self.db.execute("SELECT MAX(generation) FROM dirs").fetchone()[0] or 0
+    #set while inotify watches every shared directory and the index has been checked since they were added
+    self.trusted = False
+    self.search_index = taco.searchindex.SearchIndex()
+    self.load_search_index()
+
+  def close(self):
+    with self.lock:
+      self.db.close()
+
+  def load_search_index(self):
+    start = time.time()
+    rows = self.db.execute("SELECT share,parent,name,size,mtime FROM entries WHERE isdir=0 ORDER BY share,parent")
+    current = None
+    files = []
+    for (share,parent,name,size,mtime) in rows:
+      if (share,parent) != current:
+        if current is not None: self.search_index.set_directory(current[0],current[1],files)
+        current = (share,parent)
+        files = []
+      files.append((name,size,mtime))
+    if current is not None: self.search_index.set_directory(current[0],current[1],files)
+    logging.info("Loaded " + str(len(self.search_index)) + " files into the search index in " + str(round(time.time() - start,2)) + "s")
+
+  def delete_subtree(self,share,relpath):
+    #caller must hold self.lock; '/' sorts just before '0' so the range covers every path below relpath
+    self.search_index.drop_subtree(share,relpath)
+    if relpath == u"/":
+      self.db.execute("DELETE FROM dirs WHERE share=?",(share,))
+      self.db.execute("DELETE FROM entries WHERE share=?",(share,))
+      return
+    self.db.execute("DELETE FROM dirs WHERE share=? AND (path=? OR (path>=? AND path<?))",(share,relpath,relpath + u"/",relpath + u"0"))
+    self.db.execute("DELETE FROM entries WHERE share=? AND (parent=? OR (parent>=? AND parent<?))",(share,relpath,relpath + u"/",relpath + u"0"))
+
+  def sync_shares(self,shares):
+    with self.lock:
+      wanted = dict([(sharename,unicode(sharepath)) for [sharename,sharepath] in shares])
+      for share in self.shares.keys():
+        if share not in wanted or wanted[share] != self.shares[share]:
+          logging.info("Dropping share from the index: " + share)
+          self.delete_subtree(share,u"/")
+          self.db.execute("DELETE FROM shares WHERE share=?",(share,))
+          del self.shares[share]
+      for share in wanted:
+        if share not in self.shares:
+          self.db.execute("INSERT OR REPLACE INTO shares VALUES (?,?)",(share,wanted[share]))
+          self.shares[share] = wanted[share]
+      self.db.commit()
+
+  def store_directory(self,share,relpath,dirmtime,dirs,files):
+    with self.lock:
+      old_dirs = set([row[0] for row in self.db.execute("SELECT name FROM entries WHERE share=? AND parent=? AND isdir=1",(share,relpath))])
+      for dirname in old_dirs - set(dirs): self.delete_subtree(share,Join_Rel_Path(relpath,dirname))
+      self.generation += 1
+      self.db.execute("DELETE FROM entries WHERE share=? AND parent=?",(share,relpath))
+      self.db.executemany("INSERT INTO entries VALUES (?,?,?,1,0,0)",[(share,relpath,dirname) for dirname in dirs])
+      self.db.executemany("INSERT INTO entries VALUES (?,?,?,0,?,?)",[(share,relpath,filename,filesize,filemod) for (filename,filesize,filemod) in files])
+      self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?,?,?,?)",(share,relpath,dirmtime,self.generation))
+      self.db.commit()
+      self.search_index.set_directory(share,relpath,files)
+
+  def get_stored_directory(self,share,relpath):
+    with self.lock:
+      dirrow = self.db.execute("SELECT mtime,generation FROM dirs WHERE share=? AND path=?",(share,relpath)).fetchone()
+      if dirrow is None: return None
+      dirs  = [row[0] for row in self.db.execute("SELECT name FROM entries WHERE share=? AND parent=? AND isdir=1",(share,relpath))]
+      files = [(row[0],row[1],row[2]) for row in self.db.execute("SELECT name,size,mtime FROM entries WHERE share=? AND parent=? AND isdir=0",(share,relpath))]
+      return (dirrow[0],dirrow[1],sorted(dirs),sorted(files))
+
+  def forget_directory(self,share,relpath):
+    with self.lock:
+      self.delete_subtree(share,relpath)
+      self.db.commit()
+
+  def refresh_directory(self,share,relpath,directory,force=False):
+    #returns (dirs,files) for directory, only touching more than the directory inode when it has changed
+    stored = self.get_stored_directory(share,relpath)
+    if stored is not None and self.trusted and not force:
+      return (stored[2],stored[3])
+    dirmtime = os.stat(directory).st_mtime
+    if stored is not None and stored[0] == dirmtime and not force:
+      return (stored[2],stored[3])
+    (dirs,files) = taco.walker.Scan_Directory(directory)
+    self.store_directory(share,relpath,dirmtime,dirs,files)
+    return (dirs,files)
+
+  def get_listing(self,share,sharepath,relpath):
+    if self.shares.get(share) != unicode(sharepath):
+      with taco.globals.settings_lock: shares = list(taco.globals.settings["Shares"])
+      self.sync_shares(shares)
+    directory = os.path.normpath(sharepath + relpath)
+    return self.refresh_directory(share,relpath,directory)
+
+  def search(self,query,limit):
+    #returns [sharedir,filename,size,mtime] for files whose name contains every term of the query
+    if type(query) != type(u""): query = query.decode("utf-8","replace")
+    results = []
+    for (share,parent,name,size,mtime) in self.search_index.search(query,limit):
+      if not share in self.shares: continue
+      sharedir = u"/" + share + (parent if parent != u"/" else u"")
+      results.append([sharedir,name,size,mtime])
+    results.sort()
+    return results
+
+  def get_tree(self,share,sharepath,relpath,depth,limit):
+    #returns ([[sharedir,filename,size,mtime],...],truncated) for every file up to depth directories below relpath
+    files = []
+    truncated = False
+    pending = deque([(relpath,0)])
+    while len(pending) > 0:
+      (current,level) = pending.popleft()
+      try:
+        (dirs,dirfiles) = self.refresh_directory(share,current,os.path.normpath(sharepath + current))
+      except OSError:
+        continue
+      sharedir = u"/" + share + (current if current != u"/" else u"")
+      for (filename,filesize,filemod) in dirfiles:
+        if len(files) >= limit: return (files,True)
+        files.append([sharedir,filename,filesize,filemod])
+      if level < depth:
+        for dirname in dirs: pending.append((Join_Rel_Path(current,dirname),level + 1))
+      elif len(dirs) > 0:
+        #the other directories at this depth still get their files listed
+        truncated = True
+    return (files,truncated)
+
+  def refresh_share(self,share,sharepath,stop,force=False):
+    seen = set()
+    pending = [u"/"]
+    while len(pending) > 0 and not stop.is_set():
+      relpath = pending.pop()
+      directory = os.path.normpath(sharepath + relpath)
+      try:
+        dirstat = os.stat(directory)
+        if (dirstat.st_dev,dirstat.st_ino) in seen: continue
+        seen.add((dirstat.st_dev,dirstat.st_ino))
+        (dirs,files) = self.refresh_directory(share,relpath,directory,force)
+      except OSError:
+        self.forget_directory(share,relpath)
+        continue
+      for dirname in dirs: pending.append(Join_Rel_Path(relpath,dirname))
+
+class TacoShareIndexer(threading.Thread):
+  def __init__(self,index):
+    threading.Thread.__init__(self)
+
+    self.stop = threading.Event()
+    self.sleep = threading.Event()
+
+    self.index = index
+
+    self.status_lock = threading.Lock()
+    self.status = ""
+    self.status_time = -1
+
+    self.next_full_rescan = time.time() + taco.constants.FILESYSTEM_INDEX_FULL_RESCAN
+    self.watching = False
+
+  def set_status(self,text,level=0):
+    if   level==1: logging.info(text)
+    elif level==0: logging.debug(text)
+    elif level==2: logging.warning(text)
+    elif level==3: logging.error(text)
+    with self.status_lock:
+      self.status = text
+      self.status_time = time.time()
+
+  def get_status(self):
+    with self.status_lock:
+      return (self.status,self.status_time)
+
+  def set_watching(self,watching):
+    #the index can only be trusted without a stat once a pass has run after the watches went in
+    self.watching = watching
+    if not watching: self.index.trusted = False
+    self.sleep.set()
+
+  def run(self):
+    self.set_status("Starting Share Indexer")
+    while not self.stop.is_set():
+      watching = self.watching
+      force = time.time() >= self.next_full_rescan
+      if force: self.next_full_rescan = time.time() + taco.constants.FILESYSTEM_INDEX_FULL_RESCAN
+      with taco.globals.settings_lock: shares = list(taco.globals.settings["Shares"])
+      self.index.sync_shares(shares)
+      for [sharename,sharepath] in shares:
+        if self.stop.is_set(): break
+        self.set_status("Refreshing share index for: " + sharename)
+        self.index.refresh_share(sharename,unicode(sharepath),self.stop,force)
+      self.set_status("Share index refresh done")
+      self.index.trusted = watching and self.watching and not self.stop.is_set()
+      if self.index.trusted: self.sleep.wait(max(0,self.next_full_rescan - time.time()))
+      else:                  self.sleep.wait(taco.constants.FILESYSTEM_INDEX_REFRESH)
+      self.sleep.clear()
+    self.set_status("Share Indexer Exit")
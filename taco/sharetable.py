@@ -0,0 +1,39 @@
+import os
+
+def Canonical_Path(path):
+  return os.path.normcase(os.path.abspath(os.path.normpath(unicode(path))))
+
+class ShareTable(object):
+  #read only snapshot of the configured shares, replaced as a whole whenever the share settings change
+  #nothing in here touches the filesystem, callers that need a directory to exist still check for it
+  def __init__(self,shares):
+    self.paths = {}
+    self.roots = []
+    for [sharename,sharepath] in shares:
+      if sharename in self.paths: continue
+      self.paths[sharename] = sharepath
+      root = Canonical_Path(sharepath)
+      if root.endswith(os.sep): self.roots.append((root,root))
+      else:                     self.roots.append((root,root + os.sep))
+    self.names = sorted(self.paths.keys())
+
+  def path_for(self,sharename):
+    return self.paths.get(sharename,"")
+
+  def contains(self,path):
+    #a real path boundary check, /data/music2 is not under /data/music
+    path = Canonical_Path(path)
+    for (root,prefix) in self.roots:
+      if path == root or path.startswith(prefix): return True
+    return False
+
+  def resolve(self,sharedir):
+    #"/Share Name/some/dir" -> (sharename,sharepath,relpath,directory), None for the root or an unknown share
+    parts = [part for part in os.path.normpath(sharedir).split(u"/") if part not in (u"",u".")]
+    if len(parts) == 0 or not parts[0] in self.paths: return None
+    sharename = parts[0]
+    sharepath = self.paths[sharename]
+    relpath = u"/" + u"/".join(parts[1:])
+    directory = os.path.normpath(sharepath + u"/" + relpath)
+    if not self.contains(directory): return None
+    return (sharename,sharepath,relpath,directory)
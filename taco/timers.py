@@ -0,0 +1,43 @@
+import heapq
+import threading
+import time
+
+class TimerQueue(object):
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.heap = []
+    self.deadlines = {}
+
+  def schedule(self,key,when):
+    #rescheduling a key replaces its old deadline, the stale heap entry is skipped when popped
+    with self.lock:
+      self.deadlines[key] = when
+      heapq.heappush(self.heap,(when,key))
+      if len(self.heap) > 64 + 2 * len(self.deadlines):
+        self.heap = [(deadline,keyname) for (keyname,deadline) in self.deadlines.items()]
+        heapq.heapify(self.heap)
+
+  def cancel(self,key):
+    with self.lock:
+      if key in self.deadlines: del self.deadlines[key]
+
+  def get_deadline(self,key):
+    with self.lock:
+      if key in self.deadlines:
+        return self.deadlines[key]
+    return -1
+
+  def pop_expired(self):
+    expired = []
+    current_time = time.time()
+    with self.lock:
+      while len(self.heap) > 0 and self.heap[0][0] <= current_time:
+        (when,key) = heapq.heappop(self.heap)
+        if key in self.deadlines and self.deadlines[key] == when:
+          del self.deadlines[key]
+          expired.append(key)
+    return expired
+
+  def __len__(self):
+    with self.lock:
+      return len(self.deadlines)
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import logging
+from collections import OrderedDict
+import taco.constants
+
+#linux values, posix_fadvise is only looked up on linux when os does not have it
+POSIX_FADV_SEQUENTIAL = getattr(os,"POSIX_FADV_SEQUENTIAL",2)
+POSIX_FADV_WILLNEED = getattr(os,"POSIX_FADV_WILLNEED",3)
+
+def Load_Fadvise():
+  #returns fadvise(fd,offset,length,advice), or None where there is no such thing
+  if hasattr(os,"posix_fadvise"): return os.posix_fadvise
+  if not sys.platform.startswith("linux"): return None
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",use_errno=True)
+    if hasattr(libc,"posix_fadvise64"): fadvise = libc.posix_fadvise64
+    else:                               fadvise = libc.posix_fadvise
+    fadvise.argtypes = [ctypes.c_int,ctypes.c_int64,ctypes.c_int64,ctypes.c_int]
+    fadvise.restype = ctypes.c_int
+    return fadvise
+  except:
+    return None
+
+Fadvise_Call = Load_Fadvise()
+
+def Fadvise(fd,offset,length,advice):
+  #only ever a hint, a failure changes nothing but speed
+  if Fadvise_Call is None: return
+  try:
+    Fadvise_Call(fd,offset,length,advice)
+  except:
+    pass
+
+class UploadReader(object):
+  #chunk reads for uploads, owned by the filesystem manager thread
+  #files stay open between requests, and a peer reading straight through a file is served from a read ahead buffer
+  #that covers its next several chunks, while the kernel is told to fetch the stretch after that
+  #mmap was left out on purpose: a shared file truncated under a mapping would SIGBUS the whole process
+  def __init__(self):
+    #fullpath -> [file object,size,last access]
+    self.files = {}
+    #(peer_uuid,fullpath) -> [next offset expected,sequential run,buffer start,buffer,last access,(size,mtime) when buffered], least recently used first
+    self.streams = OrderedDict()
+    self.buffered = 0
+
+  def open_file(self,fullpath):
+    if not fullpath in self.files:
+      handle = open(fullpath,"rb")
+      self.files[fullpath] = [handle,os.fstat(handle.fileno()).st_size,time.time()]
+    entry = self.files[fullpath]
+    entry[2] = time.time()
+    return entry
+
+  def set_buffer(self,stream,start,data,stamp=None):
+    self.buffered += len(data) - len(stream[3])
+    stream[2] = start
+    stream[3] = data
+    stream[5] = stamp
+
+  def trim_buffers(self,keep):
+    #oldest streams lose their buffers until the total fits, they just read through the file again if they carry on
+    for key in self.streams.keys():
+      if self.buffered <= taco.constants.FILESYSTEM_READ_AHEAD_BUDGET: return
+      if key != keep: self.set_buffer(self.streams[key],0,"")
+
+  def drop_stream(self,key):
+    self.set_buffer(self.streams.pop(key),0,"")
+
+  def read_at(self,entry,offset,length):
+    entry[0].seek(offset)
+    return entry[0].read(length)
+
+  def read(self,peer_uuid,fullpath,offset,length):
+    #returns the data, or None when the offset is past the end of the file
+    entry = self.open_file(fullpath)
+    key = (peer_uuid,fullpath)
+    if key in self.streams: stream = self.streams.pop(key)
+    else:                   stream = [-1,0,0,"",0.0,None]
+    self.streams[key] = stream
+    stream[4] = time.time()
+    while len(self.streams) > taco.constants.FILESYSTEM_READ_STREAMS_MAX: self.drop_stream(next(iter(self.streams)))
+
+    #a downloader fetching from several peers at once skips ahead by the chunks it asked the others for, that still counts
+    if stream[0] >= 0 and stream[0] <= offset <= stream[0] + taco.constants.FILESYSTEM_READ_AHEAD: stream[1] += 1
+    else:                                                                                         stream[1] = 0
+    stream[0] = offset + length
+
+    #a buffer is only served while the file still has the size and mtime it was read at, otherwise it is read again
+    filestat = os.fstat(entry[0].fileno())
+    entry[1] = filestat.st_size
+    stamp = (filestat.st_size,filestat.st_mtime)
+    if stream[5] != stamp: self.set_buffer(stream,0,"")
+    if offset >= stream[2] and offset + length <= stream[2] + len(stream[3]):
+      return stream[3][offset - stream[2]:offset - stream[2] + length]
+
+    if offset >= entry[1]:
+      self.set_buffer(stream,0,"")
+      return None
+
+    if stream[1] < taco.constants.FILESYSTEM_READ_SEQUENTIAL_AFTER:
+      self.set_buffer(stream,0,"")
+      return self.read_at(entry,offset,length)
+
+    fd = entry[0].fileno()
+    if stream[1] == taco.constants.FILESYSTEM_READ_SEQUENTIAL_AFTER: Fadvise(fd,0,0,POSIX_FADV_SEQUENTIAL)
+    self.set_buffer(stream,offset,self.read_at(entry,offset,max(length,taco.constants.FILESYSTEM_READ_AHEAD)),stamp)
+    self.trim_buffers(key)
+    Fadvise(fd,offset + len(stream[3]),taco.constants.FILESYSTEM_READ_AHEAD,POSIX_FADV_WILLNEED)
+    return stream[3][:length]
+
+  def close_idle(self):
+    for key in self.streams.keys():
+      if abs(time.time() - self.streams[key][4]) > taco.constants.FILESYSTEM_CACHE_TIMEOUT: self.drop_stream(key)
+    for fullpath in self.files.keys():
+      if abs(time.time() - self.files[fullpath][2]) > taco.constants.FILESYSTEM_CACHE_TIMEOUT:
+        logging.debug("Closing a file due to inactivity:" + fullpath)
+        self.files.pop(fullpath)[0].close()
+
+  def close(self):
+    self.streams.clear()
+    self.buffered = 0
+    for fullpath in self.files.keys(): self.files.pop(fullpath)[0].close()
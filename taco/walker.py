@@ -0,0 +1,139 @@
+import os
+import sys
+import stat
+import ctypes
+import ctypes.util
+
+#scandir hands back d_type from the directory read, so directories never need a stat()
+try:
+  from os import scandir
+except ImportError:
+  try:
+    from scandir import scandir
+  except ImportError:
+    scandir = None
+
+DT_UNKNOWN = 0
+DT_DIR     = 4
+DT_REG     = 8
+DT_LNK     = 10
+
+#without scandir, linux gets d_type straight from readdir64, whose struct dirent64 is the same on every glibc architecture
+class Dirent64(ctypes.Structure):
+  _fields_ = [("d_ino",ctypes.c_uint64),("d_off",ctypes.c_int64),("d_reclen",ctypes.c_ushort),("d_type",ctypes.c_ubyte),("d_name",ctypes.c_char * 256)]
+
+libc = None
+if scandir is None and sys.platform.startswith("linux"):
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",use_errno=True)
+    libc.opendir.argtypes = [ctypes.c_char_p]
+    libc.opendir.restype = ctypes.c_void_p
+    libc.readdir64.argtypes = [ctypes.c_void_p]
+    libc.readdir64.restype = ctypes.POINTER(Dirent64)
+    libc.closedir.argtypes = [ctypes.c_void_p]
+    libc.closedir.restype = ctypes.c_int
+  except (OSError,AttributeError):
+    libc = None
+
+def Unicode_Directory(directory):
+  #a str path would hand back str names, which are all skipped as undecodable
+  if type(directory) != type(u""): directory = directory.decode(sys.getfilesystemencoding() or "utf-8")
+  return directory
+
+def Scan_Directory_Scandir(directory):
+  dirs = []
+  files = []
+  for entry in scandir(directory):
+    if type(entry.name) != type(u""): continue
+    try:
+      if entry.is_dir():
+        dirs.append(entry.name)
+      elif entry.is_file():
+        filestat = entry.stat()
+        files.append((entry.name,filestat.st_size,filestat.st_mtime))
+    except OSError:
+      continue
+  dirs.sort()
+  files.sort()
+  return (dirs,files)
+
+def Scan_Directory_Listdir(directory):
+  dirs = []
+  files = []
+  for fileobject in os.listdir(directory):
+    if type(fileobject) != type(u""): continue
+    try:
+      filestat = os.stat(os.path.join(directory,fileobject))
+    except OSError:
+      continue
+    if stat.S_ISREG(filestat.st_mode):
+      files.append((fileobject,filestat.st_size,filestat.st_mtime))
+    elif stat.S_ISDIR(filestat.st_mode):
+      dirs.append(fileobject)
+  dirs.sort()
+  files.sort()
+  return (dirs,files)
+
+def Scan_Directory_Readdir(directory):
+  encoding = sys.getfilesystemencoding() or "utf-8"
+  handle = libc.opendir(directory.encode(encoding))
+  if not handle:
+    error = ctypes.get_errno()
+    raise OSError(error,os.strerror(error),directory)
+  dirs = []
+  files = []
+  try:
+    while True:
+      ctypes.set_errno(0)
+      entry = libc.readdir64(handle)
+      if not entry:
+        error = ctypes.get_errno()
+        if error != 0: raise OSError(error,os.strerror(error),directory)
+        break
+      name = entry.contents.d_name
+      if name == "." or name == "..": continue
+      d_type = entry.contents.d_type
+      try:
+        name = name.decode(encoding)
+      except UnicodeDecodeError:
+        continue
+      if d_type == DT_DIR:
+        dirs.append(name)
+        continue
+      #only regular files need a stat for their size and time, links and unknown types need one to see what they are
+      if d_type not in (DT_REG,DT_LNK,DT_UNKNOWN): continue
+      try:
+        filestat = os.stat(os.path.join(directory,name))
+      except OSError:
+        continue
+      if stat.S_ISREG(filestat.st_mode):
+        files.append((name,filestat.st_size,filestat.st_mtime))
+      elif stat.S_ISDIR(filestat.st_mode):
+        dirs.append(name)
+  finally:
+    libc.closedir(handle)
+  dirs.sort()
+  files.sort()
+  return (dirs,files)
+
+def Scan_Directory(directory):
+  directory = Unicode_Directory(directory)
+  if scandir is not None: return Scan_Directory_Scandir(directory)
+  if libc is not None:    return Scan_Directory_Readdir(directory)
+  return Scan_Directory_Listdir(directory)
+
+def Walk_Directory(directory):
+  #yields (directory,dirs,files) top down, skipping directories that cannot be read or were already seen through a symlink
+  seen = set()
+  pending = [Unicode_Directory(directory)]
+  while len(pending) > 0:
+    current = pending.pop()
+    try:
+      dirstat = os.stat(current)
+      if (dirstat.st_dev,dirstat.st_ino) in seen: continue
+      seen.add((dirstat.st_dev,dirstat.st_ino))
+      (dirs,files) = Scan_Directory(current)
+    except OSError:
+      continue
+    yield (current,dirs,files)
+    for dirname in reversed(dirs): pending.append(os.path.join(current,dirname))
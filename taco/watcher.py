@@ -0,0 +1,207 @@
+import os
+import sys
+import errno
+import struct
+import select
+import logging
+import threading
+import time
+import ctypes
+import ctypes.util
+import taco.constants
+import taco.globals
+import taco.shareindex
+import taco.walker
+
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF   = 0x00000800
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_ISDIR       = 0x40000000
+IN_NONBLOCK    = 00004000
+IN_CLOEXEC     = 02000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+libc = None
+if sys.platform.startswith("linux"):
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",use_errno=True)
+    libc.inotify_init1
+    libc.inotify_add_watch.argtypes = [ctypes.c_int,ctypes.c_char_p,ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int,ctypes.c_int]
+  except (OSError,AttributeError):
+    libc = None
+
+def Inotify_Available():
+  return libc is not None
+
+class TacoShareWatcher(threading.Thread):
+  def __init__(self,index,indexer):
+    threading.Thread.__init__(self)
+
+    self.stop = threading.Event()
+    self.resync = threading.Event()
+
+    self.index = index
+    self.indexer = indexer
+
+    self.status_lock = threading.Lock()
+    self.status = ""
+    self.status_time = -1
+
+    self.watching = False
+    self.fd = -1
+    self.watches = {}
+    self.dirty = {}
+
+  def set_status(self,text,level=0):
+    if   level==1: logging.info(text)
+    elif level==0: logging.debug(text)
+    elif level==2: logging.warning(text)
+    elif level==3: logging.error(text)
+    with self.status_lock:
+      self.status = text
+      self.status_time = time.time()
+
+  def get_status(self):
+    with self.status_lock:
+      return (self.status,self.status_time)
+
+  def is_watching(self):
+    return self.watching
+
+  def add_watch(self,share,sharepath,relpath):
+    directory = os.path.normpath(sharepath + relpath)
+    wd = libc.inotify_add_watch(self.fd,directory.encode(sys.getfilesystemencoding()),WATCH_MASK)
+    if wd < 0:
+      error = ctypes.get_errno()
+      if error in (errno.ENOENT,errno.ENOTDIR,errno.EACCES): return
+      raise OSError(error,"inotify_add_watch failed for " + directory + ": " + os.strerror(error))
+    self.watches[wd] = (share,sharepath,relpath)
+
+  def add_watch_tree(self,share,sharepath,relpath):
+    for (directory,dirs,files) in taco.walker.Walk_Directory(os.path.normpath(sharepath + relpath)):
+      subpath = os.path.relpath(directory,sharepath)
+      if subpath == u".": self.add_watch(share,sharepath,u"/")
+      else:               self.add_watch(share,sharepath,u"/" + subpath)
+
+  def start_watching(self):
+    self.stop_watching()
+    self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self.fd < 0:
+      self.set_status("inotify_init1 failed, using polling: " + os.strerror(ctypes.get_errno()),2)
+      return False
+    with taco.globals.settings_lock: shares = list(taco.globals.settings["Shares"])
+    try:
+      for [sharename,sharepath] in shares:
+        if self.stop.is_set(): return False
+        self.set_status("Adding inotify watches for share: " + sharename)
+        self.add_watch_tree(sharename,unicode(sharepath),u"/")
+    except OSError,e:
+      self.set_status("Could not watch all shares, using polling: " + str(e),2)
+      self.stop_watching()
+      return False
+    self.set_status("Watching " + str(len(self.watches)) + " shared directories with inotify",1)
+    self.watching = True
+    self.indexer.set_watching(True)
+    return True
+
+  def stop_watching(self):
+    was_watching = self.watching
+    self.watching = False
+    self.indexer.set_watching(False)
+    if self.fd >= 0: os.close(self.fd)
+    self.fd = -1
+    self.watches = {}
+    self.dirty = {}
+    if was_watching: taco.globals.filesys.drop_listings()
+
+  def mark_dirty(self,share,sharepath,relpath):
+    if not (share,relpath) in self.dirty: self.dirty[(share,relpath)] = (sharepath,time.time())
+
+  def process_events(self,data):
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+      (wd,mask,cookie,length) = EVENT_HEADER.unpack_from(data,offset)
+      name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip("\0")
+      offset += EVENT_HEADER.size + length
+      if mask & IN_Q_OVERFLOW:
+        self.set_status("inotify queue overflowed, rebuilding watches",2)
+        self.resync.set()
+        continue
+      if not wd in self.watches: continue
+      (share,sharepath,relpath) = self.watches[wd]
+      if mask & IN_IGNORED:
+        del self.watches[wd]
+        continue
+      if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+        if relpath != u"/": self.mark_dirty(share,sharepath,os.path.dirname(relpath))
+        continue
+      self.mark_dirty(share,sharepath,relpath)
+      if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+        try:
+          name = name.decode(sys.getfilesystemencoding())
+        except UnicodeDecodeError:
+          continue
+        try:
+          self.add_watch_tree(share,sharepath,taco.shareindex.Join_Rel_Path(relpath,name))
+        except OSError,e:
+          self.set_status("Could not watch new directory, using polling: " + str(e),2)
+          self.stop_watching()
+          return
+
+  def flush_dirty(self):
+    #wait for bursts of events to settle before touching the index
+    for (share,relpath) in self.dirty.keys():
+      (sharepath,first_seen) = self.dirty[(share,relpath)]
+      if abs(time.time() - first_seen) < taco.constants.FILESYSTEM_WATCH_SETTLE: continue
+      del self.dirty[(share,relpath)]
+      sharedir = u"/" + share + (relpath if relpath != u"/" else u"")
+      self.set_status("Share directory changed: " + sharedir)
+      try:
+        self.index.refresh_directory(share,relpath,os.path.normpath(sharepath + relpath),True)
+      except OSError:
+        self.index.forget_directory(share,relpath)
+      taco.globals.filesys.drop_listing(sharedir)
+
+  def run(self):
+    self.set_status("Starting Share Watcher")
+    if not Inotify_Available():
+      self.set_status("inotify is not available, share listings will be polled",1)
+      return
+    try:
+      self.start_watching()
+      while not self.stop.is_set():
+        if self.resync.is_set():
+          self.resync.clear()
+          self.start_watching()
+        if not self.watching:
+          self.resync.wait(taco.constants.FILESYSTEM_WATCH_RETRY)
+          if not self.resync.is_set(): self.resync.set()
+          continue
+        try:
+          (readable,writable,errored) = select.select([self.fd],[],[],0.5)
+        except select.error:
+          continue
+        if len(readable) > 0:
+          try:
+            self.process_events(os.read(self.fd,64 * taco.constants.KB))
+          except OSError,e:
+            if e.errno != errno.EAGAIN: raise
+        self.flush_dirty()
+    except Exception,e:
+      #a watcher that died while watching would leave the index trusted and the listings cached forever
+      self.set_status("Share Watcher failed, share listings will be polled: " + repr(e),3)
+    finally:
+      self.stop_watching()
+    self.set_status("Share Watcher Exit")
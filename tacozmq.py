@@ -39,16 +39,20 @@ import taco.clients
 import taco.crypto
 import taco.settings
 import taco.filesystem
+import taco.downloads
 import taco.limiter
+import taco.discovery
 
 signal.signal(signal.SIGINT, taco.globals.properexit)
 
 logging.info(taco.constants.APP_NAME + " v" + str(taco.constants.APP_VERSION) + " " + taco.constants.APP_STAGE + " STARTED")
 taco.settings.Load_Settings()
 taco.crypto.Init_Local_Crypto()
+taco.downloads.Restore_Download_Queue()
 
 taco.globals.upload_limiter = taco.limiter.Speedometer()
 taco.globals.download_limiter = taco.limiter.Speedometer()
+taco.globals.cert_discovery = taco.discovery.CertDiscovery()
 
 taco.globals.server = taco.server.TacoServer()
 taco.globals.server.start()
@@ -13,6 +13,24 @@
       <div class="panel-heading"><h3 class="panel-title">Browse Peers</h3></div>
       <div class="panel-body text-center filelistingpanel">
         <div id="peercrumb" class="text-left" style="display:none"></div>
+        <div id="listingcontrols" class="text-left hide">
+          <form id="listingfilterform" class="form-inline">
+            <select id="listingsort" class="form-control input-sm">
+              <option value="name">Name</option>
+              <option value="-name">Name (Descending)</option>
+              <option value="size">Size</option>
+              <option value="-size">Size (Descending)</option>
+              <option value="mtime">Modified</option>
+              <option value="-mtime">Modified (Descending)</option>
+            </select>
+            <input id="listingfilter" type="text" class="form-control input-sm" placeholder="Filter names" maxlength="{{taco.constants.SEARCH_MAX_QUERY_LENGTH}}">
+            <div class="btn-group btn-group-sm">
+              <button id="pageprev" type="button" class="btn btn-default"><span class="glyphicon glyphicon-chevron-left"></span></button>
+              <button id="pagenext" type="button" class="btn btn-default"><span class="glyphicon glyphicon-chevron-right"></span></button>
+            </div>
+            <small id="pageinfo"></small>
+          </form>
+        </div>
         <div id="nopeers" style="display:none"><h3>{{taco.constants.APP_NAME}} sees no peers it can browse right now.</h3><h5>This page will auto refresh when they become browseable</h5></div>
         <div id="noshares" style="display:none"><h3>There are no shares visable from this peer.</h3><h5>Tell them to set some up!</h5></div>
         <div id="timedout" style="display:none"><h3>The request for this directory listing timed out.</h3><h5>You should probably return to the peer listing and try again.</h5></div>
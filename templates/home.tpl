@@ -25,7 +25,7 @@
                   <td class="middle-align-td text-center yellow-td incomingstatus"><span style="font-size:32px;" class="glyphicon glyphicon-question-sign"></span></td>
                   <td class="middle-align-td text-center yellow-td outgoingstatus"><span style="font-size:32px;" class="glyphicon glyphicon-question-sign"></span></td>
                   <td class="middle-align-td"><span class="tablenick"></span><span class="localnick"></span></td>
-                  <td class="middle-align-td"><strong>Incoming:</strong> <span class="lastincoming"></span><br><strong>Outgoing:</strong> <span class="lastoutgoing"></span></td>
+                  <td class="middle-align-td"><strong>Incoming:</strong> <span class="lastincoming"></span><br><strong>Outgoing:</strong> <span class="lastoutgoing"></span><br><strong>Connection:</strong> <span class="connectionstate"></span></td>
                 </tr>
           </tbody>
         </table>
@@ -48,6 +48,11 @@
           <ul>
             <li>Last Action: <span id="serverstatus"></span> @ <span id="serverlast"></span>
           </ul>
+        <li><b>Disk Writer:</b> <span id="writeralive">UNKNOWN</span>
+          <ul>
+            <li>Last Action: <span id="writerstatus"></span> @ <span id="writerlast"></span>
+            <li>Waiting: <span id="writerdepth"></span> writes, <span id="writerbytes"></span> bytes -- Latency: <span id="writerlatency"></span> (peak <span id="writerlatencymax"></span>)
+          </ul>
         <li><b>Webserver:</b> Running
           
       </ul>
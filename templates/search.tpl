@@ -1,30 +1,31 @@
+%import taco.constants
 %rebase templates/layout title='Search'
-<div class="row">
-  <div class="col-md-12">
-    <div class="panel panel-info">
-      <div class="panel-heading"><h3 class="panel-title">Search</h3></div>
-      <div class="panel-body">
-        <div class="alert alert-success"><strong>Searching For:</strong> TACOs</div>
-        <div class="list-group">
-          <a href="#" class="list-group-item"><span class="badge">143 Results</span>NICK1</a>
-          <a href="#" class="list-group-item"><span class="badge">Searching...</span>Nickname 2</a>
-          <a href="#" class="list-group-item"><span class="badge">14 Results</span>Nickanem 3</a>
-          <a href="#" class="list-group-item"><span class="badge">0 Results</span>Some Nick</a>
-        </div>
-
-      </div>
-    </div>
-  </div>
-</div>
 <div class="row">
   <div class="col-md-1"></div>
-  <div class="col-md-10">     
+  <div class="col-md-10">
+    <form id="searchform">
     <div class="input-group">
-    <input type="text" class="form-control">
+    <input id="searchquery" type="text" class="form-control" maxlength="{{taco.constants.SEARCH_MAX_QUERY_LENGTH}}">
     <span class="input-group-btn">
-    <button class="btn btn-default" type="button">Search <span class="glyphicon glyphicon-search"></span></button>
+    <button class="btn btn-default" type="submit">Search <span class="glyphicon glyphicon-search"></span></button>
     </span>
     </div><!-- /input-group -->
+    </form>
   </div>
   <div class="col-md-1"></div>
 </div>
+<br>
+<div class="row">
+  <div class="col-md-12">
+    <div class="panel panel-info">
+      <div class="panel-heading"><h3 class="panel-title">Search</h3></div>
+      <div class="panel-body">
+        <div id="nosearch"><h5>Enter part of a filename above to search every peer you are connected to.</h5></div>
+        <div id="nopeers" style="display:none"><h3>{{taco.constants.APP_NAME}} sees no peers it can search right now.</h3></div>
+        <div id="searchingfor" class="alert alert-success" style="display:none"><strong>Searching For:</strong> <span id="searchingforquery"></span> <small id="searchskipped"></small></div>
+        <div id="searchpeers" class="list-group"></div>
+        <div id="searchresults"></div>
+      </div>
+    </div>
+  </div>
+</div>
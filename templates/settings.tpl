@@ -205,6 +205,32 @@
       <div class="input-group"><span class="input-group-addon"><span data-trigger="hover" data-container="body" data-placement="right" data-content="This is the limit {{taco.constants.APP_NAME}} will attempt to respect when uploading content. Since ZeroMQ is a bit of socket magic, {{taco.constants.APP_NAME}} will ATTEMPT to respect this limit." class="glyphicon glyphicon-info-sign"></span><span class="iga-fixed-width">Upload Limit in KB/s</span></span>
       <input autocomplete="off" id="setting-uplimit" type="text" class="form-control" value="{{local_settings_copy["Upload Limit"]}}"></div>
 
+      <div class="alert alert-warning alert-dismissable alert-tweak hide" id="setting-perpeer-alert"><button type="button" class="close">&times;</button><strong>Warning!</strong> The number of files to download at once from each peer must be a whole number from 1 to {{taco.constants.DOWNLOAD_PER_PEER_MAX}}. <span class="glyphicon glyphicon-hand-down"></span></div>
+      <div class="input-group"><span class="input-group-addon"><span data-trigger="hover" data-container="body" data-placement="right" data-content="How many files from the top of each peer's download queue {{taco.constants.APP_NAME}} will fetch at the same time. Raising this helps a lot when downloading many small files." class="glyphicon glyphicon-info-sign"></span><span class="iga-fixed-width">Downloads Per Peer</span></span>
+      <input autocomplete="off" id="setting-perpeer" type="text" class="form-control" value="{{local_settings_copy["Downloads Per Peer"]}}"></div>
+
+      <div class="alert alert-warning alert-dismissable alert-tweak hide" id="setting-slots-alert"><button type="button" class="close">&times;</button><strong>Warning!</strong> The number of files to download at once must be a whole number from 1 to {{taco.constants.DOWNLOAD_SLOTS_MAX}}. <span class="glyphicon glyphicon-hand-down"></span></div>
+      <div class="input-group"><span class="input-group-addon"><span data-trigger="hover" data-container="body" data-placement="right" data-content="How many files {{taco.constants.APP_NAME}} will download at the same time, counting every peer together." class="glyphicon glyphicon-info-sign"></span><span class="iga-fixed-width">Download Slots</span></span>
+      <input autocomplete="off" id="setting-slots" type="text" class="form-control" value="{{local_settings_copy["Download Slots"]}}"></div>
+
+      <div class="input-group"><span class="input-group-addon"><span data-trigger="hover" data-container="body" data-placement="right" data-content="Which queued files get the download slots. First Queued follows the order of your download queue, Smallest First finishes the most files soonest, Fair Share gives every peer an equal number of slots. Higher priority files always go first." class="glyphicon glyphicon-info-sign"></span><span class="iga-fixed-width">Download Policy</span></span>
+      <select id="setting-policy" class="form-control">
+        %for (policy,label) in [("fifo","First Queued"),("smallest","Smallest First"),("fair","Fair Share")]:
+        <option value="{{policy}}" {{"selected" if local_settings_copy["Download Policy"] == policy else ""}}>{{label}}</option>
+        %end
+      </select></div>
+
+      <div class="input-group"><span class="input-group-addon"><span data-trigger="hover" data-container="body" data-placement="right" data-content="How hard {{taco.constants.APP_NAME}} works to get downloaded data onto the disk before moving on. Flush Only leaves it to the operating system and is the fastest, Sync On Completion makes sure each file is on disk before it is marked complete, Sync Every N MB also syncs partial downloads so less is lost in a power failure." class="glyphicon glyphicon-info-sign"></span><span class="iga-fixed-width">Download Durability</span></span>
+      <select id="setting-durability" class="form-control">
+        %for (durability,label) in [("flush","Flush Only"),("completion","Sync On Completion"),("interval","Sync Every N MB")]:
+        <option value="{{durability}}" {{"selected" if local_settings_copy["Download Durability"] == durability else ""}}>{{label}}</option>
+        %end
+      </select></div>
+
+      <div class="alert alert-warning alert-dismissable alert-tweak hide" id="setting-syncmb-alert"><button type="button" class="close">&times;</button><strong>Warning!</strong> The sync interval must be a whole number of MB from 1 to {{taco.constants.DOWNLOAD_SYNC_MB_MAX}}. <span class="glyphicon glyphicon-hand-down"></span></div>
+      <div class="input-group"><span class="input-group-addon"><span data-trigger="hover" data-container="body" data-placement="right" data-content="With Sync Every N MB, how many MB of each download are written between syncs." class="glyphicon glyphicon-info-sign"></span><span class="iga-fixed-width">Download Sync MB</span></span>
+      <input autocomplete="off" id="setting-syncmb" type="text" class="form-control" value="{{local_settings_copy["Download Sync MB"]}}"></div>
+
       <div class="input-group"><span class="input-group-addon"><span data-trigger="hover" data-container="body" data-placement="right" data-content="The location your want to store your public and private certificates for use with your personal {{taco.constants.APP_NAME}} instance. If you are unaware of publickey cryptography concepts, it's best to just leave this the default." class="glyphicon glyphicon-info-sign"></span><span class="iga-fixed-width">Certificate Store</span></span>
       <input autocomplete="off" id="setting-certlocation" readonly="readonly" type="text" class="form-control" value="{{os.path.normpath(os.path.abspath(local_settings_copy["TacoNET Certificates Store"]))}}"><span class="input-group-btn"><button id="browsecert" class="btn btn-default" type="button"><span class="glyphicon glyphicon-folder-open"></span>&nbsp Browse</button></span></div>
 